@@ -0,0 +1,243 @@
+"""
+AI回复缓存
+不同员工几分钟内经常问同样的问题（“今天日报”“本月月报”），每次都调用AI服务生成回复既慢又耗费额度。
+按 规范化后的消息 + 意图 + 角色 + 相关数据版本 缓存生成的回复，带LRU淘汰和TTL过期；
+数据版本来自意图对应日期范围的数据指纹（date_versions表）或users表版本号，数据变化后旧回复自然失效。
+
+相同问题并发到达时只调用一次AI服务（singleflight）：第一个请求负责生成，
+其余请求跟随它的输出（流式接口逐段跟随），生成失败时各自重试。
+只缓存AI服务成功生成的完整回复，默认回复和中断的回复不缓存。
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional
+import re
+import threading
+import time
+import unicodedata
+from dateutil import parser
+from config import Config
+from models import DateVersion, TableVersion
+from ai_providers import ProviderUnavailable
+import reports
+
+# 跟随者等待生成结果的最长时间（秒），超过后不再等待，自行调用AI服务
+FOLLOW_TIMEOUT = 120
+
+# 不影响问题含义的空白和句末标点
+_NOISE = re.compile(r'[\s，,。.！!？?~～…、;；:：]+')
+
+def normalize_message(text: str) -> str:
+    """规范化用户消息：全角转半角、统一小写、去掉空白和标点"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    return _NOISE.sub('', text)
+
+def response_data_version(intent: str, parameters: Dict[str, Any]) -> Optional[tuple]:
+    """回复涉及的数据版本；返回None表示该意图的回复不应缓存（写操作等）
+
+    日期范围与 routes.ai.execute_api_call 中各意图的默认范围一致。
+    """
+    today = datetime.now().date()
+    if intent == 'chat':
+        return ()
+    if intent == 'employee_list':
+        return ('users', TableVersion.current('users'))
+
+    if intent in ('daily_report', 'query_transactions'):
+        if 'date' in parameters:
+            start_date = end_date = parser.parse(parameters['date']).date()
+        elif intent == 'daily_report':
+            start_date = end_date = today
+        else:
+            start_date = end_date = None
+    elif intent == 'weekly_report':
+        start_date, end_date = reports.week_range(*today.isocalendar()[:2])
+    elif intent == 'monthly_report':
+        start_date, end_date = reports.month_range(today.year, today.month)
+    elif intent == 'yearly_report':
+        start_date, end_date = reports.year_range(today.year)
+    elif intent == 'management_report':
+        start_date, end_date = reports.default_management_range()
+        start_date = reports.previous_period_start(start_date, end_date)
+    else:
+        return None
+
+    return (
+        start_date.isoformat() if start_date else None,
+        end_date.isoformat() if end_date else None,
+        DateVersion.range_fingerprint(start_date, end_date)
+    )
+
+class _Flight:
+    """正在生成中的一次回复，跟随者通过它读取已生成的内容"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.failed = False
+        self._cond = threading.Condition()
+
+    def append(self, text: str):
+        with self._cond:
+            self.chunks.append(text)
+            self._cond.notify_all()
+
+    def finish(self, failed: bool = False):
+        with self._cond:
+            self.done = True
+            self.failed = failed
+            self._cond.notify_all()
+
+    def follow(self) -> Iterator[str]:
+        """逐段返回生成的内容，直到生成结束；生成失败时抛出 ProviderUnavailable"""
+        index = 0
+        deadline = time.monotonic() + FOLLOW_TIMEOUT
+        while True:
+            with self._cond:
+                while index >= len(self.chunks) and not self.done:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._cond.wait(remaining):
+                        raise ProviderUnavailable('cache', '等待相同问题的回复超时')
+                chunks = self.chunks[index:]
+                done, failed = self.done, self.failed
+            index += len(chunks)
+            yield from chunks
+            if done:
+                if failed:
+                    raise ProviderUnavailable('cache', '相同问题的回复生成失败')
+                return
+
+class ResponseCache:
+    """带LRU淘汰、TTL过期和并发合并的AI回复缓存"""
+
+    def __init__(self, max_entries: int = 512, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (过期时间, 回复)
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def _lookup(self, key: Hashable):
+        """返回 (缓存的回复, 正在进行的生成, 是否由当前调用方负责生成)，调用时需持有锁"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], None, False
+            del self._entries[key]
+
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.shared += 1
+            return None, flight, False
+
+        self.misses += 1
+        flight = self._flights[key] = _Flight()
+        return None, flight, True
+
+    def _store(self, key: Hashable, value: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stream(self, key: Optional[Hashable], produce: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """逐段返回回复：命中缓存时一次返回整段回复，否则由 produce 生成（或跟随正在进行的相同生成）
+
+        key 为None表示不缓存。produce 抛出的异常原样抛给调用方，失败的回复不缓存。
+        """
+        if key is None or not self.enabled:
+            yield from produce()
+            return
+
+        with self._lock:
+            cached, flight, leader = self._lookup(key)
+        if cached is not None:
+            yield cached
+            return
+
+        if not leader:
+            started = False
+            try:
+                for text in flight.follow():
+                    started = True
+                    yield text
+                return
+            except ProviderUnavailable:
+                if started:
+                    raise
+            # 负责生成的请求失败且尚未输出内容，自行调用AI服务（不再合并）
+            yield from produce()
+            return
+
+        chunks = []
+        failed = True
+        try:
+            for text in produce():
+                chunks.append(text)
+                flight.append(text)
+                yield text
+            failed = False
+        finally:
+            # 生成失败或客户端提前断开（GeneratorExit）时不缓存
+            if not failed:
+                self._store(key, ''.join(chunks))
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.finish(failed)
+
+    def get_or_compute(self, key: Optional[Hashable], compute: Callable[[], str]) -> str:
+        """返回缓存的回复，不存在时由 compute 生成（并发的相同请求共享一次生成）"""
+        return ''.join(self.stream(key, lambda: iter([compute()])))
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率等统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses + self.shared
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'shared': self.shared,
+                'in_flight': len(self._flights),
+                'evictions': self.evictions,
+                'hit_rate': round((self.hits + self.shared) / lookups, 4) if lookups else 0.0
+            }
+
+# 全局回复缓存实例（每个进程一个）
+response_cache = ResponseCache(
+    max_entries=Config.AI_CACHE_MAX_ENTRIES,
+    ttl=Config.AI_CACHE_TTL
+)
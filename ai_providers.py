@@ -0,0 +1,503 @@
+"""
+AI服务提供方
+Deep Seek、通义千问（均为OpenAI兼容接口）和本地模拟服务的客户端，以及在多个服务之间分配请求的路由器。
+
+调用失败时抛出 AIProviderError 的子类（未配置、超时、服务不可用、响应异常），不再通过返回文本判断。
+路由器支持三种方式（AI_ROUTING）：
+- fallback：按顺序调用，前一个失败后才调用下一个
+- race：同时调用全部服务，取最先成功的结果
+- hedge（默认）：先调用第一个服务，超过其近期延迟的P90（样本不足时为AI_HEDGE_DELAY）仍未返回，
+  或者已经失败时，再调用下一个服务，取最先成功的结果
+每个服务带熔断器（ProviderHealth）：失败率过高时暂停调用，之后只放行一次探测；
+调用顺序按健康度自动调整，状态可通过 /api/ai/health 查看。
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterator, List, Optional
+import threading
+import time
+import numpy as np
+import openai
+from openai import OpenAI
+from config import Config
+
+class AIProviderError(Exception):
+    """AI服务调用失败"""
+
+    def __init__(self, provider: str, message: str):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+
+class ProviderNotConfigured(AIProviderError):
+    """未配置API密钥或客户端初始化失败"""
+
+class ProviderTimeout(AIProviderError):
+    """调用超时"""
+
+class ProviderUnavailable(AIProviderError):
+    """连接失败、限流或服务端错误（稍后重试可能成功）"""
+
+class ProviderResponseError(AIProviderError):
+    """请求被拒绝或返回内容异常"""
+
+class OpenAICompatibleProvider:
+    """OpenAI兼容接口的客户端"""
+
+    name = 'openai'
+    display_name = 'OpenAI'
+
+    def __init__(self, api_key: str, api_base: str, model: str, timeout: float):
+        self.api_key = api_key
+        self.api_base = api_base
+        self.model = model
+        self.timeout = timeout
+        self.client = None
+        if self.api_key:
+            try:
+                # 超时由本模块控制，不使用SDK的自动重试（重试会让一次失败的调用耗时翻倍）
+                self.client = OpenAI(
+                    api_key=self.api_key,
+                    base_url=self.api_base,
+                    timeout=timeout,
+                    max_retries=0
+                )
+            except Exception as e:
+                print(f"{self.display_name} API客户端初始化失败: {e}")
+                self.client = None
+
+    @property
+    def available(self) -> bool:
+        return self.client is not None
+
+    def _check_client(self):
+        if not self.api_key:
+            raise ProviderNotConfigured(self.name, f"{self.display_name} API密钥未配置")
+        if not self.client:
+            raise ProviderNotConfigured(self.name, f"{self.display_name} API客户端初始化失败")
+
+    def _translate_error(self, error: Exception) -> AIProviderError:
+        """把SDK异常转换为AIProviderError"""
+        message = f"{self.display_name} API调用失败: {error}"
+        if isinstance(error, openai.APITimeoutError):
+            return ProviderTimeout(self.name, message)
+        if isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+            return ProviderUnavailable(self.name, message)
+        return ProviderResponseError(self.name, message)
+
+    def chat(self, messages: List[Dict], temperature: float = 0.7) -> str:
+        """调用API，返回生成的文本"""
+        self._check_client()
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                stream=False
+            )
+        except Exception as e:
+            raise self._translate_error(e) from e
+
+        content = response.choices[0].message.content if response.choices else None
+        if not content:
+            raise ProviderResponseError(self.name, f"{self.display_name} API返回内容为空")
+        return content
+
+    def chat_stream(self, messages: List[Dict], temperature: float = 0.7) -> Iterator[str]:
+        """流式调用API，逐段返回生成的文本"""
+        self._check_client()
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                stream=True
+            )
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            raise self._translate_error(e) from e
+
+class DeepSeekAPI(OpenAICompatibleProvider):
+    """Deep Seek API客户端"""
+
+    name = 'deepseek'
+    display_name = 'Deep Seek'
+
+    def __init__(self, api_key: str = None, api_base: str = None, timeout: float = None):
+        super().__init__(
+            api_key or Config.DEEPSEEK_API_KEY,
+            api_base or Config.DEEPSEEK_API_BASE,
+            "deepseek-chat",
+            timeout or Config.DEEPSEEK_TIMEOUT
+        )
+
+class QianwenAPI(OpenAICompatibleProvider):
+    """通义千问API客户端（使用OpenAI兼容模式）"""
+
+    name = 'qianwen'
+    display_name = '通义千问'
+
+    def __init__(self, api_key: str = None, api_base: str = None, timeout: float = None):
+        super().__init__(
+            api_key or Config.QIANWEN_API_KEY,
+            api_base or Config.QIANWEN_API_BASE,
+            "qwen3-omni-flash",  # 使用用户指定的模型
+            timeout or Config.QIANWEN_TIMEOUT
+        )
+
+class FakeProvider:
+    """本地模拟服务（测试和离线开发用，不访问网络）
+
+    reply: 固定回复，为None时复述用户的最后一条消息
+    latency: 模拟的响应时间（秒），超过timeout时抛出ProviderTimeout
+    error: 设置后每次调用都抛出该异常
+    """
+
+    display_name = '模拟服务'
+    available = True
+
+    def __init__(self, name: str = 'fake', reply: Optional[str] = None, latency: float = 0.0,
+                 timeout: float = 30, error: Optional[AIProviderError] = None):
+        self.name = name
+        self.reply = reply
+        self.latency = latency
+        self.timeout = timeout
+        self.error = error
+        self.calls = 0
+
+    def _respond(self, messages: List[Dict]) -> str:
+        self.calls += 1
+        time.sleep(min(self.latency, self.timeout))
+        if self.latency > self.timeout:
+            raise ProviderTimeout(self.name, f"{self.display_name}调用超时")
+        if self.error is not None:
+            raise self.error
+        if self.reply is not None:
+            return self.reply
+        return f"（模拟回复）{messages[-1]['content'] if messages else ''}"
+
+    def chat(self, messages: List[Dict], temperature: float = 0.7) -> str:
+        return self._respond(messages)
+
+    def chat_stream(self, messages: List[Dict], temperature: float = 0.7) -> Iterator[str]:
+        text = self._respond(messages)
+        for start in range(0, len(text), 8):
+            yield text[start:start + 8]
+
+class ProviderHealth:
+    """单个AI服务的健康状态和熔断器
+
+    最近 window 秒内的调用次数达到 min_calls 且失败率达到 error_threshold 时熔断（open），
+    熔断期间不再调用该服务；open_seconds 秒后进入半开（half_open），只放行一次探测调用，
+    探测成功则恢复（closed），失败则重新熔断；探测被放弃（release_probe）或超过 probe_timeout 秒
+    仍无结果时重新放行一次探测。
+    另外记录最近 latency_samples 次成功调用的耗时，用于P50/P95统计和对冲延迟。
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, window: float = 60, min_calls: int = 5, error_threshold: float = 0.5,
+                 open_seconds: float = 30, latency_samples: int = 200, probe_timeout: float = 60):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_threshold = error_threshold
+        self.open_seconds = open_seconds
+        self.probe_timeout = probe_timeout
+        self.state = self.CLOSED
+        self.opened_at = None
+        self.open_count = 0
+        self._outcomes = deque()  # (时间, 是否成功)
+        self._latencies = deque(maxlen=latency_samples)
+        self._probing = False
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+
+    def _error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for _, ok in self._outcomes if not ok) / len(self._outcomes)
+
+    def allow_request(self) -> bool:
+        """是否可以调用该服务（半开状态下只放行一次探测）"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self.opened_at >= self.open_seconds:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and (not self._probing or now - self._probe_started >= self.probe_timeout):
+                self._probing = True
+                self._probe_started = now
+                return True
+            return False
+
+    def release_probe(self):
+        """调用被放弃、没有成功或失败的结果时（如客户端在收到第一段内容前断开）释放半开状态的探测名额"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self, latency: Optional[float] = None):
+        with self._lock:
+            now = time.monotonic()
+            if self.state != self.CLOSED:
+                # 探测成功，恢复并重新开始统计
+                self.state = self.CLOSED
+                self._outcomes.clear()
+            self._outcomes.append((now, True))
+            self._prune(now)
+            if latency is not None:
+                self._latencies.append(latency)
+
+    def record_failure(self):
+        with self._lock:
+            now = time.monotonic()
+            self._outcomes.append((now, False))
+            self._prune(now)
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED
+                and len(self._outcomes) >= self.min_calls
+                and self._error_rate() >= self.error_threshold
+            ):
+                self.state = self.OPEN
+                self.opened_at = now
+                self.open_count += 1
+
+    def latency_percentile(self, percentile: float, min_samples: int = 1) -> Optional[float]:
+        """最近成功调用耗时的百分位数，样本不足时返回None"""
+        with self._lock:
+            samples = list(self._latencies)
+        if len(samples) < min_samples:
+            return None
+        return float(np.percentile(samples, percentile))
+
+    def preference_key(self, min_samples: int) -> tuple:
+        """排序用的健康度（越小越优先）：熔断状态、失败率、P95耗时（样本不足时不参与比较）"""
+        with self._lock:
+            self._prune(time.monotonic())
+            error_rate = self._error_rate()
+        state_rank = {self.CLOSED: 0, self.HALF_OPEN: 1, self.OPEN: 2}[self.state]
+        return state_rank, round(error_rate, 1), self.latency_percentile(95, min_samples) or 0.0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            calls = len(self._outcomes)
+            errors = sum(1 for _, ok in self._outcomes if not ok)
+            state = self.state
+            retry_in = (
+                max(0.0, self.open_seconds - (now - self.opened_at)) if state == self.OPEN else None
+            )
+        p50 = self.latency_percentile(50)
+        p95 = self.latency_percentile(95)
+        return {
+            'name': self.name,
+            'state': state,
+            'window_seconds': self.window,
+            'calls': calls,
+            'errors': errors,
+            'error_rate': round(errors / calls, 4) if calls else 0.0,
+            'latency_p50': round(p50, 3) if p50 is not None else None,
+            'latency_p95': round(p95, 3) if p95 is not None else None,
+            'open_count': self.open_count,
+            'retry_in_seconds': round(retry_in, 1) if retry_in is not None else None
+        }
+
+class ProviderRouter:
+    """在多个AI服务之间分配请求（方式见模块说明）
+
+    providers的顺序为默认优先顺序；运行中按健康度（熔断状态、失败率、P95耗时）自动调整，
+    熔断中的服务不会被调用，服务故障时每个熔断周期只消耗一次探测调用。
+    """
+
+    # 延迟参与计算（对冲延迟、优先顺序）需要的最少样本数
+    MIN_LATENCY_SAMPLES = 20
+
+    def __init__(self, providers: list, mode: str = 'hedge', hedge_delay: float = 2.0,
+                 hedge_percentile: float = 90, max_workers: int = 16, breaker_options: Optional[Dict] = None):
+        if mode not in ('fallback', 'race', 'hedge'):
+            raise ValueError(f'不支持的AI路由方式: {mode}')
+        self.providers = providers
+        self.mode = mode
+        self.hedge_delay = hedge_delay
+        self.hedge_percentile = hedge_percentile
+        self.health = {provider.name: ProviderHealth(provider.name, **(breaker_options or {})) for provider in providers}
+        # 落选的调用无法中途取消，会在后台执行到结束（受各服务的超时限制）
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ai-provider')
+
+    @classmethod
+    def from_config(cls) -> 'ProviderRouter':
+        """按配置创建路由器（AI_PROVIDERS为服务名列表，fake表示本地模拟服务）"""
+        factories = {'deepseek': DeepSeekAPI, 'qianwen': QianwenAPI, 'fake': FakeProvider}
+        providers = []
+        for name in Config.AI_PROVIDERS:
+            if name not in factories:
+                raise ValueError(f'未知的AI服务: {name}')
+            providers.append(factories[name]())
+        return cls(
+            providers,
+            mode=Config.AI_ROUTING,
+            hedge_delay=Config.AI_HEDGE_DELAY,
+            hedge_percentile=Config.AI_HEDGE_PERCENTILE,
+            breaker_options={
+                'window': Config.AI_BREAKER_WINDOW,
+                'min_calls': Config.AI_BREAKER_MIN_CALLS,
+                'error_threshold': Config.AI_BREAKER_ERROR_RATE,
+                'open_seconds': Config.AI_BREAKER_OPEN_SECONDS
+            }
+        )
+
+    def _candidates(self) -> list:
+        """可用的服务（跳过未配置的），按健康度排序；都未配置时抛出ProviderNotConfigured"""
+        candidates = [provider for provider in self.providers if provider.available]
+        if not candidates:
+            raise ProviderNotConfigured('router', 'AI服务均未配置')
+        # sorted是稳定排序，健康度相同时保持配置的顺序
+        return sorted(candidates, key=lambda provider: self.health[provider.name].preference_key(self.MIN_LATENCY_SAMPLES))
+
+    def _next_allowed(self, waiting: list):
+        """从等待列表中取出下一个熔断器放行的服务，没有时返回None"""
+        while waiting:
+            provider = waiting.pop(0)
+            if self.health[provider.name].allow_request():
+                return provider
+        return None
+
+    def hedge_delay_for(self, provider) -> float:
+        """调用该服务后等待多久再调用下一个服务"""
+        delay = self.health[provider.name].latency_percentile(self.hedge_percentile, self.MIN_LATENCY_SAMPLES)
+        return self.hedge_delay if delay is None else delay
+
+    def _call(self, provider, messages: List[Dict], temperature: float) -> str:
+        health = self.health[provider.name]
+        started = time.monotonic()
+        try:
+            text = provider.chat(messages, temperature)
+        except Exception:
+            health.record_failure()
+            raise
+        health.record_success(time.monotonic() - started)
+        return text
+
+    def chat(self, messages: List[Dict], temperature: float = 0.7) -> str:
+        """返回最先成功的服务生成的文本；全部失败时抛出最后一个错误"""
+        waiting = self._candidates()
+        running = {}
+        errors = []
+
+        def launch() -> bool:
+            provider = self._next_allowed(waiting)
+            if provider is None:
+                return False
+            running[self._executor.submit(self._call, provider, messages, temperature)] = provider
+            return True
+
+        launch()
+        if self.mode == 'race':
+            while launch():
+                pass
+
+        while running:
+            delay = None
+            if waiting and self.mode == 'hedge':
+                delay = self.hedge_delay_for(next(iter(running.values())))
+            done, _ = wait(running, timeout=delay, return_when=FIRST_COMPLETED)
+            if not done:
+                # 当前服务比平时慢，对冲调用下一个服务
+                launch()
+                continue
+
+            for future in done:
+                running.pop(future)
+                try:
+                    return future.result()
+                except AIProviderError as e:
+                    errors.append(e)
+            if waiting:
+                launch()
+
+        if errors:
+            raise errors[-1]
+        raise ProviderUnavailable('router', 'AI服务均处于熔断状态，请稍后重试')
+
+    def chat_stream(self, messages: List[Dict], temperature: float = 0.7) -> Iterator[str]:
+        """流式返回生成的文本
+
+        流式回复无法合并多个服务的输出，按优先顺序逐个尝试：还没有输出内容就失败时改用下一个服务，
+        已经输出部分内容后失败则抛出错误。收到第一段内容即记为调用成功（不计入耗时统计），
+        之后中途失败再记一次失败；调用没有结果就结束（如客户端断开）时释放半开状态的探测名额。
+        """
+        error = None
+        waiting = self._candidates()
+        while True:
+            provider = self._next_allowed(waiting)
+            if provider is None:
+                break
+            health = self.health[provider.name]
+            started = False
+            recorded = False
+            try:
+                for text in provider.chat_stream(messages, temperature):
+                    if not started:
+                        started = True
+                        health.record_success()
+                        recorded = True
+                    yield text
+                if not started:
+                    health.record_success()
+                    recorded = True
+                return
+            except AIProviderError as e:
+                health.record_failure()
+                recorded = True
+                if started:
+                    raise
+                print(f"{provider.display_name}流式调用失败，尝试下一个服务: {e}")
+                error = e
+            except Exception:
+                health.record_failure()
+                recorded = True
+                raise
+            finally:
+                if not recorded:
+                    health.release_probe()
+        raise error or ProviderUnavailable('router', 'AI服务均处于熔断状态，请稍后重试')
+
+    def stats(self) -> Dict:
+        """各服务的健康状态（按当前优先顺序排列）"""
+        providers = [provider for provider in self.providers if provider.available]
+        order = sorted(providers, key=lambda provider: self.health[provider.name].preference_key(self.MIN_LATENCY_SAMPLES))
+        return {
+            'mode': self.mode,
+            'providers': [
+                {
+                    **self.health[provider.name].stats(),
+                    'hedge_delay': round(self.hedge_delay_for(provider), 3)
+                }
+                for provider in order
+            ],
+            'unconfigured': [provider.name for provider in self.providers if not provider.available]
+        }
@@ -20,7 +20,7 @@ limitations under the License.
 import os
 import json
 import re
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, Iterator, List, Any, Optional, Tuple
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 try:
@@ -58,7 +58,8 @@ except ImportError:
             current_node = self.entry_point
             while current_node and current_node != END:
                 if current_node in self.nodes:
-                    state = self.nodes[current_node](state)
+                    # 与LangGraph一致：节点返回的字段合并进状态，而不是替换整个状态
+                    state = {**state, **self.nodes[current_node](state)}
                     # 查找下一个节点
                     next_node = None
                     for from_node, to_node in self.edges:
@@ -69,8 +70,10 @@ except ImportError:
                 else:
                     break
             return state
-from config import Config
-from openai import OpenAI
+# 客户端类已移至 ai_providers，保留导入以兼容原有引用
+from ai_providers import AIProviderError, DeepSeekAPI, QianwenAPI, ProviderRouter  # noqa: F401
+from ai_cache import response_cache, normalize_message, response_data_version
+from intent_classifier import IntentClassifier
 
 class AIWorkflowState:
     """AI工作流状态"""
@@ -80,98 +83,34 @@ class AIWorkflowState:
         self.parameters = {}
         self.result = None
 
-class DeepSeekAPI:
-    """Deep Seek API客户端"""
-    
-    def __init__(self, api_key: str = None, api_base: str = None):
-        self.api_key = api_key or Config.DEEPSEEK_API_KEY
-        self.api_base = api_base or Config.DEEPSEEK_API_BASE
-        self.model = "deepseek-chat"
-        self.client = None
-        if self.api_key:
-            try:
-                self.client = OpenAI(
-                    api_key=self.api_key,
-                    base_url=self.api_base
-                )
-            except Exception as e:
-                print(f"Deep Seek API客户端初始化失败: {e}")
-                self.client = None
-    
-    def chat(self, messages: List[Dict], temperature: float = 0.7) -> str:
-        """调用Deep Seek API"""
-        if not self.api_key:
-            return "Deep Seek API密钥未配置"
-        
-        if not self.client:
-            return "Deep Seek API客户端初始化失败"
-        
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature,
-                stream=False
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            return f"Deep Seek API调用失败: {str(e)}"
-
-class QianwenAPI:
-    """通义千问API客户端（使用OpenAI兼容模式）"""
-    
-    def __init__(self, api_key: str = None, api_base: str = None):
-        self.api_key = api_key or Config.QIANWEN_API_KEY
-        self.api_base = api_base or Config.QIANWEN_API_BASE
-        self.model = "qwen3-omni-flash"  # 使用用户指定的模型
-        self.client = None
-        if self.api_key:
-            try:
-                self.client = OpenAI(
-                    api_key=self.api_key,
-                    base_url=self.api_base
-                )
-            except Exception as e:
-                print(f"通义千问API客户端初始化失败: {e}")
-                self.client = None
-    
-    def chat(self, messages: List[Dict], temperature: float = 0.7) -> str:
-        """调用通义千问API（使用OpenAI兼容模式）"""
-        if not self.api_key:
-            return "通义千问API密钥未配置"
-        
-        if not self.client:
-            return "通义千问API客户端初始化失败"
-        
-        try:
-            # 使用OpenAI兼容模式调用
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            return f"通义千问API调用失败: {str(e)}"
-
 class FlowMasterAIWorkflow:
     """FlowMaster AI工作流"""
     
     def __init__(self):
-        self.deepseek = DeepSeekAPI()
-        self.qianwen = QianwenAPI()
+        self.router = ProviderRouter.from_config()
+        self.response_cache = response_cache
+        self.classifier = IntentClassifier()
         self.workflow = None
         self._build_workflow()
     
     def _build_workflow(self):
-        """构建工作流图"""
+        """构建工作流图
+        
+        workflow 包含生成回复的完整流程；prepare_workflow 不含生成回复的节点，
+        流式接口先用它完成意图识别和参数提取，再单独流式生成回复。
+        """
+        self.workflow = self._compile_workflow(include_response=True)
+        self.prepare_workflow = self._compile_workflow(include_response=False)
+    
+    def _compile_workflow(self, include_response: bool):
         workflow = StateGraph(dict)
         
         # 添加节点
         workflow.add_node("intent_classifier", self._classify_intent)
         workflow.add_node("parameter_extractor", self._extract_parameters)
         workflow.add_node("function_executor", self._execute_function)
-        workflow.add_node("response_generator", self._generate_response)
+        if include_response:
+            workflow.add_node("response_generator", self._generate_response)
         
         # 设置入口
         workflow.set_entry_point("intent_classifier")
@@ -179,10 +118,13 @@ class FlowMasterAIWorkflow:
         # 添加边
         workflow.add_edge("intent_classifier", "parameter_extractor")
         workflow.add_edge("parameter_extractor", "function_executor")
-        workflow.add_edge("function_executor", "response_generator")
-        workflow.add_edge("response_generator", END)
+        if include_response:
+            workflow.add_edge("function_executor", "response_generator")
+            workflow.add_edge("response_generator", END)
+        else:
+            workflow.add_edge("function_executor", END)
         
-        self.workflow = workflow.compile()
+        return workflow.compile()
     
     def _sanitize_input(self, text: str) -> str:
         """输入清理和验证，防止SQL注入和话术注入"""
@@ -200,34 +142,12 @@ class FlowMasterAIWorkflow:
         return text.strip()
     
     def _check_permission_bypass(self, message: str, user_role: str = None) -> Tuple[bool, str]:
-        """检查权限绕过尝试"""
+        """检查权限绕过尝试（规则见 intent_classifier.py）"""
         if not user_role:
             return True, ""
         
-        # 检测试图提升权限的话术
-        bypass_patterns = [
-            r'以.*?身份|作为.*?管理员|使用.*?权限|提升.*?权限|切换.*?角色',
-            r'manager|admin|管理员|店长',
-            r'绕过|跳过|忽略.*?检查|权限.*?提升'
-        ]
-        
-        message_lower = message.lower()
-        for pattern in bypass_patterns:
-            if re.search(pattern, message_lower):
-                return False, "检测到可疑的权限绕过尝试，操作已被拒绝。"
-        
-        # 检查是否试图访问受限功能
-        restricted_keywords = {
-            'worker': ['周报', '月报', '年报', '管理报表', '员工管理', '删除', '修改他人'],
-            'staff': ['周报', '月报', '年报', '管理报表', '员工管理', '删除', '修改他人']
-        }
-        
-        if user_role in restricted_keywords:
-            for keyword in restricted_keywords[user_role]:
-                if keyword in message:
-                    return False, f"您的角色({user_role})无权访问此功能。"
-        
-        return True, ""
+        result = self.classifier.classify(message, user_role)
+        return result.error is None, result.error or ""
     
     def _classify_intent(self, state: Dict) -> Dict:
         """意图分类（带安全验证）"""
@@ -242,39 +162,16 @@ class FlowMasterAIWorkflow:
         # 输入清理
         last_message = self._sanitize_input(last_message)
         
-        # 权限绕过检查
-        if user_role:
-            allowed, error_msg = self._check_permission_bypass(last_message, user_role)
-            if not allowed:
-                return {
-                    'intent': 'security_blocked',
-                    'messages': messages,
-                    'error': error_msg
-                }
-        
-        # 简单的意图分类规则（可以改进为使用AI）
-        intent = 'unknown'
-        
-        if any(keyword in last_message for keyword in ['录入', '添加', '创建', '新增']):
-            intent = 'create_transaction'
-        elif any(keyword in last_message for keyword in ['查询', '查看', '显示', '列表']):
-            intent = 'query_transactions'
-        elif any(keyword in last_message for keyword in ['日报', '每日', '今天']):
-            intent = 'daily_report'
-        elif any(keyword in last_message for keyword in ['周报', '每周', '本周']):
-            intent = 'weekly_report'
-        elif any(keyword in last_message for keyword in ['月报', '每月', '本月']):
-            intent = 'monthly_report'
-        elif any(keyword in last_message for keyword in ['年报', '每年', '今年']):
-            intent = 'yearly_report'
-        elif any(keyword in last_message for keyword in ['管理', '综合', '指标']):
-            intent = 'management_report'
-        elif any(keyword in last_message for keyword in ['员工', '人员']):
-            intent = 'employee_list'
-        else:
-            intent = 'chat'
+        # 一次扫描同时完成权限绕过检查和意图识别（关键词规则，可以改进为使用AI）
+        result = self.classifier.classify(last_message, user_role)
+        if result.error:
+            return {
+                'intent': 'security_blocked',
+                'messages': messages,
+                'error': result.error
+            }
         
-        return {'intent': intent, 'messages': messages}
+        return {'intent': result.intent, 'messages': messages}
     
     def _validate_parameter(self, param_name: str, param_value: Any) -> Tuple[bool, Any]:
         """参数验证和清理，防止注入攻击"""
@@ -405,10 +302,8 @@ class FlowMasterAIWorkflow:
         
         return {'result': result, 'intent': intent, 'parameters': parameters, 'messages': messages}
     
-    def _generate_response(self, state: Dict) -> Dict:
-        """生成响应"""
-        intent = state.get('intent', 'unknown')
-        result = state.get('result', {})
+    def _response_messages(self, state: Dict) -> List[Dict]:
+        """生成回复时发送给AI服务的消息"""
         messages = state.get('messages', [])
         
         # 使用AI生成自然语言响应
@@ -422,28 +317,82 @@ class FlowMasterAIWorkflow:
 请用自然、友好的语言回复用户。"""
         
         user_message = messages[-1]['content'] if messages else ""
-        ai_response = result.get('message', '')
         
-        # 构建消息
-        chat_messages = [
+        return [
             {'role': 'system', 'content': system_prompt},
             {'role': 'user', 'content': user_message}
         ]
+    
+    def _response_cache_key(self, state: Dict, chat_messages: List[Dict]) -> Optional[tuple]:
+        """回复缓存的键：规范化后的消息 + 意图 + 角色 + 相关数据版本；返回None表示不缓存
         
-        # 优先使用Deep Seek，如果失败则使用通义千问
-        response_text = self.deepseek.chat(chat_messages)
-        if "API调用失败" in response_text or "未配置" in response_text:
-            response_text = self.qianwen.chat(chat_messages)
+        回复只由发给AI服务的消息决定（见 _response_messages），与对话历史和具体用户无关。
+        """
+        message = normalize_message(chat_messages[-1]['content'])
+        if not message:
+            return None
+        try:
+            version = response_data_version(state.get('intent', 'unknown'), state.get('parameters', {}))
+        except Exception as e:
+            print(f"读取回复缓存数据版本失败: {e}")
+            return None
+        if version is None:
+            return None
+        return (message, state.get('intent'), state.get('user_role'), version)
+    
+    def _fallback_response(self, state: Dict) -> str:
+        """AI服务都不可用时的默认回复"""
+        ai_response = (state.get('result') or {}).get('message', '')
+        return f"{ai_response}\n\n如需更多帮助，请告诉我具体需求。"
+    
+    def _generate_response(self, state: Dict) -> Dict:
+        """生成响应"""
+        messages = state.get('messages', [])
+        chat_messages = self._response_messages(state)
         
-        # 如果两个都失败，使用默认响应
-        if "API调用失败" in response_text or "未配置" in response_text:
-            response_text = f"{ai_response}\n\n如需更多帮助，请告诉我具体需求。"
+        # 由路由器在Deep Seek和通义千问之间选择（见 ai_providers.py），都失败时使用默认响应；
+        # 相同问题的回复优先从缓存读取（见 ai_cache.py）
+        key = self._response_cache_key(state, chat_messages)
+        try:
+            response_text = self.response_cache.get_or_compute(key, lambda: self.router.chat(chat_messages))
+        except AIProviderError as e:
+            print(f"生成回复失败: {e}")
+            response_text = self._fallback_response(state)
         
         # 添加AI响应到消息历史
         new_messages = messages + [{'role': 'assistant', 'content': response_text}]
         
         return {'messages': new_messages, 'response': response_text}
     
+    def stream_response(self, state: Dict) -> Iterator[str]:
+        """流式生成回复，逐段返回文本
+        
+        按优先顺序尝试各AI服务（见 ProviderRouter.chat_stream），都不可用时返回默认回复；
+        已经输出部分内容后失败不再切换（避免两段回复拼接在一起）。
+        """
+        chat_messages = self._response_messages(state)
+        key = self._response_cache_key(state, chat_messages)
+        started = False
+        try:
+            for text in self.response_cache.stream(key, lambda: self.router.chat_stream(chat_messages)):
+                started = True
+                yield text
+        except AIProviderError as e:
+            if started:
+                yield "\n\n（回复中断，请重试）"
+                return
+            print(f"流式生成回复失败: {e}")
+            yield self._fallback_response(state)
+    
+    def prepare(self, user_input: str, history: List[Dict] = None, user_role: str = None, user_id: int = None) -> Dict:
+        """完成意图识别、参数提取和功能执行，不生成回复（流式接口使用，回复由 stream_response 生成）"""
+        messages = (history or []) + [{'role': 'user', 'content': user_input}]
+        return self.prepare_workflow.invoke({
+            'messages': messages,
+            'user_role': user_role,
+            'user_id': user_id
+        })
+    
     def process(self, user_input: str, history: List[Dict] = None, user_role: str = None, user_id: int = None) -> Dict:
         """处理用户输入（带安全参数）"""
         if history is None:
@@ -0,0 +1,245 @@
+"""
+流水记录列式快照
+进程内用NumPy数组保存全部流水的 日期序号、员工ID、数量、金额（分）及各支付方式金额（分），
+按日期排序，日期范围查询只是一次二分查找得到的切片，按员工统计用 bincount 完成。
+
+快照按高水位增量加载：新增记录按ID高水位，修改过的记录按updated_at高水位。
+是否需要刷新由全局数据指纹（date_versions表的版本号之和，随每次写入在同一事务中递增）判断，
+多进程部署下同样能感知其他进程的写入；
+删除不会留下更新时间，通过对比记录数和ID之和发现，发现后整体重新加载。
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+import threading
+import numpy as np
+from sqlalchemy import func, or_, select
+from models import db, User, Transaction, DateVersion, EncryptionService, PAYMENT_METHODS, parse_amount_details
+
+# 增量加载时向前多取一段时间，避免漏掉提交晚于高水位的并发写入（重复取到的记录会原样覆盖）
+LOOKBACK = timedelta(minutes=5)
+
+# 加载时每批读取的记录数
+LOAD_BATCH_SIZE = 5000
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+_COLUMNS = ['ids', 'dates', 'employee_ids', 'quantities', 'amounts'] + [f'{method}_amounts' for method in PAYMENT_METHODS]
+_DTYPES = {'ids': np.int64, 'dates': np.int32, 'employee_ids': np.int32, 'quantities': np.int64}
+
+def _empty_columns() -> Dict[str, np.ndarray]:
+    return {name: np.empty(0, dtype=_DTYPES.get(name, np.int64)) for name in _COLUMNS}
+
+def _to_cents(values) -> np.ndarray:
+    return np.rint(np.asarray(values, dtype=np.float64) * 100).astype(np.int64)
+
+class TransactionSnapshot:
+    """流水记录的列式快照（按日期、ID排序）"""
+
+    def __init__(self):
+        self._columns = _empty_columns()
+        self._fingerprint = None
+        self._max_id = None  # ID高水位
+        self._max_updated_at = None  # 更新时间高水位
+        self._lock = threading.Lock()
+        self.full_loads = 0
+        self.incremental_loads = 0
+
+    # ---------- 加载 ----------
+
+    def refresh(self) -> Dict[str, np.ndarray]:
+        """确保快照与数据库一致，返回当前的列数组"""
+        fingerprint = DateVersion.range_fingerprint()
+        if fingerprint == self._fingerprint:
+            return self._columns
+
+        with self._lock:
+            if fingerprint != self._fingerprint:
+                if self._max_id is None:
+                    self._load_full()
+                else:
+                    self._load_incremental()
+                self._fingerprint = fingerprint
+            return self._columns
+
+    def clear(self):
+        """丢弃快照，下次使用时重新加载"""
+        with self._lock:
+            self._columns = _empty_columns()
+            self._fingerprint = None
+            self._max_id = None
+            self._max_updated_at = None
+
+    def _fetch(self, *criteria):
+        """分批读取流水记录，返回 (列数组, 最大ID, 最大更新时间)"""
+        table = Transaction.__table__
+        payment_columns = [table.c[f'{method}_amount'] for method in PAYMENT_METHODS]
+        query = select(
+            table.c.id, table.c.date, table.c.employee_id, table.c.quantity, table.c.total_amount,
+            table.c.updated_at, table.c.amount_details_encrypted, *payment_columns
+        ).where(*criteria).execution_options(yield_per=LOAD_BATCH_SIZE)
+
+        parts = {name: [] for name in _COLUMNS}
+        max_id = None
+        max_updated_at = None
+        for rows in db.session.execute(query).partitions():
+            # 尚未回填支付方式金额的历史记录，解密后解析
+            pending = [row for row in rows if row.wechat_amount is None]
+            parsed = {}
+            if pending:
+                details = EncryptionService.decrypt_many(row.amount_details_encrypted for row in pending)
+                parsed = {row.id: parse_amount_details(text) for row, text in zip(pending, details)}
+
+            parts['ids'].append(np.fromiter((row.id for row in rows), np.int64, len(rows)))
+            parts['dates'].append(np.fromiter((row.date.toordinal() for row in rows), np.int32, len(rows)))
+            parts['employee_ids'].append(np.fromiter((row.employee_id for row in rows), np.int32, len(rows)))
+            parts['quantities'].append(np.fromiter((row.quantity for row in rows), np.int64, len(rows)))
+            parts['amounts'].append(_to_cents([float(row.total_amount) for row in rows]))
+            for method in PAYMENT_METHODS:
+                column = f'{method}_amount'
+                parts[f'{method}_amounts'].append(_to_cents([
+                    parsed[row.id][method] if row.id in parsed else float(getattr(row, column))
+                    for row in rows
+                ]))
+
+            batch_max_id = max(row.id for row in rows)
+            max_id = batch_max_id if max_id is None else max(max_id, batch_max_id)
+            for row in rows:
+                if row.updated_at is not None and (max_updated_at is None or row.updated_at > max_updated_at):
+                    max_updated_at = row.updated_at
+
+        columns = {
+            name: np.concatenate(arrays) if arrays else np.empty(0, dtype=_DTYPES.get(name, np.int64))
+            for name, arrays in parts.items()
+        }
+        return columns, max_id, max_updated_at
+
+    @staticmethod
+    def _sorted(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        order = np.lexsort((columns['ids'], columns['dates']))
+        return {name: array[order] for name, array in columns.items()}
+
+    def _load_full(self):
+        columns, max_id, max_updated_at = self._fetch()
+        self._columns = self._sorted(columns)
+        self._max_id = max_id or 0
+        self._max_updated_at = max_updated_at
+        self.full_loads += 1
+
+    def _load_incremental(self):
+        table = Transaction.__table__
+        criteria = [table.c.id > self._max_id]
+        if self._max_updated_at is not None:
+            criteria.append(table.c.updated_at >= self._max_updated_at - LOOKBACK)
+        changed, max_id, max_updated_at = self._fetch(or_(*criteria))
+
+        # 修改过的记录先移除旧值，再与新记录合并
+        current = self._columns
+        keep = ~np.isin(current['ids'], changed['ids'])
+        columns = self._sorted({
+            name: np.concatenate([current[name][keep], changed[name]]) for name in _COLUMNS
+        })
+
+        # 删除不会出现在增量中：记录数或ID之和与数据库不一致时整体重新加载
+        count, id_sum = db.session.query(func.count(Transaction.id), func.coalesce(func.sum(Transaction.id), 0)).one()
+        if count != len(columns['ids']) or int(id_sum) != int(columns['ids'].sum()):
+            self._load_full()
+            return
+
+        self._columns = columns
+        if max_id is not None:
+            self._max_id = max(self._max_id, max_id)
+        if max_updated_at is not None and (self._max_updated_at is None or max_updated_at > self._max_updated_at):
+            self._max_updated_at = max_updated_at
+        self.incremental_loads += 1
+
+    # ---------- 查询 ----------
+
+    def _slice(self, columns: Dict[str, np.ndarray], start_date: date, end_date: date,
+               employee_id: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """日期范围（含两端）内的记录；数组按日期排序，二分查找即可得到切片"""
+        dates = columns['dates']
+        lo = np.searchsorted(dates, start_date.toordinal(), side='left')
+        hi = np.searchsorted(dates, end_date.toordinal(), side='right')
+        part = {name: array[lo:hi] for name, array in columns.items()}
+        if employee_id is not None:
+            mask = part['employee_ids'] == employee_id
+            part = {name: array[mask] for name, array in part.items()}
+        return part
+
+    def range_arrays(self, start_date: date, end_date: date) -> Dict[str, np.ndarray]:
+        """日期范围内的逐笔数组：dates、employee_ids、quantities、amounts（分）、counts（均为1）"""
+        part = self._slice(self.refresh(), start_date, end_date)
+        return {
+            'dates': part['dates'],
+            'employee_ids': part['employee_ids'],
+            'quantities': part['quantities'],
+            'amounts': part['amounts'],
+            'counts': np.ones(len(part['ids']), dtype=np.int64)
+        }
+
+    @staticmethod
+    def _employee_names(employee_ids) -> Dict[int, Optional[str]]:
+        ids = [int(i) for i in employee_ids]
+        if not ids:
+            return {}
+        return dict(db.session.query(User.id, User.real_name).filter(User.id.in_(ids)).all())
+
+    def employee_stats(self, start_date: date, end_date: date, employee_id: Optional[int] = None,
+                       by_month: bool = False) -> List[tuple]:
+        """按员工（by_month时按员工和月份）汇总，返回与 reports.get_employee_stats 相同结构的聚合行：
+        (员工姓名, [月份,] 数量合计, 金额合计, 记录数)
+        """
+        part = self._slice(self.refresh(), start_date, end_date, employee_id)
+        if not len(part['ids']):
+            return []
+
+        employees, employee_index = np.unique(part['employee_ids'], return_inverse=True)
+        if by_month:
+            months = (part['dates'] - _EPOCH_ORDINAL).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64) % 12
+            keys = employee_index * 12 + months
+            size = len(employees) * 12
+        else:
+            keys = employee_index
+            size = len(employees)
+
+        counts = np.bincount(keys, minlength=size)
+        quantities = np.bincount(keys, weights=part['quantities'], minlength=size)
+        amounts = np.bincount(keys, weights=part['amounts'], minlength=size)
+
+        names = self._employee_names(employees)
+        rows = []
+        for key in np.flatnonzero(counts):
+            employee = int(employees[key // 12 if by_month else key])
+            group = (int(key % 12) + 1,) if by_month else ()
+            rows.append((names.get(employee), *group, int(quantities[key]), amounts[key] / 100, int(counts[key])))
+        return rows
+
+    def payment_stats(self, start_date: date, end_date: date, employee_id: Optional[int] = None) -> Dict[str, float]:
+        """支付方式统计，返回与 reports.get_payment_stats 相同结构的结果"""
+        part = self._slice(self.refresh(), start_date, end_date, employee_id)
+        totals = {method: int(part[f'{method}_amounts'].sum()) / 100 for method in PAYMENT_METHODS}
+        return {PAYMENT_METHODS[method]: amount for method, amount in totals.items() if amount > 0}
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'rows': int(len(self._columns['ids'])),
+            'full_loads': self.full_loads,
+            'incremental_loads': self.incremental_loads
+        }
+
+# 全局快照实例（每个进程一个，首次使用时加载）
+transaction_snapshot = TransactionSnapshot()
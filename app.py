@@ -22,6 +22,7 @@ from flask_jwt_extended import JWTManager
 from config import Config
 from models import db, init_db
 from routes import api_bp, auth_bp, ai_bp
+from principal import register_jwt_callbacks
 from ai_workflow import init_ai_workflow
 
 def create_app():
@@ -39,6 +40,7 @@ def create_app():
     db.init_app(app)
     CORS(app)
     jwt = JWTManager(app)
+    register_jwt_callbacks(jwt)
     
     # 注册蓝图
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+历史数据回填：解析金额明细并写入按支付方式拆分的金额列
+
+可以随时中断并重新运行：只处理金额列仍为NULL的记录，每批单独提交。
+用法: python backfill_payment_methods.py [--batch-size 500]
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import argparse
+from datetime import datetime
+from sqlalchemy import select, update, bindparam
+from app import create_app
+from models import db, Transaction, DateVersion, EncryptionService, PAYMENT_METHODS, parse_amount_details
+from migrations import add_column, run_in_batches
+
+def ensure_columns(engine):
+    """为已有的transactions表补充支付方式金额列"""
+    for method in PAYMENT_METHODS:
+        add_column(engine, 'transactions', f'{method}_amount', 'DECIMAL(10, 2) NULL')
+
+def backfill(engine, batch_size: int = 500) -> int:
+    """分批回填，返回本次处理的记录数"""
+    table = Transaction.__table__
+    # 同时更新updated_at，让报表快照（analytics.py）按更新时间增量加载到回填后的金额
+    stmt = update(table).where(table.c.id == bindparam('row_id')).values(
+        {
+            **{f'{method}_amount': bindparam(method) for method in PAYMENT_METHODS},
+            'updated_at': bindparam('updated_at')
+        }
+    )
+
+    def fetch_batch(connection, last_id, limit):
+        return connection.execute(
+            select(table.c.id, table.c.date, table.c.amount_details_encrypted)
+            .where(table.c.wechat_amount.is_(None), table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(limit)
+        ).all()
+
+    def process_batch(connection, rows):
+        details = EncryptionService.decrypt_many(row.amount_details_encrypted for row in rows)
+        now = datetime.utcnow()
+        params = []
+        for row, text_value in zip(rows, details):
+            amounts = parse_amount_details(text_value)
+            amounts['row_id'] = row.id
+            amounts['updated_at'] = now
+            params.append(amounts)
+
+        connection.execute(stmt, params)
+        # 支付方式统计随之变化，更新相关日期的数据版本号使报表缓存失效
+        DateVersion.bump(connection, [row.date for row in rows])
+
+    return run_in_batches(engine, fetch_batch, process_batch, batch_size)
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='回填流水记录的支付方式金额列')
+    arg_parser.add_argument('--batch-size', type=int, default=500, help='每批处理的记录数')
+    args = arg_parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        print("=" * 50)
+        print("回填支付方式金额列")
+        print("=" * 50)
+        ensure_columns(db.engine)
+        count = backfill(db.engine, args.batch_size)
+        print(f"\n✓ 回填完成，本次处理 {count} 条记录")
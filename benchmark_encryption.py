@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+金额明细加解密性能测试
+对比每次调用都派生密钥（旧实现）与使用进程级密钥缓存后的单行解密耗时
+
+用法: python benchmark_encryption.py [行数]
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import base64
+import sys
+import time
+from cryptography.fernet import Fernet
+from models import EncryptionService
+
+def decrypt_without_cache(encrypted_data: str) -> str:
+    """旧实现：每次解密都重新运行PBKDF2派生密钥"""
+    password = EncryptionService._get_password()
+    fernet = Fernet(EncryptionService._get_key(password))
+    return fernet.decrypt(base64.urlsafe_b64decode(encrypted_data.encode())).decode()
+
+def run_benchmark(rows: int = 50):
+    """运行测试并打印每行平均耗时"""
+    samples = [
+        EncryptionService.encrypt_data(f'微信{80 + i}, 支付宝{100 + i}, 现金{i}')
+        for i in range(rows)
+    ]
+
+    print("=" * 60)
+    print(f"金额明细解密性能测试（{rows} 行）")
+    print("=" * 60)
+
+    start = time.perf_counter()
+    for item in samples:
+        decrypt_without_cache(item)
+    uncached = time.perf_counter() - start
+    print(f"无缓存（每行派生密钥）: 总计 {uncached * 1000:.1f} ms, 每行 {uncached / rows * 1000:.3f} ms")
+
+    EncryptionService.clear_key_cache()
+    start = time.perf_counter()
+    for item in samples:
+        EncryptionService.decrypt_data(item)
+    cached = time.perf_counter() - start
+    print(f"密钥缓存（首行派生一次）: 总计 {cached * 1000:.1f} ms, 每行 {cached / rows * 1000:.3f} ms")
+
+    if cached > 0:
+        print(f"加速比: {uncached / cached:.1f}x")
+
+if __name__ == '__main__':
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -45,12 +45,31 @@ class Config:
     
     # JWT配置
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-key-change-in-production-2025'
-    JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=int(os.environ.get('JWT_ACCESS_TOKEN_MINUTES', 24 * 60)))
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
+    # 同一刷新令牌在轮换后这段时间内（秒）再次使用视为并发刷新，返回已轮换出的令牌，不按令牌泄露处理
+    REFRESH_REUSE_GRACE = int(os.environ.get('REFRESH_REUSE_GRACE', 10))
+    # 密码校验线程数（默认为CPU核数）和最多排队的校验请求数，超出时登录接口返回503
+    PASSWORD_WORKERS = int(os.environ.get('PASSWORD_WORKERS', 0)) or os.cpu_count() or 1
+    PASSWORD_QUEUE_LIMIT = int(os.environ.get('PASSWORD_QUEUE_LIMIT', 64))
+    # 密码哈希强度见 models.User.PASSWORD_HASH_PROFILES（环境变量 PASSWORD_HASH_PROFILE）
+    # 用户状态（是否启用、令牌版本号）缓存时间（秒），禁用账号最迟在这段时间后生效
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 30))
     
     # 数据加密配置
     ENCRYPTION_KEY = os.environ.get('ENCRYPTION_KEY') or 'your-32-byte-encryption-key-here!!'
     
+    # 报表缓存配置
+    REPORT_CACHE_TTL = int(os.environ.get('REPORT_CACHE_TTL', 600))  # 缓存有效期（秒）
+    REPORT_CACHE_MAX_ENTRIES = int(os.environ.get('REPORT_CACHE_MAX_ENTRIES', 256))  # 最多缓存的报表数
+    # 已结束周期（结束日期早于今天）的报表允许浏览器直接使用缓存的时间（秒），其余报表每次都用ETag验证
+    CLOSED_PERIOD_MAX_AGE = int(os.environ.get('CLOSED_PERIOD_MAX_AGE', 300))
+    # 报表计算方式：sql（查询员工每日汇总表）或 snapshot（进程内NumPy列式快照，见analytics.py）
+    REPORT_ENGINE = os.environ.get('REPORT_ENGINE', 'sql').lower()
+    
+    # 文件导入配置（上传的文件和导入进度保存在此目录）
+    IMPORT_FOLDER = os.environ.get('IMPORT_FOLDER') or os.path.join('instance', 'imports')
+    
     # AI API配置
     DEEPSEEK_API_KEY = os.environ.get('DEEPSEEK_API_KEY') or ''
     DEEPSEEK_API_BASE = os.environ.get('DEEPSEEK_API_BASE') or 'https://api.deepseek.com'
@@ -59,6 +78,27 @@ class Config:
     QIANWEN_API_KEY = os.environ.get('DASHSCOPE_API_KEY') or os.environ.get('QIANWEN_API_KEY') or ''
     QIANWEN_API_BASE = os.environ.get('QIANWEN_API_BASE') or 'https://dashscope.aliyuncs.com/compatible-mode/v1'
     
+    # AI服务调用配置（见 ai_providers.py）
+    AI_PROVIDERS = [name.strip() for name in os.environ.get('AI_PROVIDERS', 'deepseek,qianwen').split(',') if name.strip()]
+    AI_ROUTING = os.environ.get('AI_ROUTING', 'hedge').lower()  # fallback、race 或 hedge
+    AI_HEDGE_DELAY = float(os.environ.get('AI_HEDGE_DELAY', 2.0))  # 延迟样本不足时的对冲等待时间（秒）
+    AI_HEDGE_PERCENTILE = float(os.environ.get('AI_HEDGE_PERCENTILE', 90))
+    # 熔断：最近AI_BREAKER_WINDOW秒内至少AI_BREAKER_MIN_CALLS次调用且失败率达到AI_BREAKER_ERROR_RATE时，
+    # 暂停调用该服务AI_BREAKER_OPEN_SECONDS秒，之后放行一次探测调用
+    AI_BREAKER_WINDOW = float(os.environ.get('AI_BREAKER_WINDOW', 60))
+    AI_BREAKER_MIN_CALLS = int(os.environ.get('AI_BREAKER_MIN_CALLS', 5))
+    AI_BREAKER_ERROR_RATE = float(os.environ.get('AI_BREAKER_ERROR_RATE', 0.5))
+    AI_BREAKER_OPEN_SECONDS = float(os.environ.get('AI_BREAKER_OPEN_SECONDS', 30))
+    DEEPSEEK_TIMEOUT = float(os.environ.get('DEEPSEEK_TIMEOUT', 30))  # 单次调用超时（秒）
+    QIANWEN_TIMEOUT = float(os.environ.get('QIANWEN_TIMEOUT', 30))
+    # AI回复缓存（相同问题、相同角色、数据未变化时复用回复），AI_CACHE_TTL=0 关闭
+    AI_CACHE_TTL = int(os.environ.get('AI_CACHE_TTL', 300))  # 缓存有效期（秒）
+    AI_CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES', 512))  # 最多缓存的回复数
+    # AI对话上下文（见 models.Conversation）：保留最近的消息条数、摘要长度上限（字）、不活跃多少天后清理
+    AI_CONVERSATION_WINDOW = int(os.environ.get('AI_CONVERSATION_WINDOW', 10))
+    AI_CONVERSATION_SUMMARY_CHARS = int(os.environ.get('AI_CONVERSATION_SUMMARY_CHARS', 500))
+    AI_CONVERSATION_DAYS = int(os.environ.get('AI_CONVERSATION_DAYS', 30))
+    
     # 应用配置
     DEBUG = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
     HOST = os.environ.get('HOST', '0.0.0.0')
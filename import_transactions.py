@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+从CSV/Excel文件导入历史流水记录
+
+文件第一行为表头，需包含 日期、员工（姓名/用户名/ID）、数量、总金额 列，金额明细列可选。
+导入进度保存在数据库（import_jobs表），中断后重新运行同一命令会从上次位置继续；
+校验失败的行写入 <文件名>.errors.csv。
+
+用法:
+    python import_transactions.py ledger.csv [--chunk-size 5000]
+    python import_transactions.py ledger.xlsx --restart   # 忽略已有进度从头导入
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import argparse
+import sys
+from app import create_app
+from transaction_import import import_file, errors_path_for, ImportInProgress
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='从CSV/Excel文件导入流水记录')
+    arg_parser.add_argument('path', help='CSV或Excel（.xlsx）文件路径')
+    arg_parser.add_argument('--chunk-size', type=int, default=5000, help='每块处理的行数')
+    arg_parser.add_argument('--restart', action='store_true', help='忽略已有进度，从头导入')
+    args = arg_parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        print("=" * 50)
+        print(f"导入流水记录: {args.path}")
+        print("=" * 50)
+
+        try:
+            result = import_file(args.path, chunk_size=args.chunk_size, restart=args.restart)
+        except ImportInProgress as e:
+            print(f"\n✗ {e}")
+            sys.exit(1)
+        except Exception as e:
+            print(f"\n✗ 导入失败: {e}")
+            print("修复问题后重新运行同一命令即可从上次提交的位置继续")
+            sys.exit(1)
+
+        print(f"\n✓ 导入完成：共 {result['rows_done']} 行，导入 {result['imported']} 条，失败 {result['rejected']} 条")
+        if result['rejected']:
+            print(f"失败的行见 {errors_path_for(args.path)}")
@@ -0,0 +1,174 @@
+"""
+意图分类和权限绕过检测
+所有关键词（意图关键词、权限绕过话术、各角色的受限关键词）在启动时编译成一个前缀树正则，
+每条消息只扫描一遍就得到其中出现的全部关键词，再按优先级确定意图、判断是否拦截。
+
+权限绕过话术中“A.*?B”形式的规则（如“提升…权限”）拆成两个关键词，
+同一行内A出现在B之前即视为命中，与原来的正则匹配结果一致。
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional
+import re
+
+# 意图及其关键词，按优先级排列；都不匹配时为 chat
+INTENT_KEYWORDS = [
+    ('create_transaction', ['录入', '添加', '创建', '新增']),
+    ('query_transactions', ['查询', '查看', '显示', '列表']),
+    ('daily_report', ['日报', '每日', '今天']),
+    ('weekly_report', ['周报', '每周', '本周']),
+    ('monthly_report', ['月报', '每月', '本月']),
+    ('yearly_report', ['年报', '每年', '今年']),
+    ('management_report', ['管理', '综合', '指标']),
+    ('employee_list', ['员工', '人员']),
+]
+
+# 权限绕过话术：出现即拦截的关键词（匹配时忽略英文大小写）
+BYPASS_KEYWORDS = ['manager', 'admin', '管理员', '店长', '绕过', '跳过']
+
+# 权限绕过话术：同一行内前一个词出现在后一个词之前即拦截
+BYPASS_SEQUENCES = [
+    ('以', '身份'), ('作为', '管理员'), ('使用', '权限'), ('提升', '权限'),
+    ('切换', '角色'), ('忽略', '检查'), ('权限', '提升'),
+]
+
+# 各角色无权访问的功能关键词
+RESTRICTED_KEYWORDS = {
+    'worker': ['周报', '月报', '年报', '管理报表', '员工管理', '删除', '修改他人'],
+    'staff': ['周报', '月报', '年报', '管理报表', '员工管理', '删除', '修改他人'],
+}
+
+BYPASS_MESSAGE = "检测到可疑的权限绕过尝试，操作已被拒绝。"
+
+Classification = namedtuple('Classification', ['intent', 'blocked', 'error'])
+Classification.__doc__ = """分类结果：intent 为 security_blocked 时 blocked 是触发拦截的关键词，error 是提示信息"""
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """把关键词组织成前缀树形式的正则（同一位置优先匹配最长的关键词）"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return '(?:' + body + ')?' if '' in node else body
+
+    return build(trie)
+
+class IntentClassifier:
+    """预编译的关键词分类器（构造一次，可在多线程间共享）
+
+    每个关键词对应一个二进制位，扫描结果合并成一个整数，意图优先级和拦截规则都是位运算。
+    """
+
+    def __init__(self):
+        vocabulary = set(BYPASS_KEYWORDS)
+        for first, second in BYPASS_SEQUENCES:
+            vocabulary.update((first, second))
+        for _, keywords in INTENT_KEYWORDS:
+            vocabulary.update(keywords)
+        for keywords in RESTRICTED_KEYWORDS.values():
+            vocabulary.update(keywords)
+        self._bits = {word: 1 << index for index, word in enumerate(sorted(vocabulary))}
+
+        # 前瞻匹配：每个位置都尝试一次，重叠的关键词也能找到（开头的字符集让正则引擎快速跳过无关字符）；
+        # 同一位置只返回最长的关键词，较短的前缀关键词通过 _masks 一并计入
+        vocabulary.add('\n')  # “.*?”不跨行，换行只在检查“A…B”话术时使用
+        first_chars = ''.join(sorted({word[0] for word in vocabulary}))
+        self._pattern = re.compile('(?=[' + re.escape(first_chars) + '])(?=(' + _trie_pattern(vocabulary) + '))')
+        self._prefixes = {word: [other for other in self._bits if word.startswith(other)] for word in vocabulary}
+        self._masks = {word: self._mask(prefixes) for word, prefixes in self._prefixes.items()}
+
+        self._intents = [(intent, self._mask(keywords)) for intent, keywords in INTENT_KEYWORDS]
+        self._results = {intent: Classification(intent, (), None) for intent, _ in INTENT_KEYWORDS}
+        self._results['chat'] = Classification('chat', (), None)
+        self._bypass = self._mask(BYPASS_KEYWORDS)
+        self._restricted = {role: self._mask(keywords) for role, keywords in RESTRICTED_KEYWORDS.items()}
+        self._sequences = [(first, second, self._mask((first, second))) for first, second in BYPASS_SEQUENCES]
+        self._sequence_firsts = self._mask(first for first, _ in BYPASS_SEQUENCES)
+        self._sequence_seconds = self._mask(second for _, second in BYPASS_SEQUENCES)
+        self._ordered = list(dict.fromkeys(BYPASS_KEYWORDS + [word for keywords in RESTRICTED_KEYWORDS.values() for word in keywords]))
+        self._blocked_results = {}
+
+    def _mask(self, words: Iterable[str]) -> int:
+        mask = 0
+        for word in words:
+            mask |= self._bits[word]
+        return mask
+
+    def _blocked(self, bits: int, error: str) -> Classification:
+        """拦截结果（同样的关键词组合只生成一次；组合数受关键词数量限制）"""
+        key = (bits, error)
+        result = self._blocked_results.get(key)
+        if result is None:
+            blocked = tuple(word for word in self._ordered if bits & self._bits[word])
+            result = self._blocked_results[key] = Classification('security_blocked', blocked, error)
+        return result
+
+    def _matched_sequences(self, text: str, mask: int) -> List[str]:
+        """命中的“A…B”话术（两个词都出现时才需要按位置检查）"""
+        if not (mask & self._sequence_firsts and mask & self._sequence_seconds):
+            return []
+        candidates = [(first, second) for first, second, bits in self._sequences if mask & bits == bits]
+        if not candidates:
+            return []
+
+        firsts = {first for first, _ in candidates}
+        ends = {}  # 本行内各前一个词最早出现的结束位置
+        matched = []
+        for match in self._pattern.finditer(text):
+            position = match.start()
+            word = match.group(1)
+            if word == '\n':
+                ends.clear()
+                continue
+            found = self._prefixes[word]
+            for first, second in candidates:
+                end = ends.get(first)
+                if second in found and end is not None and end <= position and f'{first}…{second}' not in matched:
+                    matched.append(f'{first}…{second}')
+            for other in found:
+                if other in firsts:
+                    ends.setdefault(other, position + len(other))
+        return matched
+
+    def classify(self, message: str, user_role: Optional[str] = None) -> Classification:
+        """识别意图；给定角色时同时检查权限绕过话术和该角色的受限功能"""
+        text = message.lower()
+        mask = 0
+        for word in self._pattern.findall(text):
+            mask |= self._masks[word]
+
+        if user_role:
+            if mask & self._bypass:
+                return self._blocked(mask & self._bypass, BYPASS_MESSAGE)
+            sequences = self._matched_sequences(text, mask)
+            if sequences:
+                return Classification('security_blocked', tuple(sequences), BYPASS_MESSAGE)
+            restricted = mask & self._restricted.get(user_role, 0)
+            if restricted:
+                return self._blocked(restricted, f"您的角色({user_role})无权访问此功能。")
+
+        for intent, bits in self._intents:
+            if mask & bits:
+                return self._results[intent]
+        return self._results['chat']
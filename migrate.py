@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+数据库版本迁移工具
+
+用法:
+    python migrate.py              # 执行所有未执行的迁移
+    python migrate.py --status     # 查看迁移状态
+    python migrate.py --to 0002    # 只执行到指定版本
+
+迁移脚本位于 migrations/ 目录，已执行的版本记录在 schema_migrations 表中。
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import argparse
+import sys
+from app import create_app
+from models import db
+import migrations
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='执行数据库版本迁移')
+    arg_parser.add_argument('--status', action='store_true', help='只查看迁移状态，不执行')
+    arg_parser.add_argument('--to', dest='target', help='执行到指定版本为止')
+    args = arg_parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        print("=" * 50)
+        print("数据库版本迁移")
+        print("=" * 50)
+
+        if args.status:
+            applied = migrations.applied_versions(db.engine)
+            for migration in migrations.discover():
+                mark = '✓' if migration.version in applied else ' '
+                print(f"[{mark}] {migration.version} {migration.description}")
+            sys.exit(0)
+
+        try:
+            executed = migrations.upgrade(db.engine, target=args.target)
+        except Exception as e:
+            print(f"\n✗ 迁移失败: {e}")
+            print("修复问题后重新运行即可，已完成的迁移和已提交的数据批次不会重复执行")
+            sys.exit(1)
+
+        if executed:
+            print(f"\n✓ 迁移完成，本次执行 {len(executed)} 个版本")
+        else:
+            print("✓ 数据库已是最新版本")
@@ -0,0 +1,28 @@
+"""
+迁移0001：users表添加 is_demo、password_changed_at 列，并将admin设为示例账号
+（取代 migrate_add_is_demo.py 中的表结构部分）
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from sqlalchemy import text
+from migrations import add_column
+
+description = 'users表添加示例账号和密码修改时间列'
+
+def upgrade(engine):
+    add_column(engine, 'users', 'is_demo', 'BOOLEAN DEFAULT FALSE')
+    add_column(engine, 'users', 'password_changed_at', 'DATETIME DEFAULT NULL')
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE users SET is_demo = TRUE WHERE username = 'admin'"))
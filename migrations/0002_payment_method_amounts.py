@@ -0,0 +1,24 @@
+"""
+迁移0002：transactions表添加按支付方式拆分的金额列，并分批回填历史数据
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from backfill_payment_methods import ensure_columns, backfill
+
+description = 'transactions表添加支付方式金额列并回填'
+
+def upgrade(engine):
+    ensure_columns(engine)
+    backfill(engine)
@@ -0,0 +1,26 @@
+"""
+迁移0003：创建员工每日汇总表和日期版本号表，并根据已有流水生成汇总数据
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from models import db, DailyEmployeeSummary, DateVersion, rebuild_daily_summary
+
+description = '创建员工每日汇总表和日期版本号表'
+
+def upgrade(engine):
+    DailyEmployeeSummary.__table__.create(engine, checkfirst=True)
+    DateVersion.__table__.create(engine, checkfirst=True)
+    if not db.session.query(DailyEmployeeSummary.id).first():
+        rebuild_daily_summary()
@@ -0,0 +1,25 @@
+"""
+迁移0004：为流水列表和报表的常用过滤条件添加组合索引
+MySQL下在线创建，不阻塞读写
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from migrations import create_index
+
+description = 'transactions表添加(date, employee_id)和(date, created_at)组合索引'
+
+def upgrade(engine):
+    create_index(engine, 'transactions', 'ix_transactions_date_employee', ['date', 'employee_id'])
+    create_index(engine, 'transactions', 'ix_transactions_date_created', ['date', 'created_at'])
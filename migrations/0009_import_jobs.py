@@ -0,0 +1,23 @@
+"""
+迁移0009：创建流水导入进度表（导入断点与导入的数据在同一事务中提交）
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from models import ImportJob
+
+description = '创建流水导入进度表'
+
+def upgrade(engine):
+    ImportJob.__table__.create(engine, checkfirst=True)
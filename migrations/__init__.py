@@ -0,0 +1,152 @@
+"""
+数据库版本迁移
+
+每个迁移是本包中以四位版本号开头的模块（如 0001_users_demo_columns.py），包含：
+    description: 迁移说明
+    upgrade(engine): 执行迁移
+
+已执行的版本记录在 schema_migrations 表中。迁移本身应当是幂等的（先检查列/索引/表是否存在），
+这样中途失败或数据库已由 db.create_all() 建好时都可以安全地重新运行。
+用法见 migrate.py。
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from datetime import datetime
+from typing import Callable, List, Sequence
+import importlib
+import pkgutil
+import re
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, select, text
+
+_metadata = MetaData()
+
+schema_migrations = Table(
+    'schema_migrations', _metadata,
+    Column('version', String(32), primary_key=True),
+    Column('description', String(255), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+_MODULE_PATTERN = re.compile(r'^(\d{4})_\w+$')
+
+class Migration:
+    """一个迁移版本"""
+
+    def __init__(self, version: str, module):
+        self.version = version
+        self.name = module.__name__.rsplit('.', 1)[-1]
+        self.description = getattr(module, 'description', self.name)
+        self.upgrade = module.upgrade
+
+def discover() -> List[Migration]:
+    """按版本号顺序列出本包中的全部迁移"""
+    migrations = []
+    for module_info in pkgutil.iter_modules(__path__):
+        match = _MODULE_PATTERN.match(module_info.name)
+        if match:
+            module = importlib.import_module(f'{__name__}.{module_info.name}')
+            migrations.append(Migration(match.group(1), module))
+    migrations.sort(key=lambda migration: migration.version)
+
+    versions = [migration.version for migration in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f'迁移版本号重复: {versions}')
+    return migrations
+
+def applied_versions(engine) -> set:
+    """已执行的迁移版本"""
+    schema_migrations.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        return {row.version for row in connection.execute(select(schema_migrations.c.version))}
+
+def pending(engine) -> List[Migration]:
+    """尚未执行的迁移"""
+    applied = applied_versions(engine)
+    return [migration for migration in discover() if migration.version not in applied]
+
+def upgrade(engine, target: str = None, log: Callable[[str], None] = print) -> List[Migration]:
+    """依次执行未执行的迁移（直到target版本为止），返回本次执行的迁移"""
+    executed = []
+    for migration in pending(engine):
+        if target is not None and migration.version > target:
+            break
+        log(f"→ {migration.version} {migration.description}")
+        migration.upgrade(engine)
+        with engine.begin() as connection:
+            connection.execute(schema_migrations.insert().values(
+                version=migration.version,
+                description=migration.description,
+                applied_at=datetime.utcnow()
+            ))
+        log(f"✓ {migration.version} 完成")
+        executed.append(migration)
+    return executed
+
+# ---------- 迁移中常用的工具函数 ----------
+
+def has_table(engine, table: str) -> bool:
+    return inspect(engine).has_table(table)
+
+def has_column(engine, table: str, column: str) -> bool:
+    return column in {item['name'] for item in inspect(engine).get_columns(table)}
+
+def has_index(engine, table: str, name: str) -> bool:
+    return name in {item['name'] for item in inspect(engine).get_indexes(table)}
+
+def add_column(engine, table: str, column: str, ddl: str):
+    """添加列（已存在时跳过）；ddl为列类型及约束，如 'DECIMAL(10, 2) NULL'"""
+    if has_column(engine, table, column):
+        return
+    with engine.begin() as connection:
+        connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+
+def create_index(engine, table: str, name: str, columns: Sequence[str]):
+    """创建索引（已存在时跳过）
+
+    MySQL下使用在线DDL（ALGORITHM=INPLACE, LOCK=NONE）：建索引期间表仍可正常读写；
+    如果当前表结构不支持在线建索引，MySQL会直接报错而不是退化为锁表。
+    """
+    if has_index(engine, table, name):
+        return
+    column_list = ', '.join(columns)
+    if engine.dialect.name == 'mysql':
+        sql = f'ALTER TABLE {table} ADD INDEX {name} ({column_list}), ALGORITHM=INPLACE, LOCK=NONE'
+    else:
+        sql = f'CREATE INDEX {name} ON {table} ({column_list})'
+    with engine.begin() as connection:
+        connection.execute(text(sql))
+
+def run_in_batches(engine, fetch_batch: Callable, process_batch: Callable,
+                   batch_size: int = 500, log: Callable[[str], None] = print) -> int:
+    """分批处理数据，每批在单独的事务中提交，返回处理的记录数
+
+    fetch_batch(connection, last_id, batch_size): 返回 id > last_id 的下一批待处理记录（按id升序，需包含id列）
+    process_batch(connection, rows): 处理一批记录
+
+    待处理条件应由fetch_batch自身的查询条件表达（如 某列 IS NULL），
+    这样中断后重新运行会从尚未处理的记录继续，而不会重复处理已提交的批次。
+    """
+    total = 0
+    last_id = 0
+    while True:
+        with engine.begin() as connection:
+            rows = fetch_batch(connection, last_id, batch_size)
+            if not rows:
+                break
+            process_batch(connection, rows)
+        last_id = rows[-1].id
+        total += len(rows)
+        log(f"  已处理 {total} 条（最后ID: {last_id}）")
+    return total
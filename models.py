@@ -17,6 +17,9 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, func, inspect as sa_inspect
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from flask_jwt_extended import create_access_token
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
@@ -25,19 +28,38 @@ from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.backends import default_backend
 import base64
+from concurrent.futures import ProcessPoolExecutor
 import json
 import os
+import re
+import threading
 
 db = SQLAlchemy()
 
+def _decrypt_chunk(password: str, salt: bytes, items: list) -> list:
+    """在子进程中批量解密一段数据（需为模块级函数以便序列化）"""
+    return EncryptionService._decrypt_serial(items, password, salt)
+
 class EncryptionService:
     """数据加密服务"""
     
+    DEFAULT_SALT = b'flowmaster_salt_2025'  # 生产环境应使用随机salt
+    
+    # 进程级密钥缓存：(密钥材料, salt) -> Fernet实例
+    # PBKDF2 每次派生需要10万次迭代，缓存后同一密钥只派生一次
+    _fernet_cache = {}
+    _cache_lock = threading.Lock()
+    
+    # 批量解密：超过该行数时分发到进程池并行处理
+    PARALLEL_THRESHOLD = int(os.environ.get('DECRYPT_PARALLEL_THRESHOLD', 2000))
+    PARALLEL_WORKERS = int(os.environ.get('DECRYPT_WORKERS', 0)) or os.cpu_count() or 1
+    _process_pool = None
+    
     @staticmethod
     def _get_key(password: str, salt: bytes = None) -> bytes:
         """生成加密密钥"""
         if salt is None:
-            salt = b'flowmaster_salt_2025'  # 生产环境应使用随机salt
+            salt = EncryptionService.DEFAULT_SALT
         
         kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
@@ -50,29 +72,164 @@ class EncryptionService:
         return key
     
     @staticmethod
-    def encrypt_data(data: str, password: str = None) -> str:
-        """加密数据"""
+    def _get_password(password: str = None) -> str:
+        """获取加密口令（未指定时读取环境变量）"""
         if password is None:
             password = os.environ.get('ENCRYPTION_KEY', 'default-encryption-key-32-bytes-long!!')
+        return password
+    
+    @classmethod
+    def get_fernet(cls, password: str = None, salt: bytes = None) -> Fernet:
+        """获取Fernet实例（按密钥材料和salt缓存）"""
+        password = cls._get_password(password)
+        if salt is None:
+            salt = cls.DEFAULT_SALT
         
-        key = EncryptionService._get_key(password)
-        fernet = Fernet(key)
+        cache_key = (password, salt)
+        fernet = cls._fernet_cache.get(cache_key)
+        if fernet is None:
+            with cls._cache_lock:
+                fernet = cls._fernet_cache.get(cache_key)
+                if fernet is None:
+                    fernet = Fernet(cls._get_key(password, salt))
+                    cls._fernet_cache[cache_key] = fernet
+        return fernet
+    
+    @classmethod
+    def clear_key_cache(cls, password: str = None, salt: bytes = None):
+        """清除密钥缓存（密钥轮换时调用）
+        
+        不传参数时清除全部缓存；传入password/salt时只清除匹配的条目。
+        """
+        with cls._cache_lock:
+            if password is None and salt is None:
+                cls._fernet_cache.clear()
+                return
+            for cached_password, cached_salt in list(cls._fernet_cache):
+                if password is not None and cached_password != password:
+                    continue
+                if salt is not None and cached_salt != salt:
+                    continue
+                del cls._fernet_cache[(cached_password, cached_salt)]
+    
+    @staticmethod
+    def encrypt_data(data: str, password: str = None) -> str:
+        """加密数据"""
+        fernet = EncryptionService.get_fernet(password)
         encrypted = fernet.encrypt(data.encode())
         return base64.urlsafe_b64encode(encrypted).decode()
     
+    @staticmethod
+    def encrypt_many(items, password: str = None) -> list:
+        """批量加密（共用同一个Fernet实例）"""
+        fernet = EncryptionService.get_fernet(password)
+        return [base64.urlsafe_b64encode(fernet.encrypt(item.encode())).decode() for item in items]
+    
     @staticmethod
     def decrypt_data(encrypted_data: str, password: str = None) -> str:
         """解密数据"""
-        if password is None:
-            password = os.environ.get('ENCRYPTION_KEY', 'default-encryption-key-32-bytes-long!!')
-        
         try:
-            key = EncryptionService._get_key(password)
-            fernet = Fernet(key)
+            fernet = EncryptionService.get_fernet(password)
             decrypted = fernet.decrypt(base64.urlsafe_b64decode(encrypted_data.encode()))
             return decrypted.decode()
         except Exception as e:
             return encrypted_data  # 如果解密失败，返回原数据
+    
+    @classmethod
+    def _decrypt_serial(cls, items: list, password: str = None, salt: bytes = None) -> list:
+        """在当前进程中逐条解密（复用同一个Fernet实例）"""
+        fernet = cls.get_fernet(password, salt)
+        results = []
+        for encrypted_data in items:
+            if not encrypted_data:
+                results.append(encrypted_data)
+                continue
+            try:
+                decrypted = fernet.decrypt(base64.urlsafe_b64decode(encrypted_data.encode()))
+                results.append(decrypted.decode())
+            except Exception:
+                results.append(encrypted_data)  # 与decrypt_data一致，失败时返回原数据
+        return results
+    
+    @classmethod
+    def _get_process_pool(cls) -> ProcessPoolExecutor:
+        """获取解密进程池（首次使用时创建）"""
+        with cls._cache_lock:
+            if cls._process_pool is None:
+                cls._process_pool = ProcessPoolExecutor(max_workers=cls.PARALLEL_WORKERS)
+            return cls._process_pool
+    
+    @classmethod
+    def _shutdown_process_pool(cls):
+        """关闭解密进程池（进程池损坏时重建）"""
+        with cls._cache_lock:
+            pool, cls._process_pool = cls._process_pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    
+    @classmethod
+    def decrypt_many(cls, items: list, password: str = None) -> list:
+        """批量解密，返回结果与输入顺序一致
+        
+        行数低于PARALLEL_THRESHOLD时在当前进程解密；超过时按进程数切分，
+        分发到进程池并行解密（Fernet/AES属于CPU密集型计算）。
+        """
+        items = list(items)
+        password = cls._get_password(password)
+        salt = cls.DEFAULT_SALT
+        
+        if len(items) < cls.PARALLEL_THRESHOLD or cls.PARALLEL_WORKERS <= 1:
+            return cls._decrypt_serial(items, password, salt)
+        
+        chunk_size = -(-len(items) // cls.PARALLEL_WORKERS)
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+        try:
+            pool = cls._get_process_pool()
+            futures = [pool.submit(_decrypt_chunk, password, salt, chunk) for chunk in chunks]
+            results = []
+            for future in futures:
+                results.extend(future.result())
+            return results
+        except Exception as e:
+            # 进程池不可用时退回单进程解密，保证报表仍可生成
+            print(f"并行解密失败，改为单进程解密: {e}")
+            cls._shutdown_process_pool()
+            return cls._decrypt_serial(items, password, salt)
+
+# 支付方式：结构化列名 -> 报表中使用的名称
+PAYMENT_METHODS = {
+    'wechat': '微信',
+    'alipay': '支付宝',
+    'cash': '现金',
+    'other': '其他'
+}
+
+_DETAIL_SEPARATOR = re.compile(r'[,，、;；]')
+_DETAIL_AMOUNT = re.compile(r'\d+(?:\.\d+)?')
+
+def parse_amount_details(details: str) -> dict:
+    """解析金额明细文本，如"微信80, 支付宝100"，返回各支付方式金额
+    
+    未标明支付方式的金额计入other。
+    """
+    amounts = {method: 0.0 for method in PAYMENT_METHODS}
+    if not details:
+        return amounts
+    
+    for part in _DETAIL_SEPARATOR.split(details):
+        match = _DETAIL_AMOUNT.search(part)
+        if not match:
+            continue
+        amount = float(match.group(0))
+        if '微信' in part:
+            amounts['wechat'] += amount
+        elif '支付宝' in part:
+            amounts['alipay'] += amount
+        elif '现金' in part:
+            amounts['cash'] += amount
+        else:
+            amounts['other'] += amount
+    return amounts
 
 class User(db.Model):
     """用户模型"""
@@ -87,15 +244,30 @@ class User(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     is_demo = db.Column(db.Boolean, default=False)  # 是否为示例账号（只读，不能写入数据）
     password_changed_at = db.Column(db.DateTime, default=None)  # 密码最后修改时间（用于限制每天修改次数）
+    token_version = db.Column(db.Integer, nullable=False, default=0)  # 令牌版本号，递增后已签发的令牌全部失效
+    
+    # 密码哈希强度：PASSWORD_HASH_PROFILE 为下列档位名，或直接写werkzeug的哈希参数（如 scrypt:65536:8:1）
+    # 调整后已有用户在下次登录成功时自动按新参数重新哈希
+    PASSWORD_HASH_PROFILES = {
+        'standard': 'scrypt:32768:8:1',  # werkzeug默认参数
+        'low': 'scrypt:16384:8:1',  # 内存和耗时减半，适合配置较低的服务器
+        'pbkdf2': 'pbkdf2:sha256:600000'
+    }
+    _hash_profile = os.environ.get('PASSWORD_HASH_PROFILE', 'standard')
+    PASSWORD_HASH_METHOD = PASSWORD_HASH_PROFILES.get(_hash_profile, _hash_profile)
     
     def set_password(self, password):
         """设置密码"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=self.PASSWORD_HASH_METHOD)
     
     def check_password(self, password):
         """验证密码"""
         return check_password_hash(self.password_hash, password)
     
+    def password_needs_rehash(self) -> bool:
+        """密码哈希参数与当前配置不一致（登录成功后应重新哈希）"""
+        return self.password_hash.split('$', 1)[0] != self.PASSWORD_HASH_METHOD
+    
     def to_dict(self):
         """转换为字典"""
         return {
@@ -109,9 +281,94 @@ class User(db.Model):
             'password_changed_at': self.password_changed_at.isoformat() if self.password_changed_at else None
         }
 
+class RefreshToken(db.Model):
+    """已签发的刷新令牌
+    
+    刷新令牌每使用一次就轮换为新令牌（旧令牌记录被谁替换）。
+    同一次登录产生的令牌属于同一个family；已轮换的令牌被再次使用说明令牌可能泄露，整个family作废。
+    """
+    __tablename__ = 'refresh_tokens'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), unique=True, nullable=False, index=True)
+    family_id = db.Column(db.String(36), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked_at = db.Column(db.DateTime, nullable=True)
+    replaced_by = db.Column(db.String(36), nullable=True)  # 轮换后的新令牌jti
+
+class Conversation(db.Model):
+    """AI对话上下文（服务端保存，客户端只需传对话ID）
+    
+    只保留最近的若干条消息，滚出窗口的用户问题压缩进摘要，摘要超过长度上限时丢弃最早的部分；
+    对话再长，保存的内容和每次交给AI工作流的历史都有上限。对话内容加密存储。
+    """
+    __tablename__ = 'conversations'
+    
+    id = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    content_encrypted = db.Column(db.Text, nullable=False)  # 加密的JSON：{"summary": 摘要, "messages": 最近的消息}
+    message_count = db.Column(db.Integer, nullable=False, default=0)  # 累计消息数（含已压缩的）
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    # 摘要中每条问题保留的字数
+    SUMMARY_ITEM_CHARS = 60
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.content_encrypted is None:
+            self.set_content('', [])
+    
+    def get_content(self):
+        """返回 (摘要, 最近的消息)"""
+        content = json.loads(EncryptionService.decrypt_data(self.content_encrypted))
+        return content.get('summary', ''), content.get('messages', [])
+    
+    def set_content(self, summary: str, messages: list):
+        self.content_encrypted = EncryptionService.encrypt_data(
+            json.dumps({'summary': summary, 'messages': messages}, ensure_ascii=False)
+        )
+    
+    def history(self) -> list:
+        """交给AI工作流的历史：摘要（作为一条system消息）加最近的消息"""
+        summary, messages = self.get_content()
+        if summary:
+            return [{'role': 'system', 'content': f'此前对话摘要：\n{summary}'}] + messages
+        return messages
+    
+    def append(self, new_messages: list, window: int, summary_chars: int):
+        """追加消息，超出窗口的消息压缩进摘要"""
+        summary, messages = self.get_content()
+        messages = messages + new_messages
+        overflow = messages[:-window] if window > 0 else messages
+        messages = messages[len(overflow):]
+        
+        lines = [summary] if summary else []
+        for message in overflow:
+            if message.get('role') == 'user':
+                content = ' '.join(message.get('content', '').split())
+                if len(content) > self.SUMMARY_ITEM_CHARS:
+                    content = content[:self.SUMMARY_ITEM_CHARS] + '…'
+                lines.append(f'- {content}')
+        summary = '\n'.join(lines)
+        if len(summary) > summary_chars:
+            # 按行丢弃最早的内容
+            summary = summary[-summary_chars:]
+            summary = summary[summary.find('\n') + 1:] if '\n' in summary else summary
+        
+        self.set_content(summary, messages)
+        self.message_count = (self.message_count or 0) + len(new_messages)
+
 class Transaction(db.Model):
     """流水记录模型"""
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # 流水列表和报表的常用过滤条件（已有数据库通过 migrate.py 添加）
+        db.Index('ix_transactions_date_employee', 'date', 'employee_id'),
+        db.Index('ix_transactions_date_created', 'date', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False, index=True)
@@ -120,31 +377,394 @@ class Transaction(db.Model):
     quantity = db.Column(db.Integer, nullable=False)
     total_amount = db.Column(db.Numeric(10, 2), nullable=False)
     amount_details_encrypted = db.Column(db.Text, nullable=False)  # 加密存储的金额明细
+    # 按支付方式拆分的金额（写入时从金额明细解析，报表直接汇总，无需解密）
+    # 为NULL表示历史数据尚未回填，见 backfill_payment_methods.py
+    wechat_amount = db.Column(db.Numeric(10, 2), nullable=True)
+    alipay_amount = db.Column(db.Numeric(10, 2), nullable=True)
+    cash_amount = db.Column(db.Numeric(10, 2), nullable=True)
+    other_amount = db.Column(db.Numeric(10, 2), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def set_amount_details(self, details: str):
         """设置金额明细（加密存储）"""
         self.amount_details_encrypted = EncryptionService.encrypt_data(details)
+        self._amount_details = details
+        self.set_payment_amounts(parse_amount_details(details))
+    
+    def set_payment_amounts(self, amounts: dict):
+        """写入各支付方式金额（amounts为parse_amount_details的返回值）"""
+        self.wechat_amount = amounts['wechat']
+        self.alipay_amount = amounts['alipay']
+        self.cash_amount = amounts['cash']
+        self.other_amount = amounts['other']
     
     def get_amount_details(self) -> str:
-        """获取金额明细（解密）"""
-        return EncryptionService.decrypt_data(self.amount_details_encrypted)
+        """获取金额明细（解密，结果缓存在实例上）"""
+        details = getattr(self, '_amount_details', None)
+        if details is None:
+            details = EncryptionService.decrypt_data(self.amount_details_encrypted)
+            self._amount_details = details
+        return details
+    
+    @classmethod
+    def decrypt_many(cls, transactions: list) -> list:
+        """批量解密一组记录的金额明细，并缓存到各实例上供to_dict使用"""
+        pending = [t for t in transactions if getattr(t, '_amount_details', None) is None]
+        if pending:
+            details = EncryptionService.decrypt_many(t.amount_details_encrypted for t in pending)
+            for t, value in zip(pending, details):
+                t._amount_details = value
+        return [t._amount_details for t in transactions]
+    
+    @classmethod
+    def bulk_insert(cls, connection, rows: list) -> int:
+        """批量插入流水记录（一次executemany），返回插入的记录数
+        
+        rows: [{'date', 'employee_id', 'quantity', 'total_amount', 'amount_details'}, ...]
+        行内可带已解析好的 'amounts'（parse_amount_details格式），否则逐条解析金额明细。
+        不经过ORM flush，员工每日汇总和日期版本号在这里同步维护；由调用方提交事务。
+        """
+        if not rows:
+            return 0
+        
+        encrypted = EncryptionService.encrypt_many(row['amount_details'] for row in rows)
+        now = datetime.utcnow()
+        values = []
+        deltas = {}
+        for row, amount_details_encrypted in zip(rows, encrypted):
+            amounts = row.get('amounts') or parse_amount_details(row['amount_details'])
+            values.append({
+                'date': row['date'],
+                'employee_id': row['employee_id'],
+                'quantity': row['quantity'],
+                'total_amount': row['total_amount'],
+                'amount_details_encrypted': amount_details_encrypted,
+                **{f'{method}_amount': amounts[method] for method in PAYMENT_METHODS},
+                'created_at': now,
+                'updated_at': now
+            })
+            _add_summary_delta(deltas, row['date'], row['employee_id'], row['quantity'], row['total_amount'], 1)
+        
+        connection.execute(cls.__table__.insert(), values)
+        DailyEmployeeSummary.apply_deltas(connection, deltas)
+        DateVersion.bump(connection, [row['date'] for row in rows])
+        return len(values)
+    
+    # 字段名 -> 序列化函数（to_dict按需调用，未请求的字段不会触发解密或关联查询）
+    _FIELD_SERIALIZERS = {
+        'id': lambda t: t.id,
+        'date': lambda t: t.date.isoformat() if t.date else None,
+        'employee_id': lambda t: t.employee_id,
+        'employee_name': lambda t: t.employee.real_name if t.employee else None,
+        'quantity': lambda t: int(t.quantity) if t.quantity else 0,
+        'total_amount': lambda t: float(t.total_amount) if t.total_amount else 0.0,
+        'amount_details': lambda t: t.get_amount_details(),
+        'created_at': lambda t: t.created_at.isoformat() if t.created_at else None,
+        'updated_at': lambda t: t.updated_at.isoformat() if t.updated_at else None
+    }
+    
+    # 字段名 -> 需要从数据库加载的列
+    FIELD_COLUMNS = {
+        'id': ['id'],
+        'date': ['date'],
+        'employee_id': ['employee_id'],
+        'employee_name': ['employee_id'],
+        'quantity': ['quantity'],
+        'total_amount': ['total_amount'],
+        'amount_details': ['amount_details_encrypted'],
+        'created_at': ['created_at'],
+        'updated_at': ['updated_at']
+    }
+    
+    # 预定义视图
+    FIELD_VIEWS = {
+        'summary': ['id', 'date', 'employee_id', 'quantity', 'total_amount'],
+        'full': list(_FIELD_SERIALIZERS)
+    }
+    
+    def to_dict(self, fields: list = None):
+        """转换为字典（fields为None时返回全部字段）"""
+        if fields is None:
+            fields = self._FIELD_SERIALIZERS
+        return {field: self._FIELD_SERIALIZERS[field](self) for field in fields}
+
+def upsert_rows(connection, table, key_columns: list, values: list, increment: bool):
+    """按唯一键插入或更新多行
+    
+    increment为True时在原值上累加（数据库端原子执行，多个gunicorn进程并发写入也不会丢失更新），
+    为False时直接覆盖为给定值。
+    """
+    if not values:
+        return
+    
+    value_columns = [column for column in values[0] if column not in key_columns]
+    dialect = connection.dialect.name
+    if dialect == 'mysql':
+        stmt = mysql_insert(table)
+        new = stmt.inserted
+        set_ = {
+            column: (table.c[column] + new[column]) if increment else new[column]
+            for column in value_columns
+        }
+        stmt = stmt.on_duplicate_key_update(**set_)
+    elif dialect == 'sqlite':
+        stmt = sqlite_insert(table)
+        new = stmt.excluded
+        set_ = {
+            column: (table.c[column] + new[column]) if increment else new[column]
+            for column in value_columns
+        }
+        stmt = stmt.on_conflict_do_update(index_elements=key_columns, set_=set_)
+    else:
+        raise NotImplementedError(f'不支持的数据库类型: {dialect}')
+    
+    connection.execute(stmt, values)
+
+class DailyEmployeeSummary(db.Model):
+    """员工每日汇总（员工 × 日期）
+    
+    与流水记录在同一个数据库事务中增量维护，周报、月报、年报和管理报表直接读取该表。
+    """
+    __tablename__ = 'daily_employee_summary'
+    __table_args__ = (
+        db.UniqueConstraint('date', 'employee_id', name='uq_daily_employee_summary'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False, index=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    @classmethod
+    def apply_deltas(cls, connection, deltas: dict):
+        """累加汇总变化量
+        
+        deltas: {(date, employee_id): [数量, 金额, 笔数]}，按键排序后写入，避免并发事务间死锁。
+        """
+        values = [
+            {
+                'date': key[0],
+                'employee_id': key[1],
+                'quantity': int(delta[0]),
+                'total_amount': delta[1],
+                'transaction_count': int(delta[2])
+            }
+            for key, delta in sorted(deltas.items())
+            if any(delta)
+        ]
+        upsert_rows(connection, cls.__table__, ['date', 'employee_id'], values, increment=True)
+    
+    @classmethod
+    def set_totals(cls, connection, rows: list):
+        """直接写入汇总值（重建时使用）"""
+        upsert_rows(connection, cls.__table__, ['date', 'employee_id'], rows, increment=False)
+
+class DateVersion(db.Model):
+    """按日期的数据版本号
+    
+    某天的流水每次写入版本号加一，报表缓存和条件请求用日期范围内的版本号判断数据是否变化。
+    """
+    __tablename__ = 'date_versions'
+    
+    date = db.Column(db.Date, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    @classmethod
+    def bump(cls, connection, dates):
+        """将指定日期的版本号加一"""
+        values = [{'date': day, 'version': 1} for day in sorted(set(dates)) if day is not None]
+        upsert_rows(connection, cls.__table__, ['date'], values, increment=True)
+    
+    @classmethod
+    def range_fingerprint(cls, start_date=None, end_date=None) -> tuple:
+        """日期范围内的数据指纹 (版本号之和, 有过写入的天数)
+        
+        版本号只增不减，范围内任何一天有写入，指纹都会变化。
+        """
+        query = db.session.query(func.coalesce(func.sum(cls.version), 0), func.count(cls.date))
+        if start_date is not None:
+            query = query.filter(cls.date >= start_date)
+        if end_date is not None:
+            query = query.filter(cls.date <= end_date)
+        total, days = query.one()
+        return int(total), int(days)
+
+class TableVersion(db.Model):
+    """按表的数据版本号
+    
+    表中数据每次通过ORM写入版本号加一（目前记录users表），员工列表等接口的条件请求用它生成ETag。
+    直接执行SQL修改的数据不会更新版本号。
+    """
+    __tablename__ = 'table_versions'
+    
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    @classmethod
+    def bump(cls, connection, names):
+        """将指定表的版本号加一"""
+        values = [{'name': name, 'version': 1} for name in sorted(set(names))]
+        upsert_rows(connection, cls.__table__, ['name'], values, increment=True)
+    
+    @classmethod
+    def current(cls, name: str) -> int:
+        """表的当前版本号（从未写入过时为0）"""
+        return db.session.query(cls.version).filter(cls.name == name).scalar() or 0
+
+class ImportJob(db.Model):
+    """流水文件导入进度（断点）
+    
+    每导入一块数据，进度与该块数据在同一事务中提交，中断后从已提交的位置继续，不会重复导入。
+    errors_size 是已提交部分对应的错误文件长度，续传时截掉之后写入的内容。
+    """
+    __tablename__ = 'import_jobs'
+    
+    path_hash = db.Column(db.String(64), primary_key=True)  # 文件绝对路径的SHA-256
+    path = db.Column(db.String(1024), nullable=False)
+    file_size = db.Column(db.BigInteger, nullable=False)
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    imported = db.Column(db.Integer, nullable=False, default=0)
+    rejected = db.Column(db.Integer, nullable=False, default=0)
+    errors_size = db.Column(db.BigInteger, nullable=False, default=0)
+    error_samples = db.Column(db.Text, nullable=True)  # JSON：前若干个错误行
+    completed = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def to_dict(self):
-        """转换为字典"""
+        """导入进度（transaction_import.import_file 的返回值）"""
         return {
-            'id': self.id,
-            'date': self.date.isoformat() if self.date else None,
-            'employee_id': self.employee_id,
-            'employee_name': self.employee.real_name if self.employee else None,
-            'quantity': int(self.quantity) if self.quantity else 0,
-            'total_amount': float(self.total_amount) if self.total_amount else 0.0,
-            'amount_details': self.get_amount_details(),
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+            'file_size': self.file_size,
+            'rows_done': self.rows_done,
+            'imported': self.imported,
+            'rejected': self.rejected,
+            'completed': self.completed,
+            'error_samples': json.loads(self.error_samples) if self.error_samples else []
         }
 
+def _add_summary_delta(deltas: dict, date, employee_id, quantity, amount, sign: int):
+    """累加一条流水对汇总表的影响"""
+    if date is None or employee_id is None:
+        return
+    delta = deltas.setdefault((date, int(employee_id)), [0, 0.0, 0])
+    delta[0] += sign * int(quantity or 0)
+    delta[1] += sign * float(amount or 0)
+    delta[2] += sign
+
+def _original_value(state, attr: str):
+    """获取属性在本次修改前的值"""
+    history = state.attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(state.obj(), attr)
+
+_SUMMARY_ATTRS = ('date', 'employee_id', 'quantity', 'total_amount')
+
+@event.listens_for(db.session, 'before_flush')
+def _maintain_daily_summary(session, flush_context, instances):
+    """在流水写入的同一事务中维护员工每日汇总（新增、修改含改日期/改员工、删除）和日期版本号"""
+    deltas = {}
+    touched_dates = set()
+    
+    for obj in session.new:
+        if isinstance(obj, Transaction):
+            _add_summary_delta(deltas, obj.date, obj.employee_id, obj.quantity, obj.total_amount, 1)
+            touched_dates.add(obj.date)
+    
+    for obj in session.deleted:
+        if isinstance(obj, Transaction):
+            state = sa_inspect(obj)
+            _add_summary_delta(deltas, *[_original_value(state, attr) for attr in _SUMMARY_ATTRS], -1)
+            touched_dates.add(_original_value(state, 'date'))
+    
+    for obj in session.dirty:
+        if not isinstance(obj, Transaction) or not session.is_modified(obj):
+            continue
+        state = sa_inspect(obj)
+        touched_dates.update((_original_value(state, 'date'), obj.date))
+        if not any(state.attrs[attr].history.has_changes() for attr in _SUMMARY_ATTRS):
+            continue
+        _add_summary_delta(deltas, *[_original_value(state, attr) for attr in _SUMMARY_ATTRS], -1)
+        _add_summary_delta(deltas, obj.date, obj.employee_id, obj.quantity, obj.total_amount, 1)
+    
+    if deltas:
+        DailyEmployeeSummary.apply_deltas(session.connection(), deltas)
+    if touched_dates:
+        DateVersion.bump(session.connection(), touched_dates)
+
+# 记录表级版本号的模型
+_VERSIONED_MODELS = (User,)
+
+@event.listens_for(db.session, 'before_flush')
+def _bump_table_versions(session, flush_context, instances):
+    """在同一事务中递增被写入表的版本号"""
+    touched = {
+        obj.__tablename__
+        for obj in (*session.new, *session.deleted, *session.dirty)
+        if isinstance(obj, _VERSIONED_MODELS) and (obj not in session.dirty or session.is_modified(obj))
+    }
+    if touched:
+        TableVersion.bump(session.connection(), touched)
+
+def rebuild_daily_summary(start_date=None, end_date=None, verify_only: bool = False) -> list:
+    """根据流水记录重新计算员工每日汇总
+    
+    返回与流水记录不一致的汇总行列表 [(date, employee_id, 汇总表中的值, 实际值)]。
+    verify_only为False时同时修正这些行。
+    """
+    criteria = []
+    summary_criteria = []
+    if start_date:
+        criteria.append(Transaction.date >= start_date)
+        summary_criteria.append(DailyEmployeeSummary.date >= start_date)
+    if end_date:
+        criteria.append(Transaction.date <= end_date)
+        summary_criteria.append(DailyEmployeeSummary.date <= end_date)
+    
+    actual = {
+        (row[0], row[1]): (int(row[2] or 0), float(row[3] or 0), int(row[4]))
+        for row in db.session.query(
+            Transaction.date,
+            Transaction.employee_id,
+            func.sum(Transaction.quantity),
+            func.sum(Transaction.total_amount),
+            func.count(Transaction.id)
+        ).filter(*criteria).group_by(Transaction.date, Transaction.employee_id)
+    }
+    stored = {
+        (row.date, row.employee_id): (row.quantity, float(row.total_amount), row.transaction_count)
+        for row in DailyEmployeeSummary.query.filter(*summary_criteria)
+    }
+    
+    mismatches = []
+    for key in sorted(set(actual) | set(stored)):
+        expected = actual.get(key, (0, 0.0, 0))
+        current = stored.get(key)
+        if current is None or current[0] != expected[0] or current[2] != expected[2] \
+                or abs(current[1] - expected[1]) > 0.005:
+            mismatches.append((key[0], key[1], current, expected))
+    
+    if mismatches and not verify_only:
+        DateVersion.bump(db.session.connection(), [day for day, _, _, _ in mismatches])
+        DailyEmployeeSummary.set_totals(db.session.connection(), [
+            {
+                'date': day,
+                'employee_id': employee_id,
+                'quantity': expected[0],
+                'total_amount': expected[1],
+                'transaction_count': expected[2]
+            }
+            for day, employee_id, _, expected in mismatches
+        ])
+        db.session.commit()
+    
+    return mismatches
+
 def init_db():
     """初始化数据库"""
     try:
@@ -155,6 +775,11 @@ def init_db():
     
     db.create_all()
     
+    # 首次部署员工每日汇总表时，根据已有流水生成汇总数据
+    if not db.session.query(DailyEmployeeSummary.id).first() and db.session.query(Transaction.id).first():
+        print("正在生成员工每日汇总数据...")
+        rebuild_daily_summary()
+    
     # 只创建示例账号admin（只读，不能写入数据）
     admin = User.query.filter_by(username='admin').first()
     if not admin:
@@ -0,0 +1,226 @@
+"""
+当前用户身份
+登录时把角色、示例账号标记和令牌版本号写入JWT附加声明，受保护接口直接从声明中读取权限信息，
+不再每个请求查询一次users表。
+
+需要让已签发令牌失效时（修改密码、禁用账号等）递增 users.token_version。
+每个请求都会用短时缓存的用户状态（is_active、token_version）校验令牌，
+缓存过期后重新查库，因此直接在数据库中禁用账号也会在缓存有效期内生效。
+
+登录同时签发刷新令牌，访问令牌过期后客户端用它换取新的令牌对，不必重新输入密码；
+刷新令牌每用一次就轮换（见 models.RefreshToken）。
+密码校验在有上限的线程池中执行，登录高峰时多余的请求排队或直接返回“繁忙”，不会占满Web工作线程。
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+import threading
+import time
+import uuid
+from flask import jsonify
+from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt, get_jwt_identity
+from werkzeug.security import check_password_hash
+from config import Config
+from models import db, User, RefreshToken
+
+class Principal:
+    """从JWT声明得到的当前用户（只包含权限检查需要的字段）"""
+    __slots__ = ('id', 'role', 'is_demo')
+
+    def __init__(self, id: int, role: str, is_demo: bool):
+        self.id = id
+        self.role = role
+        self.is_demo = is_demo
+
+def token_claims(user) -> dict:
+    """写入访问令牌的附加声明"""
+    return {
+        'role': user.role,
+        'is_demo': bool(user.is_demo),
+        'ver': user.token_version or 0
+    }
+
+def create_user_token(user) -> str:
+    """为用户签发访问令牌"""
+    return create_access_token(identity=str(user.id), additional_claims=token_claims(user))
+
+def _encode_refresh_token(user, jti: str) -> str:
+    return create_refresh_token(identity=str(user.id), additional_claims={'jti': jti, 'ver': user.token_version or 0})
+
+def issue_tokens(user, family_id: Optional[str] = None, jti: Optional[str] = None) -> Dict[str, str]:
+    """签发访问令牌和刷新令牌（刷新令牌记录由调用方提交事务）
+
+    family_id 为空表示新的一次登录，顺便清理该用户已过期的刷新令牌记录。
+    """
+    if family_id is None:
+        RefreshToken.query.filter(
+            RefreshToken.user_id == user.id, RefreshToken.expires_at < datetime.utcnow()
+        ).delete(synchronize_session=False)
+
+    jti = jti or str(uuid.uuid4())
+    refresh_token = _encode_refresh_token(user, jti)
+    db.session.add(RefreshToken(
+        jti=jti,
+        family_id=family_id or jti,
+        user_id=user.id,
+        expires_at=datetime.utcnow() + Config.JWT_REFRESH_TOKEN_EXPIRES
+    ))
+    return {
+        'access_token': create_user_token(user),
+        'refresh_token': refresh_token
+    }
+
+def rotate_refresh_token(jti: str) -> Optional[Dict[str, str]]:
+    """用刷新令牌换取新的令牌对，旧刷新令牌随即作废；令牌无效时返回None（由调用方提交事务）
+
+    已轮换过的令牌在并发刷新的宽限时间内再次出现时，返回它已轮换出的令牌，不另签发刷新令牌，
+    同一family始终只有一条有效的令牌链；超过宽限时间再出现按泄露处理，整个family作废。
+    """
+    token = RefreshToken.query.filter_by(jti=jti).with_for_update().first()
+    if token is None:
+        return None
+
+    now = datetime.utcnow()
+    if token.revoked_at is not None:
+        reused = token.replaced_by is None or now - token.revoked_at > timedelta(seconds=Config.REFRESH_REUSE_GRACE)
+        if reused:
+            revoke_refresh_tokens(token.user_id, token.family_id)
+            return None
+        successor = RefreshToken.query.filter_by(jti=token.replaced_by).first()
+        if successor is None or successor.revoked_at is not None or successor.expires_at <= now:
+            return None
+        user = User.query.get(token.user_id)
+        if user is None:
+            return None
+        return {
+            'access_token': create_user_token(user),
+            'refresh_token': _encode_refresh_token(user, successor.jti)
+        }
+    if token.expires_at <= now:
+        return None
+
+    user = User.query.get(token.user_id)
+    if user is None:
+        return None
+    new_jti = str(uuid.uuid4())
+    token.revoked_at = now
+    token.replaced_by = new_jti
+    return issue_tokens(user, token.family_id, new_jti)
+
+def revoke_refresh_tokens(user_id: int, family_id: Optional[str] = None):
+    """作废用户的刷新令牌（指定family时只作废该次登录的令牌，由调用方提交事务）"""
+    query = RefreshToken.query.filter(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+    if family_id is not None:
+        query = query.filter(RefreshToken.family_id == family_id)
+    query.update({RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+
+def current_principal() -> Optional[Principal]:
+    """当前请求的用户
+
+    旧版本签发的令牌没有附加声明，这时退回到查库。
+    """
+    user_id = int(get_jwt_identity())
+    claims = get_jwt()
+    if 'role' in claims:
+        return Principal(user_id, claims['role'], bool(claims.get('is_demo')))
+
+    user = User.query.get(user_id)
+    if not user:
+        return None
+    return Principal(user.id, user.role, bool(user.is_demo))
+
+class UserStateCache:
+    """用户状态（是否启用、令牌版本号）的进程内短时缓存"""
+
+    def __init__(self, ttl: float = 30):
+        self.ttl = ttl
+        self._entries: Dict[int, Tuple[float, Optional[Tuple[bool, int]]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, refresh: bool = False) -> Optional[Tuple[bool, int]]:
+        """返回 (is_active, token_version)，用户不存在时返回None；refresh=True时忽略缓存"""
+        now = time.monotonic()
+        entry = self._entries.get(user_id)
+        if not refresh and entry is not None and entry[0] > now:
+            return entry[1]
+
+        row = db.session.query(User.is_active, User.token_version).filter(User.id == user_id).first()
+        state = (bool(row[0]), row[1] or 0) if row else None
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, state)
+        return state
+
+    def invalidate(self, user_id: int):
+        """用户状态变化后立即丢弃缓存（只对当前进程有效，其他进程在缓存过期后生效）"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+user_state_cache = UserStateCache(ttl=Config.USER_CACHE_TTL)
+
+def revoke_user_tokens(user):
+    """使用户已签发的全部令牌失效（由调用方提交事务）"""
+    user.token_version = (user.token_version or 0) + 1
+    user_state_cache.invalidate(user.id)
+
+class PasswordCheckBusy(Exception):
+    """密码校验排队已满或等待超时"""
+
+# 单次密码校验最长等待时间（秒，含排队）
+PASSWORD_CHECK_TIMEOUT = 30
+
+_password_executor = ThreadPoolExecutor(max_workers=Config.PASSWORD_WORKERS, thread_name_prefix='password-check')
+_password_slots = threading.BoundedSemaphore(Config.PASSWORD_WORKERS + Config.PASSWORD_QUEUE_LIMIT)
+
+def verify_password(user, password: str) -> bool:
+    """在密码校验线程池中验证密码
+
+    scrypt/pbkdf2 计算期间释放GIL，校验可以并行；线程数有上限，登录高峰时不会同时占用过多CPU和内存。
+    正在执行和排队的校验达到上限时抛出 PasswordCheckBusy。
+    """
+    if not _password_slots.acquire(blocking=False):
+        raise PasswordCheckBusy()
+    try:
+        future = _password_executor.submit(check_password_hash, user.password_hash, password)
+    except Exception:
+        _password_slots.release()
+        raise
+    future.add_done_callback(lambda _: _password_slots.release())
+
+    try:
+        return future.result(timeout=PASSWORD_CHECK_TIMEOUT)
+    except FutureTimeoutError:
+        raise PasswordCheckBusy()
+
+def register_jwt_callbacks(jwt):
+    """注册令牌校验回调：账号被禁用或令牌版本号过期的令牌视为已吊销"""
+
+    @jwt.token_in_blocklist_loader
+    def is_token_revoked(jwt_header, jwt_payload) -> bool:
+        user_id = int(jwt_payload['sub'])
+        token_version = jwt_payload.get('ver', 0)
+        state = user_state_cache.get(user_id)
+        if state is not None and token_version > state[1]:
+            # 令牌比缓存新（其他进程刚签发），说明缓存已过时
+            state = user_state_cache.get(user_id, refresh=True)
+        if state is None:
+            return True
+        is_active, current_version = state
+        return not is_active or token_version != current_version
+
+    @jwt.revoked_token_loader
+    def revoked_token_response(jwt_header, jwt_payload):
+        return jsonify({'error': '登录已失效，请重新登录'}), 401
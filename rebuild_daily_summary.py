@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+员工每日汇总表重建/校验工具
+
+用法:
+    python rebuild_daily_summary.py                  # 重建全部汇总数据
+    python rebuild_daily_summary.py --verify         # 只校验，不修改（不一致时返回非零退出码）
+    python rebuild_daily_summary.py --start 2026-01-01 --end 2026-01-31
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import argparse
+import sys
+from dateutil import parser
+from app import create_app
+from models import rebuild_daily_summary
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='重建或校验员工每日汇总表')
+    arg_parser.add_argument('--verify', action='store_true', help='只校验，不修改数据')
+    arg_parser.add_argument('--start', help='开始日期（YYYY-MM-DD）')
+    arg_parser.add_argument('--end', help='结束日期（YYYY-MM-DD）')
+    args = arg_parser.parse_args()
+
+    start_date = parser.parse(args.start).date() if args.start else None
+    end_date = parser.parse(args.end).date() if args.end else None
+
+    app = create_app()
+    with app.app_context():
+        print("=" * 50)
+        print("员工每日汇总表" + ("校验" if args.verify else "重建"))
+        print("=" * 50)
+
+        mismatches = rebuild_daily_summary(start_date, end_date, verify_only=args.verify)
+        for day, employee_id, current, expected in mismatches:
+            print(f"  {day} 员工{employee_id}: 汇总表 {current} -> 实际 {expected}")
+
+        if not mismatches:
+            print("✓ 汇总数据与流水记录一致")
+        elif args.verify:
+            print(f"\n✗ 发现 {len(mismatches)} 处不一致，请运行 python rebuild_daily_summary.py 修复")
+            sys.exit(1)
+        else:
+            print(f"\n✓ 已修复 {len(mismatches)} 处不一致")
@@ -0,0 +1,96 @@
+"""
+报表结果缓存
+按 报表类型 + 参数 + 角色范围 缓存报表结果，并记录生成时所覆盖日期范围的数据指纹。
+指纹来自按日期的版本号（date_versions表，随流水写入在同一事务中递增），
+只有覆盖被写入日期的报表才会失效；多个gunicorn进程之间同样有效。
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+import threading
+import time
+from config import Config
+from models import DateVersion
+
+class ReportCache:
+    """带LRU淘汰和TTL过期的报表缓存"""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (指纹, 过期时间, 报表结果)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key: Hashable, start_date, end_date, compute: Callable[[], Any]) -> Any:
+        """返回缓存的报表；缓存不存在、已过期或日期范围内数据有变化时重新计算
+
+        返回的结果由所有调用方共享，调用方不应修改。
+        """
+        fingerprint = DateVersion.range_fingerprint(start_date, end_date)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                cached_fingerprint, expires_at, value = entry
+                if cached_fingerprint == fingerprint and expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.stale += 1
+            self.misses += 1
+
+        value = compute()
+
+        with self._lock:
+            self._entries[key] = (fingerprint, now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+        return value
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率等统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+# 全局报表缓存实例（每个进程一个）
+report_cache = ReportCache(
+    max_entries=Config.REPORT_CACHE_MAX_ENTRIES,
+    ttl=Config.REPORT_CACHE_TTL
+)
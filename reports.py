@@ -0,0 +1,404 @@
+"""
+报表服务
+REST API（routes/api.py）与AI助手（routes/ai.py）共用的报表实现
+权限检查由调用方负责，这里只负责按参数生成报表数据
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from datetime import date, datetime, timedelta
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+import calendar
+import numpy as np
+from sqlalchemy import func, extract
+from sqlalchemy.orm import joinedload
+from models import (
+    db, User, Transaction, DailyEmployeeSummary,
+    EncryptionService, PAYMENT_METHODS, parse_amount_details
+)
+from report_cache import report_cache
+from analytics import transaction_snapshot
+from config import Config
+
+def week_range(year: int, week: int) -> Tuple[date, date]:
+    """ISO周的开始和结束日期（周一至周日）"""
+    start_date = date.fromisocalendar(year, week, 1)
+    return start_date, start_date + timedelta(days=6)
+
+def month_range(year: int, month: int) -> Tuple[date, date]:
+    """月的开始和结束日期"""
+    last_day = calendar.monthrange(year, month)[1]
+    return date(year, month, 1), date(year, month, last_day)
+
+def year_range(year: int) -> Tuple[date, date]:
+    """年的开始和结束日期"""
+    return date(year, 1, 1), date(year, 12, 31)
+
+def default_management_range() -> Tuple[date, date]:
+    """管理报表默认统计区间：最近30天"""
+    end_date = datetime.now().date()
+    return end_date - timedelta(days=30), end_date
+
+def previous_period_start(start_date: date, end_date: date) -> date:
+    """与 [start_date, end_date] 等长的上一周期的开始日期（管理报表计算环比用）"""
+    return start_date - (end_date - start_date) - timedelta(days=1)
+
+def get_employee_stats(start_date: date, end_date: date, *group_by, employee_id: Optional[int] = None) -> List[tuple]:
+    """从员工每日汇总表按员工（及附加分组表达式）汇总日期范围内的数据
+
+    返回聚合行：(员工姓名, *附加分组值, 数量合计, 金额合计, 记录数)，
+    读取的汇总行数不超过 天数 × 员工数，与流水条数无关。
+    """
+    query = db.session.query(
+        User.real_name,
+        *group_by,
+        func.sum(DailyEmployeeSummary.quantity),
+        func.sum(DailyEmployeeSummary.total_amount),
+        func.sum(DailyEmployeeSummary.transaction_count)
+    ).select_from(DailyEmployeeSummary).outerjoin(
+        User, User.id == DailyEmployeeSummary.employee_id
+    ).filter(
+        DailyEmployeeSummary.date >= start_date,
+        DailyEmployeeSummary.date <= end_date
+    )
+    if employee_id is not None:
+        query = query.filter(DailyEmployeeSummary.employee_id == employee_id)
+
+    return query.group_by(
+        DailyEmployeeSummary.employee_id, User.real_name, *group_by
+    ).having(
+        func.sum(DailyEmployeeSummary.transaction_count) > 0
+    ).all()
+
+def get_payment_stats(*criteria) -> Dict[str, float]:
+    """支付方式统计
+
+    直接对结构化金额列求和；尚未回填的历史记录（金额列为NULL）解密后解析补足。
+    """
+    columns = [getattr(Transaction, f'{method}_amount') for method in PAYMENT_METHODS]
+    sums = db.session.query(*[func.sum(column) for column in columns]).filter(
+        *criteria, Transaction.wechat_amount.isnot(None)
+    ).one()
+    totals = {method: float(value or 0) for method, value in zip(PAYMENT_METHODS, sums)}
+
+    pending = db.session.query(Transaction.amount_details_encrypted).filter(
+        *criteria, Transaction.wechat_amount.is_(None)
+    ).all()
+    if pending:
+        for details in EncryptionService.decrypt_many(row[0] for row in pending):
+            for method, amount in parse_amount_details(details).items():
+                totals[method] += amount
+
+    return {PAYMENT_METHODS[method]: amount for method, amount in totals.items() if amount > 0}
+
+def _use_snapshot() -> bool:
+    """是否使用进程内列式快照（analytics.py）计算报表，由 REPORT_ENGINE 配置决定"""
+    return Config.REPORT_ENGINE == 'snapshot'
+
+def _employee_stats(start_date: date, end_date: date, employee_id: Optional[int] = None,
+                    by_month: bool = False) -> List[tuple]:
+    """按员工（by_month时按员工和月份）汇总，聚合行结构见 get_employee_stats"""
+    if _use_snapshot():
+        return transaction_snapshot.employee_stats(start_date, end_date, employee_id, by_month)
+    group_by = [extract('month', DailyEmployeeSummary.date)] if by_month else []
+    return get_employee_stats(start_date, end_date, *group_by, employee_id=employee_id)
+
+def _payment_stats(start_date: date, end_date: date, employee_id: Optional[int] = None) -> Dict[str, float]:
+    if _use_snapshot():
+        return transaction_snapshot.payment_stats(start_date, end_date, employee_id)
+    criteria = [Transaction.date >= start_date, Transaction.date <= end_date]
+    if employee_id is not None:
+        criteria.append(Transaction.employee_id == employee_id)
+    return get_payment_stats(*criteria)
+
+def _summarize(stats: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """按员工统计结果的合计部分"""
+    return {
+        'total_quantity': sum(s['quantity'] for s in stats.values()),
+        'total_amount': sum(s['total_amount'] for s in stats.values()),
+        'employee_count': len(stats)
+    }
+
+def _scope(employee_id: Optional[int]) -> str:
+    """缓存键中的角色范围：全部员工或单个员工"""
+    return 'all' if employee_id is None else f'employee:{employee_id}'
+
+def daily_report(target_date: date, employee_id: Optional[int] = None,
+                 include_transactions: bool = True) -> Dict[str, Any]:
+    """每日小结
+
+    employee_id: 只统计指定员工（普通工人和前台员工查看自己的数据时使用）
+    include_transactions: 是否在按员工统计中附带当日流水明细；为False时只读取汇总表
+    """
+    key = ('daily', target_date, _scope(employee_id), include_transactions)
+    return report_cache.get_or_compute(
+        key, target_date, target_date,
+        lambda: _build_daily_report(target_date, employee_id, include_transactions)
+    )
+
+def _build_daily_report(target_date: date, employee_id: Optional[int], include_transactions: bool) -> Dict[str, Any]:
+    if include_transactions:
+        query = Transaction.query.options(joinedload(Transaction.employee)).filter(Transaction.date == target_date)
+        if employee_id is not None:
+            query = query.filter(Transaction.employee_id == employee_id)
+        transactions = query.all()
+
+        # 一次性批量解密金额明细（供明细列表使用）
+        Transaction.decrypt_many(transactions)
+
+        stats = defaultdict(lambda: {'quantity': 0, 'total_amount': 0.0, 'transactions': []})
+        for t in transactions:
+            emp_name = t.employee.real_name if t.employee else '未知'
+            stats[emp_name]['quantity'] += t.quantity
+            stats[emp_name]['total_amount'] += float(t.total_amount)
+            stats[emp_name]['transactions'].append(t.to_dict())
+    else:
+        stats = defaultdict(lambda: {'quantity': 0, 'total_amount': 0.0})
+        for emp_name, quantity, amount, _ in _employee_stats(target_date, target_date, employee_id):
+            emp_name = emp_name or '未知'
+            stats[emp_name]['quantity'] += int(quantity or 0)
+            stats[emp_name]['total_amount'] += float(amount or 0)
+
+    return {
+        'date': target_date.isoformat(),
+        'summary': _summarize(stats),
+        'by_employee': dict(stats),
+        'payment_methods': _payment_stats(target_date, target_date, employee_id)
+    }
+
+def weekly_report(year: int, week: int) -> Dict[str, Any]:
+    """每周小结（ISO周）"""
+    start_date, end_date = week_range(year, week)
+    return report_cache.get_or_compute(
+        ('weekly', year, week), start_date, end_date,
+        lambda: _build_weekly_report(year, week, start_date, end_date)
+    )
+
+def _build_weekly_report(year: int, week: int, start_date: date, end_date: date) -> Dict[str, Any]:
+    stats = defaultdict(lambda: {'quantity': 0, 'total_amount': 0.0})
+    for emp_name, quantity, amount, _ in _employee_stats(start_date, end_date):
+        emp_name = emp_name or '未知'
+        stats[emp_name]['quantity'] += int(quantity or 0)
+        stats[emp_name]['total_amount'] += float(amount or 0)
+
+    return {
+        'year': year,
+        'week': week,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'summary': _summarize(stats),
+        'by_employee': dict(stats)
+    }
+
+def monthly_report(year: int, month: int) -> Dict[str, Any]:
+    """每月小结（含日均金额）"""
+    start_date, end_date = month_range(year, month)
+    return report_cache.get_or_compute(
+        ('monthly', year, month), start_date, end_date,
+        lambda: _build_monthly_report(year, month, start_date, end_date)
+    )
+
+def _build_monthly_report(year: int, month: int, start_date: date, end_date: date) -> Dict[str, Any]:
+    stats = defaultdict(lambda: {'quantity': 0, 'total_amount': 0.0, 'daily_avg': 0.0})
+    for emp_name, quantity, amount, _ in _employee_stats(start_date, end_date):
+        emp_name = emp_name or '未知'
+        stats[emp_name]['quantity'] += int(quantity or 0)
+        stats[emp_name]['total_amount'] += float(amount or 0)
+
+    # 计算日均
+    days_in_month = (end_date - start_date).days + 1
+    for emp_name in stats:
+        stats[emp_name]['daily_avg'] = stats[emp_name]['total_amount'] / days_in_month
+
+    summary = _summarize(stats)
+    summary['days_in_month'] = days_in_month
+
+    return {
+        'year': year,
+        'month': month,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'summary': summary,
+        'by_employee': dict(stats)
+    }
+
+def yearly_report(year: int) -> Dict[str, Any]:
+    """年报（含各员工月度统计）"""
+    start_date, end_date = year_range(year)
+    return report_cache.get_or_compute(
+        ('yearly', year), start_date, end_date,
+        lambda: _build_yearly_report(year, start_date, end_date)
+    )
+
+def _build_yearly_report(year: int, start_date: date, end_date: date) -> Dict[str, Any]:
+    stats = defaultdict(lambda: {
+        'quantity': 0,
+        'total_amount': 0.0,
+        'monthly_stats': defaultdict(lambda: {'quantity': 0, 'total_amount': 0.0})
+    })
+
+    for emp_name, month, quantity, amount, _ in _employee_stats(start_date, end_date, by_month=True):
+        emp_name = emp_name or '未知'
+        quantity = int(quantity or 0)
+        amount = float(amount or 0)
+        stats[emp_name]['quantity'] += quantity
+        stats[emp_name]['total_amount'] += amount
+
+        # 月度统计
+        month = int(month)
+        stats[emp_name]['monthly_stats'][month]['quantity'] += quantity
+        stats[emp_name]['monthly_stats'][month]['total_amount'] += amount
+
+    # 转换月度统计为字典
+    for emp_name in stats:
+        stats[emp_name]['monthly_stats'] = dict(stats[emp_name]['monthly_stats'])
+
+    return {
+        'year': year,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'summary': _summarize(stats),
+        'by_employee': dict(stats)
+    }
+
+def management_report(start_date: date, end_date: date) -> Dict[str, Any]:
+    """管理层综合报表（员工统计、排名、每日统计、支付方式、趋势和环比增长率）"""
+    # 环比需要上一周期的数据，缓存指纹覆盖 [上一周期开始, 结束日期]
+    prev_start = previous_period_start(start_date, end_date)
+    return report_cache.get_or_compute(
+        ('management', start_date, end_date), prev_start, end_date,
+        lambda: _build_management_report(start_date, end_date, prev_start)
+    )
+
+def _period_arrays(start_date: date, end_date: date) -> Dict[str, np.ndarray]:
+    """日期范围内按（日期, 员工）的明细数组，一次查询取出
+
+    返回 dates（日期序号）、employee_ids、quantities、amounts（分）、counts（笔数）
+    """
+    if _use_snapshot():
+        return transaction_snapshot.range_arrays(start_date, end_date)
+
+    rows = db.session.query(
+        DailyEmployeeSummary.date,
+        DailyEmployeeSummary.employee_id,
+        DailyEmployeeSummary.quantity,
+        DailyEmployeeSummary.total_amount,
+        DailyEmployeeSummary.transaction_count
+    ).filter(
+        DailyEmployeeSummary.date >= start_date,
+        DailyEmployeeSummary.date <= end_date,
+        DailyEmployeeSummary.transaction_count > 0
+    ).all()
+    return {
+        'dates': np.array([row[0].toordinal() for row in rows], dtype=np.int64),
+        'employee_ids': np.array([row[1] for row in rows], dtype=np.int64),
+        'quantities': np.array([row[2] for row in rows], dtype=np.int64),
+        'amounts': np.rint(np.array([float(row[3]) for row in rows], dtype=np.float64) * 100).astype(np.int64),
+        'counts': np.array([row[4] for row in rows], dtype=np.int64)
+    }
+
+def _build_management_report(start_date: date, end_date: date, prev_start: date) -> Dict[str, Any]:
+    # 一次取出 [上一周期开始, 结束日期] 的数据，本期统计和环比都在这份数据上向量化完成
+    data = _period_arrays(prev_start, end_date)
+    in_period = data['dates'] >= start_date.toordinal()
+    prev_total_amount = int(data['amounts'][~in_period].sum()) / 100
+    current = {name: array[in_period] for name, array in data.items()}
+
+    # 按员工统计
+    employee_stats = defaultdict(lambda: {
+        'quantity': 0,
+        'total_amount': 0.0,
+        'transaction_count': 0,
+        'avg_per_transaction': 0.0
+    })
+
+    employees, employee_index = np.unique(current['employee_ids'], return_inverse=True)
+    employee_quantities = np.bincount(employee_index, weights=current['quantities'], minlength=len(employees))
+    employee_amounts = np.bincount(employee_index, weights=current['amounts'], minlength=len(employees))
+    employee_counts = np.bincount(employee_index, weights=current['counts'], minlength=len(employees))
+
+    names = dict(db.session.query(User.id, User.real_name).filter(
+        User.id.in_([int(employee) for employee in employees])
+    ).all()) if len(employees) else {}
+    for i, employee in enumerate(employees):
+        emp_name = names.get(int(employee)) or '未知'
+        employee_stats[emp_name]['quantity'] += int(employee_quantities[i])
+        employee_stats[emp_name]['total_amount'] += employee_amounts[i] / 100
+        employee_stats[emp_name]['transaction_count'] += int(employee_counts[i])
+
+    # 计算平均单笔金额
+    for emp_name in employee_stats:
+        if employee_stats[emp_name]['transaction_count'] > 0:
+            employee_stats[emp_name]['avg_per_transaction'] = \
+                employee_stats[emp_name]['total_amount'] / employee_stats[emp_name]['transaction_count']
+
+    # 基础统计
+    total_transactions = int(current['counts'].sum())
+    total_quantity = int(current['quantities'].sum())
+    total_amount = int(current['amounts'].sum()) / 100
+
+    # 按日期统计
+    days = (end_date - start_date).days + 1
+    day_index = current['dates'] - start_date.toordinal()
+    day_quantities = np.bincount(day_index, weights=current['quantities'], minlength=max(days, 0))
+    day_amounts = np.bincount(day_index, weights=current['amounts'], minlength=max(days, 0))
+    day_counts = np.bincount(day_index, weights=current['counts'], minlength=max(days, 0))
+
+    daily_stats = {}
+    for i in np.flatnonzero(day_counts):
+        daily_stats[(start_date + timedelta(days=int(i))).isoformat()] = {
+            'quantity': int(day_quantities[i]),
+            'total_amount': day_amounts[i] / 100,
+            'transaction_count': int(day_counts[i])
+        }
+
+    # 支付方式统计
+    payment_stats = _payment_stats(start_date, end_date)
+
+    # 计算增长率（与上一周期对比）
+    growth_rate = 0.0
+    if prev_total_amount > 0:
+        growth_rate = ((total_amount - prev_total_amount) / prev_total_amount) * 100
+
+    # 员工排名
+    employee_ranking = sorted(
+        employee_stats.items(),
+        key=lambda x: x[1]['total_amount'],
+        reverse=True
+    )
+
+    return {
+        'period': {
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'days': days
+        },
+        'summary': {
+            'total_transactions': total_transactions,
+            'total_quantity': total_quantity,
+            'total_amount': total_amount,
+            'avg_daily_amount': total_amount / max(days, 1),
+            'avg_per_transaction': total_amount / max(total_transactions, 1),
+            'growth_rate': round(growth_rate, 2)
+        },
+        'by_employee': dict(employee_stats),
+        'employee_ranking': [{'name': name, 'stats': stats} for name, stats in employee_ranking],
+        'daily_stats': daily_stats,
+        'payment_methods': payment_stats,
+        'trends': {
+            'highest_day': max(daily_stats.items(), key=lambda x: x[1]['total_amount'])[0] if daily_stats else None,
+            'lowest_day': min(daily_stats.items(), key=lambda x: x[1]['total_amount'])[0] if daily_stats else None
+        }
+    }
@@ -15,20 +15,22 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from flask_jwt_extended import jwt_required
 from ai_workflow import get_ai_workflow
-from models import User, Transaction, db
+from models import User, Transaction, Conversation, db
+from sqlalchemy.orm import joinedload
 from datetime import datetime, timedelta
 from dateutil import parser
-import calendar
+import uuid
+import reports
+from config import Config
+from principal import current_principal
 
 ai_bp = Blueprint('ai', __name__)
 
-def execute_api_call(intent: str, parameters: dict, user_id: int):
-    """根据意图执行实际的API调用"""
-    user = User.query.get(user_id)
-    
+def execute_api_call(intent: str, parameters: dict, user):
+    """根据意图执行实际的API调用（user为当前用户，见 principal.current_principal）"""
     # 检查是否为示例账号
     if user and user.is_demo:
         return {'success': False, 'message': '示例账号只能查看，不能进行写操作。请使用实际账号登录。'}
@@ -50,7 +52,7 @@ def execute_api_call(intent: str, parameters: dict, user_id: int):
         return {'success': True, 'data': transaction.to_dict()}
     
     elif intent == 'query_transactions':
-        query = Transaction.query
+        query = Transaction.query.options(joinedload(Transaction.employee))
         if user.role in ['staff', 'worker']:
             query = query.filter(Transaction.employee_id == user.id)
             query = query.filter(Transaction.date == datetime.now().date())
@@ -63,6 +65,7 @@ def execute_api_call(intent: str, parameters: dict, user_id: int):
                 query = query.filter(Transaction.employee_id == parameters['employee_id'])
         
         transactions = query.order_by(Transaction.date.desc()).limit(50).all()
+        Transaction.decrypt_many(transactions)
         return {'success': True, 'data': [t.to_dict() for t in transactions]}
     
     elif intent == 'daily_report':
@@ -72,168 +75,38 @@ def execute_api_call(intent: str, parameters: dict, user_id: int):
                 return {'success': False, 'message': '您只能查看当日数据'}
         
         date_str = parameters.get('date', datetime.now().date().isoformat())
-        query = Transaction.query.filter(Transaction.date == parser.parse(date_str).date())
-        if user.role in ['staff', 'worker']:
-            query = query.filter(Transaction.employee_id == user.id)
-        
-        transactions = query.all()
-        stats = {}
-        total_quantity = 0
-        total_amount = 0.0
-        
-        for t in transactions:
-            emp_name = t.employee.real_name if t.employee else '未知'
-            if emp_name not in stats:
-                stats[emp_name] = {'quantity': 0, 'total_amount': 0.0}
-            stats[emp_name]['quantity'] += t.quantity
-            stats[emp_name]['total_amount'] += float(t.total_amount)
-            total_quantity += t.quantity
-            total_amount += float(t.total_amount)
-        
-        return {
-            'success': True,
-            'data': {
-                'date': date_str,
-                'total_quantity': total_quantity,
-                'total_amount': total_amount,
-                'by_employee': stats
-            }
-        }
+        employee_id = user.id if user.role in ['staff', 'worker'] else None
+        report = reports.daily_report(
+            parser.parse(date_str).date(),
+            employee_id=employee_id,
+            include_transactions=False
+        )
+        return {'success': True, 'data': report}
     
     elif intent == 'weekly_report':
         if user.role in ['staff', 'worker']:
             return {'success': False, 'message': '权限不足'}
         year = int(parameters.get('year', datetime.now().year))
         week = int(parameters.get('week', datetime.now().isocalendar()[1]))
-        
-        # 计算周的开始和结束日期
-        jan1 = datetime(year, 1, 1)
-        days_offset = (jan1.weekday() + 1) % 7
-        first_monday = jan1 - timedelta(days=days_offset)
-        if days_offset > 3:
-            first_monday += timedelta(days=7)
-        start_date = first_monday + timedelta(weeks=week-1)
-        end_date = start_date + timedelta(days=6)
-        
-        transactions = Transaction.query.filter(
-            Transaction.date >= start_date.date(),
-            Transaction.date <= end_date.date()
-        ).all()
-        
-        stats = {}
-        total_quantity = 0
-        total_amount = 0.0
-        
-        for t in transactions:
-            emp_name = t.employee.real_name if t.employee else '未知'
-            if emp_name not in stats:
-                stats[emp_name] = {'quantity': 0, 'total_amount': 0.0}
-            stats[emp_name]['quantity'] += t.quantity
-            stats[emp_name]['total_amount'] += float(t.total_amount)
-            total_quantity += t.quantity
-            total_amount += float(t.total_amount)
-        
-        return {
-            'success': True,
-            'data': {
-                'year': year,
-                'week': week,
-                'start_date': start_date.date().isoformat(),
-                'end_date': end_date.date().isoformat(),
-                'total_quantity': total_quantity,
-                'total_amount': total_amount,
-                'by_employee': stats
-            }
-        }
+        return {'success': True, 'data': reports.weekly_report(year, week)}
     
     elif intent == 'monthly_report':
         if user.role in ['staff', 'worker']:
             return {'success': False, 'message': '权限不足'}
         year = int(parameters.get('year', datetime.now().year))
         month = int(parameters.get('month', datetime.now().month))
-        
-        start_date = datetime(year, month, 1).date()
-        import calendar
-        last_day = calendar.monthrange(year, month)[1]
-        end_date = datetime(year, month, last_day).date()
-        
-        transactions = Transaction.query.filter(
-            Transaction.date >= start_date,
-            Transaction.date <= end_date
-        ).all()
-        
-        stats = {}
-        total_quantity = 0
-        total_amount = 0.0
-        
-        for t in transactions:
-            emp_name = t.employee.real_name if t.employee else '未知'
-            if emp_name not in stats:
-                stats[emp_name] = {'quantity': 0, 'total_amount': 0.0}
-            stats[emp_name]['quantity'] += t.quantity
-            stats[emp_name]['total_amount'] += float(t.total_amount)
-            total_quantity += t.quantity
-            total_amount += float(t.total_amount)
-        
-        days_in_month = (end_date - start_date).days + 1
-        
-        return {
-            'success': True,
-            'data': {
-                'year': year,
-                'month': month,
-                'start_date': start_date.isoformat(),
-                'end_date': end_date.isoformat(),
-                'total_quantity': total_quantity,
-                'total_amount': total_amount,
-                'days_in_month': days_in_month,
-                'by_employee': stats
-            }
-        }
+        return {'success': True, 'data': reports.monthly_report(year, month)}
     
     elif intent == 'yearly_report':
         if user.role in ['staff', 'worker']:
             return {'success': False, 'message': '权限不足'}
         year = int(parameters.get('year', datetime.now().year))
-        
-        start_date = datetime(year, 1, 1).date()
-        end_date = datetime(year, 12, 31).date()
-        
-        transactions = Transaction.query.filter(
-            Transaction.date >= start_date,
-            Transaction.date <= end_date
-        ).all()
-        
-        stats = {}
-        total_quantity = 0
-        total_amount = 0.0
-        
-        for t in transactions:
-            emp_name = t.employee.real_name if t.employee else '未知'
-            if emp_name not in stats:
-                stats[emp_name] = {'quantity': 0, 'total_amount': 0.0}
-            stats[emp_name]['quantity'] += t.quantity
-            stats[emp_name]['total_amount'] += float(t.total_amount)
-            total_quantity += t.quantity
-            total_amount += float(t.total_amount)
-        
-        return {
-            'success': True,
-            'data': {
-                'year': year,
-                'start_date': start_date.isoformat(),
-                'end_date': end_date.isoformat(),
-                'total_quantity': total_quantity,
-                'total_amount': total_amount,
-                'by_employee': stats
-            }
-        }
+        return {'success': True, 'data': reports.yearly_report(year)}
     
     elif intent == 'management_report':
         if user.role != 'manager':
             return {'success': False, 'message': '权限不足'}
         
-        from datetime import timedelta
         start_date_str = parameters.get('start_date')
         end_date_str = parameters.get('end_date')
         
@@ -241,56 +114,9 @@ def execute_api_call(intent: str, parameters: dict, user_id: int):
             start_date = parser.parse(start_date_str).date()
             end_date = parser.parse(end_date_str).date()
         else:
-            end_date = datetime.now().date()
-            start_date = end_date - timedelta(days=30)
-        
-        transactions = Transaction.query.filter(
-            Transaction.date >= start_date,
-            Transaction.date <= end_date
-        ).all()
+            start_date, end_date = reports.default_management_range()
         
-        total_transactions = len(transactions)
-        total_quantity = sum(t.quantity for t in transactions)
-        total_amount = sum(float(t.total_amount) for t in transactions)
-        
-        employee_stats = {}
-        for t in transactions:
-            emp_name = t.employee.real_name if t.employee else '未知'
-            if emp_name not in employee_stats:
-                employee_stats[emp_name] = {
-                    'quantity': 0,
-                    'total_amount': 0.0,
-                    'transaction_count': 0
-                }
-            employee_stats[emp_name]['quantity'] += t.quantity
-            employee_stats[emp_name]['total_amount'] += float(t.total_amount)
-            employee_stats[emp_name]['transaction_count'] += 1
-        
-        for emp_name in employee_stats:
-            if employee_stats[emp_name]['transaction_count'] > 0:
-                employee_stats[emp_name]['avg_per_transaction'] = \
-                    employee_stats[emp_name]['total_amount'] / employee_stats[emp_name]['transaction_count']
-        
-        days = (end_date - start_date).days + 1
-        
-        return {
-            'success': True,
-            'data': {
-                'period': {
-                    'start_date': start_date.isoformat(),
-                    'end_date': end_date.isoformat(),
-                    'days': days
-                },
-                'summary': {
-                    'total_transactions': total_transactions,
-                    'total_quantity': total_quantity,
-                    'total_amount': total_amount,
-                    'avg_daily_amount': total_amount / days if days > 0 else 0,
-                    'avg_per_transaction': total_amount / total_transactions if total_transactions > 0 else 0
-                },
-                'by_employee': employee_stats
-            }
-        }
+        return {'success': True, 'data': reports.management_report(start_date, end_date)}
     
     elif intent == 'employee_list':
         employees = User.query.filter_by(is_active=True).all()
@@ -298,15 +124,69 @@ def execute_api_call(intent: str, parameters: dict, user_id: int):
     
     return {'success': False, 'message': '未知的意图类型'}
 
+def run_intent(result: dict, user):
+    """执行工作流识别出的意图，返回 (api_result, 失败提示)；闲聊或未识别的意图返回 (None, None)"""
+    intent = result.get('intent', 'unknown')
+    if intent in ['unknown', 'chat', 'security_blocked']:
+        return None, None
+    
+    parameters = result.get('parameters', {})
+    
+    # 强制权限检查：普通工人和前台员工只能操作自己的数据
+    if user.role in ['staff', 'worker']:
+        parameters['employee_id'] = user.id
+        # 限制日期为今天
+        if 'date' not in parameters:
+            parameters['date'] = datetime.now().date().isoformat()
+    
+    # 执行API调用
+    api_result = execute_api_call(intent, parameters, user)
+    if api_result.get('success'):
+        return api_result, None
+    return None, api_result.get('message', '操作失败')
+
+def load_conversation(conversation_id, user) -> Conversation:
+    """取出当前用户的对话；未指定、已被清理或不属于当前用户时新建一个（由调用方提交事务）
+    
+    新建对话时顺便清理该用户长期不活跃的对话。
+    """
+    if conversation_id:
+        conversation = Conversation.query.filter_by(id=str(conversation_id), user_id=user.id).first()
+        if conversation is not None:
+            return conversation
+    
+    Conversation.query.filter(
+        Conversation.user_id == user.id,
+        Conversation.updated_at < datetime.utcnow() - timedelta(days=Config.AI_CONVERSATION_DAYS)
+    ).delete(synchronize_session=False)
+    conversation = Conversation(id=str(uuid.uuid4()), user_id=user.id)
+    db.session.add(conversation)
+    return conversation
+
+def save_turn(conversation: Conversation, user_input: str, response_text: str):
+    """把一问一答追加到对话并提交"""
+    conversation.append(
+        [{'role': 'user', 'content': user_input}, {'role': 'assistant', 'content': response_text}],
+        window=Config.AI_CONVERSATION_WINDOW,
+        summary_chars=Config.AI_CONVERSATION_SUMMARY_CHARS
+    )
+    db.session.commit()
+
+def sse_event(event: str, data) -> str:
+    """格式化一条Server-Sent Events事件（数据为单行JSON）"""
+    return f"event: {event}\ndata: {current_app.json.dumps(data, ensure_ascii=False)}\n\n"
+
 @ai_bp.route('/chat', methods=['POST'])
 @jwt_required()
 def chat():
-    """AI对话接口"""
+    """AI对话接口
+    
+    请求只需带 message 和 conversation_id（首次对话不带，由响应返回），对话历史保存在服务端（见 models.Conversation）。
+    """
     try:
-        user_id = get_jwt_identity()
+        user = current_principal()
         data = request.get_json()
         user_input = data.get('message', '')
-        history = data.get('history', [])
         
         if not user_input:
             return jsonify({'error': '消息不能为空'}), 400
@@ -320,52 +200,147 @@ def chat():
                 'response': '抱歉，AI功能暂时不可用。请检查API配置或联系管理员。'
             }), 500
         
+        conversation = load_conversation(data.get('conversation_id'), user)
+        
         # 处理用户输入（传入用户角色和ID用于权限检查）
         result = workflow.process(
             user_input, 
-            history,
+            conversation.history(),
             user_role=user.role,
             user_id=user.id
         )
         
         # 检查是否被安全防护拦截
         if result.get('intent') == 'security_blocked':
+            response_text = result.get('error', '操作被安全系统拦截')
+            save_turn(conversation, user_input, response_text)
             return jsonify({
-                'response': result.get('error', '操作被安全系统拦截'),
-                'messages': result.get('messages', []),
+                'response': response_text,
+                'conversation_id': conversation.id,
                 'intent': 'security_blocked',
                 'api_result': None
             }), 403
         
         # 如果识别到具体意图，尝试执行实际功能
         intent = result.get('intent', 'unknown')
-        if intent != 'unknown' and intent != 'chat' and intent != 'security_blocked':
-            parameters = result.get('parameters', {})
-            
-            # 强制权限检查：普通工人和前台员工只能操作自己的数据
-            if user.role in ['staff', 'worker']:
-                parameters['employee_id'] = user.id
-                # 限制日期为今天
-                if 'date' not in parameters:
-                    from datetime import datetime
-                    parameters['date'] = datetime.now().date().isoformat()
-            
-            # 执行API调用
-            api_result = execute_api_call(intent, parameters, user_id)
-            if api_result.get('success'):
-                # 将API结果整合到响应中
-                result['api_result'] = api_result
-            else:
-                # API调用失败，返回错误信息
-                result['response'] = api_result.get('message', '操作失败')
+        api_result, error_message = run_intent(result, user)
+        if error_message:
+            # API调用失败，返回错误信息
+            result['response'] = error_message
+        
+        save_turn(conversation, user_input, result.get('response', ''))
         
         return jsonify({
             'response': result.get('response', ''),
-            'messages': result.get('messages', []),
+            'conversation_id': conversation.id,
             'intent': intent,
-            'api_result': result.get('api_result')
+            'api_result': api_result
         }), 200
         
     except Exception as e:
         return jsonify({'error': f'处理请求时出错: {str(e)}'}), 500
 
+@ai_bp.route('/chat/stream', methods=['POST'])
+@jwt_required()
+def chat_stream():
+    """AI对话接口（流式，Server-Sent Events）
+    
+    请求参数与 /chat 相同。意图识别和数据查询完成后立即返回，回复文本边生成边发送，事件依次为：
+    meta（intent、conversation_id）、api_result（识别到具体意图且执行成功时）、token（回复片段，多次）、
+    done（完整回复）；生成过程中出错时发送 error，这一轮对话不保存。
+    参数错误、AI未初始化或被安全防护拦截时与 /chat 一样直接返回JSON。
+    """
+    try:
+        user = current_principal()
+        data = request.get_json()
+        user_input = data.get('message', '')
+        
+        if not user_input:
+            return jsonify({'error': '消息不能为空'}), 400
+        
+        workflow = get_ai_workflow()
+        
+        if not workflow:
+            return jsonify({
+                'error': 'AI工作流未初始化，请检查AI API配置',
+                'response': '抱歉，AI功能暂时不可用。请检查API配置或联系管理员。'
+            }), 500
+        
+        conversation = load_conversation(data.get('conversation_id'), user)
+        state = workflow.prepare(user_input, conversation.history(), user_role=user.role, user_id=user.id)
+        intent = state.get('intent', 'unknown')
+        
+        if intent == 'security_blocked':
+            response_text = state.get('error', '操作被安全系统拦截')
+            save_turn(conversation, user_input, response_text)
+            return jsonify({
+                'response': response_text,
+                'conversation_id': conversation.id,
+                'intent': 'security_blocked',
+                'api_result': None
+            }), 403
+        
+        # 在开始输出前执行数据查询，结果作为第一批事件发送
+        api_result, error_message = run_intent(state, user)
+        
+    except Exception as e:
+        return jsonify({'error': f'处理请求时出错: {str(e)}'}), 500
+    
+    def generate():
+        yield sse_event('meta', {'intent': intent, 'conversation_id': conversation.id})
+        if api_result:
+            yield sse_event('api_result', api_result)
+        
+        chunks = []
+        try:
+            # 数据操作失败时直接返回失败原因，不再调用AI生成回复
+            for text in ([error_message] if error_message else workflow.stream_response(state)):
+                chunks.append(text)
+                yield sse_event('token', {'text': text})
+        except Exception as e:
+            yield sse_event('error', {'error': f'生成回复时出错: {str(e)}'})
+            return
+        
+        response_text = ''.join(chunks)
+        try:
+            save_turn(conversation, user_input, response_text)
+        except Exception as e:
+            db.session.rollback()
+            yield sse_event('error', {'error': f'保存对话时出错: {str(e)}'})
+            return
+        yield sse_event('done', {
+            'response': response_text,
+            'conversation_id': conversation.id,
+            'intent': intent
+        })
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # 关闭nginx代理缓冲，逐段转发给客户端
+        }
+    )
+
+
+@ai_bp.route('/health', methods=['GET'])
+@jwt_required()
+def provider_health():
+    """AI服务健康状态（熔断状态、失败率、P50/P95耗时及回复缓存命中率，仅店长可用）"""
+    try:
+        user = current_principal()
+        
+        if user.role != 'manager':
+            return jsonify({'error': '权限不足'}), 403
+        
+        workflow = get_ai_workflow()
+        if not workflow:
+            return jsonify({'error': 'AI工作流未初始化，请检查AI API配置'}), 500
+        
+        stats = workflow.router.stats()
+        stats['response_cache'] = workflow.response_cache.stats()
+        return jsonify(stats), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
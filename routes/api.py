@@ -16,20 +16,31 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, User, Transaction
-from datetime import datetime, timedelta
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from flask_jwt_extended import jwt_required
+from models import db, User, Transaction, DateVersion, TableVersion
+from sqlalchemy import or_, and_, select
+from sqlalchemy.orm import load_only, joinedload
+from datetime import datetime
+import base64
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
 from dateutil import parser
-import calendar
-from collections import defaultdict
+import reports
+import transaction_import
+from report_cache import report_cache
+from principal import current_principal
+from config import Config
 
 api_bp = Blueprint('api', __name__)
 
 def get_current_user():
-    """获取当前用户"""
-    user_id = get_jwt_identity()
-    return User.query.get(user_id)
+    """获取当前用户（角色和示例账号标记来自JWT声明，不查询数据库）"""
+    return current_principal()
 
 def check_permission(user, required_role=None):
     """检查权限"""
@@ -49,6 +60,157 @@ def check_demo_account(user):
         return jsonify({'error': '示例账号只能查看，不能进行写操作。请使用实际账号登录。'}), 403
     return None
 
+def data_version(start_date=None, end_date=None) -> tuple:
+    """日期范围内流水数据和用户表的版本号（用于生成ETag，不需要生成响应内容）"""
+    return DateVersion.range_fingerprint(start_date, end_date), TableVersion.current('users')
+
+def conditional_json(user, version, build, period_end=None):
+    """支持条件GET的JSON响应
+    
+    ETag由请求地址、用户和数据版本号计算，与If-None-Match一致时直接返回304，不调用build生成内容。
+    period_end早于今天（已结束的周期）时允许浏览器在CLOSED_PERIOD_MAX_AGE秒内直接使用缓存，否则每次都需验证。
+    """
+    etag = hashlib.sha1(
+        json.dumps([request.full_path, user.id, user.role, version], default=str).encode()
+    ).hexdigest()
+    
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    
+    if period_end is not None and period_end < datetime.now().date():
+        response.headers['Cache-Control'] = f'private, max-age={Config.CLOSED_PERIOD_MAX_AGE}'
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def parse_transaction_fields():
+    """解析fields/view查询参数，返回需要输出的字段列表
+    
+    fields=date,quantity 指定字段；view=summary|full 使用预定义视图；都未指定时返回全部字段。
+    参数无效时抛出ValueError。
+    """
+    fields_param = request.args.get('fields')
+    view = request.args.get('view')
+    
+    if fields_param:
+        fields = list(dict.fromkeys(f.strip() for f in fields_param.split(',') if f.strip()))
+        unknown = [f for f in fields if f not in Transaction.FIELD_COLUMNS]
+        if unknown:
+            raise ValueError(f"未知字段: {', '.join(unknown)}")
+        return fields
+    
+    if view:
+        if view not in Transaction.FIELD_VIEWS:
+            raise ValueError(f'未知视图: {view}')
+        return Transaction.FIELD_VIEWS[view]
+    
+    return Transaction.FIELD_VIEWS['full']
+
+def transaction_load_options(fields, extra_columns=()):
+    """根据输出字段生成查询选项：只加载需要的列，需要员工姓名时才关联员工表"""
+    columns = {'id', 'employee_id', *extra_columns}  # 权限检查需要employee_id
+    for field in fields:
+        columns.update(Transaction.FIELD_COLUMNS[field])
+    
+    options = [load_only(*[getattr(Transaction, column) for column in columns])]
+    if 'employee_name' in fields:
+        options.append(joinedload(Transaction.employee).load_only(User.real_name))
+    return options
+
+def encode_cursor(transaction):
+    """生成翻页游标（按 date, created_at, id 定位，对客户端不透明）"""
+    key = [
+        transaction.date.isoformat(),
+        transaction.created_at.isoformat() if transaction.created_at else None,
+        transaction.id
+    ]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """解析翻页游标，返回 (date, created_at, id)；游标无效时抛出ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date_str, created_at_str, last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return (
+            datetime.fromisoformat(date_str).date(),
+            datetime.fromisoformat(created_at_str) if created_at_str else None,
+            int(last_id)
+        )
+    except Exception:
+        raise ValueError('无效的翻页游标')
+
+def after_cursor(query, cursor_key):
+    """只保留排在游标之后的记录（排序为 date DESC, created_at DESC, id DESC）"""
+    cursor_date, cursor_created_at, cursor_id = cursor_key
+    if cursor_created_at is None:
+        return query.filter(or_(
+            Transaction.date < cursor_date,
+            and_(Transaction.date == cursor_date, Transaction.id < cursor_id)
+        ))
+    return query.filter(or_(
+        Transaction.date < cursor_date,
+        and_(Transaction.date == cursor_date, Transaction.created_at < cursor_created_at),
+        and_(
+            Transaction.date == cursor_date,
+            Transaction.created_at == cursor_created_at,
+            Transaction.id < cursor_id
+        )
+    ))
+
+def validate_transaction_input(data, user, find_employee):
+    """校验一条流水录入数据
+    
+    find_employee: 按员工ID查找员工的函数（单条录入直接查库，批量录入使用预加载的员工表）
+    返回 (记录字段, None)，校验失败时返回 (None, (错误信息, 状态码))
+    """
+    date_str = data.get('date')
+    employee_id = data.get('employee_id')
+    quantity = data.get('quantity')
+    total_amount = data.get('total_amount')
+    amount_details = data.get('amount_details', '')
+    
+    # 验证数据
+    if not all([date_str, employee_id, quantity is not None, total_amount is not None]):
+        return None, ('日期、员工、数量、总金额不能为空', 400)
+    
+    # 验证员工是否存在
+    employee = find_employee(employee_id)
+    if not employee:
+        return None, ('员工不存在', 404)
+    
+    # 解析日期
+    try:
+        date = parser.parse(date_str).date()
+    except:
+        return None, ('日期格式错误', 400)
+    
+    try:
+        quantity = int(quantity)
+        total_amount = float(total_amount)
+    except (TypeError, ValueError):
+        return None, ('数量或总金额格式错误', 400)
+    
+    # 权限检查：
+    # - 普通工人只能录入自己的数据，且只能录入当日数据
+    # - 前台员工和店长可以为任意员工录入数据，且可以选择任意日期
+    if user.role == 'worker':
+        if employee.id != user.id:
+            return None, ('您只能录入自己的数据', 403)
+        if date != datetime.now().date():
+            return None, ('您只能录入当日数据', 403)
+    # 店长和前台员工可以为任意员工录入任意日期的数据
+    
+    return {
+        'date': date,
+        'employee_id': employee.id,
+        'quantity': quantity,
+        'total_amount': total_amount,
+        'amount_details': amount_details or ''
+    }, None
+
 @api_bp.route('/transactions', methods=['POST'])
 @jwt_required()
 def create_transaction():
@@ -61,46 +223,18 @@ def create_transaction():
         if demo_check:
             return demo_check
         
-        data = request.get_json()
-        date_str = data.get('date')
-        employee_id = data.get('employee_id')
-        quantity = data.get('quantity')
-        total_amount = data.get('total_amount')
-        amount_details = data.get('amount_details', '')
-        
-        # 验证数据
-        if not all([date_str, employee_id, quantity is not None, total_amount is not None]):
-            return jsonify({'error': '日期、员工、数量、总金额不能为空'}), 400
-        
-        # 验证员工是否存在
-        employee = User.query.get(employee_id)
-        if not employee:
-            return jsonify({'error': '员工不存在'}), 404
-        
-        # 解析日期
-        try:
-            date = parser.parse(date_str).date()
-        except:
-            return jsonify({'error': '日期格式错误'}), 400
-        
-        # 权限检查：
-        # - 普通工人只能录入自己的数据，且只能录入当日数据
-        # - 前台员工和店长可以为任意员工录入数据，且可以选择任意日期
-        if user.role == 'worker':
-            if employee_id != user.id:
-                return jsonify({'error': '您只能录入自己的数据'}), 403
-            if date != datetime.now().date():
-                return jsonify({'error': '您只能录入当日数据'}), 403
-        # 店长和前台员工可以为任意员工录入任意日期的数据
+        values, error = validate_transaction_input(request.get_json() or {}, user, User.query.get)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
         
         # 创建记录
         transaction = Transaction(
-            date=date,
-            employee_id=employee_id,
-            quantity=int(quantity),
-            total_amount=float(total_amount)
+            date=values['date'],
+            employee_id=values['employee_id'],
+            quantity=values['quantity'],
+            total_amount=values['total_amount']
         )
-        transaction.set_amount_details(amount_details)
+        transaction.set_amount_details(values['amount_details'])
         
         db.session.add(transaction)
         db.session.commit()
@@ -114,10 +248,228 @@ def create_transaction():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+# 批量录入单次最多的记录数
+BULK_MAX_ROWS = 1000
+
+@api_bp.route('/transactions/bulk', methods=['POST'])
+@jwt_required()
+def bulk_create_transactions():
+    """批量创建流水记录
+    
+    请求体: {"transactions": [{date, employee_id, quantity, total_amount, amount_details}, ...]}
+    全部记录在同一个事务中写入；任意一条校验失败时不写入任何数据，返回逐条的校验结果。
+    """
+    try:
+        user = get_current_user()
+        
+        # 检查是否为示例账号
+        demo_check = check_demo_account(user)
+        if demo_check:
+            return demo_check
+        
+        data = request.get_json() or {}
+        items = data.get('transactions')
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': '请提供要录入的流水记录列表'}), 400
+        if len(items) > BULK_MAX_ROWS:
+            return jsonify({'error': f'单次最多录入 {BULK_MAX_ROWS} 条记录'}), 400
+        
+        # 一次查询预加载涉及的全部员工
+        employee_ids = {
+            item.get('employee_id') for item in items
+            if isinstance(item, dict) and isinstance(item.get('employee_id'), (int, str))
+        }
+        employees = {
+            employee.id: employee
+            for employee in User.query.options(load_only(User.id)).filter(User.id.in_(employee_ids))
+        }
+        
+        def find_employee(employee_id):
+            if not isinstance(employee_id, (int, str)) or not str(employee_id).isdigit():
+                return None
+            return employees.get(int(employee_id))
+        
+        rows = []
+        results = []
+        for index, item in enumerate(items):
+            if isinstance(item, dict):
+                values, error = validate_transaction_input(item, user, find_employee)
+            else:
+                values, error = None, ('数据格式错误', 400)
+            if error:
+                results.append({'index': index, 'success': False, 'error': error[0]})
+            else:
+                rows.append(values)
+                results.append({'index': index, 'success': True})
+        
+        failed = len(items) - len(rows)
+        if failed:
+            return jsonify({
+                'error': f'{failed} 条记录校验失败，未录入任何数据',
+                'results': results
+            }), 400
+        
+        Transaction.bulk_insert(db.session.connection(), rows)
+        db.session.commit()
+        
+        return jsonify({
+            'message': f'成功录入 {len(rows)} 条流水记录',
+            'created': len(rows),
+            'results': results
+        }), 201
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/transactions/import', methods=['POST'])
+@jwt_required()
+def import_transactions():
+    """从上传的CSV/Excel文件导入流水记录（仅店长）
+    
+    文件按内容保存，导入中断后重新上传同一文件会从上次提交的位置继续，
+    已导入完成的文件不会重复导入；同一文件正在导入时返回409。大文件建议在服务器上使用 import_transactions.py。
+    """
+    try:
+        user = get_current_user()
+        
+        # 检查是否为示例账号
+        demo_check = check_demo_account(user)
+        if demo_check:
+            return demo_check
+        
+        if user.role != 'manager':
+            return jsonify({'error': '权限不足'}), 403
+        
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            return jsonify({'error': '请上传要导入的文件'}), 400
+        extension = os.path.splitext(upload.filename)[1].lower()
+        if extension not in ('.csv',) + transaction_import.EXCEL_EXTENSIONS:
+            return jsonify({'error': '只支持CSV和Excel（.xlsx）文件'}), 400
+        
+        # 边保存边计算内容摘要，同一文件总是保存到同一路径，以便断点续传
+        folder = current_app.config['IMPORT_FOLDER']
+        os.makedirs(folder, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=folder, suffix='.upload')
+        with os.fdopen(fd, 'wb') as f:
+            for block in iter(lambda: upload.stream.read(1024 * 1024), b''):
+                digest.update(block)
+                f.write(block)
+        path = os.path.join(folder, digest.hexdigest() + extension)
+        if os.path.exists(path):
+            # 内容相同的文件已存在（可能正在导入），不覆盖
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, path)
+        
+        try:
+            result = transaction_import.import_file(path)
+        except transaction_import.ImportInProgress as e:
+            return jsonify({'error': str(e)}), 409
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'message': f"导入完成：导入 {result['imported']} 条，失败 {result['rejected']} 条",
+            'rows': result['rows_done'],
+            'imported': result['imported'],
+            'rejected': result['rejected'],
+            'errors': result.get('error_samples', [])
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+# 导出时每批读取和解密的记录数
+EXPORT_BATCH_SIZE = 1000
+
+@api_bp.route('/transactions/export', methods=['GET'])
+@jwt_required()
+def export_transactions():
+    """导出流水记录（仅店长）
+    
+    format=csv|ndjson，支持与列表相同的 start_date、end_date、employee_id、fields/view 参数。
+    使用服务端游标分批读取、解密并边生成边发送，导出数据量再大内存占用也保持不变。
+    """
+    try:
+        user = get_current_user()
+        
+        if user.role != 'manager':
+            return jsonify({'error': '权限不足'}), 403
+        
+        export_format = request.args.get('format', 'csv')
+        if export_format not in ('csv', 'ndjson'):
+            return jsonify({'error': '只支持csv和ndjson格式'}), 400
+        
+        try:
+            fields = parse_transaction_fields()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        query = select(Transaction).options(*transaction_load_options(fields))
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        employee_id = request.args.get('employee_id')
+        if start_date:
+            query = query.where(Transaction.date >= parser.parse(start_date).date())
+        if end_date:
+            query = query.where(Transaction.date <= parser.parse(end_date).date())
+        if employee_id:
+            query = query.where(Transaction.employee_id == int(employee_id))
+        query = query.order_by(Transaction.date, Transaction.created_at, Transaction.id)
+        
+        # yield_per 会启用服务端游标（stream_results），按批从数据库取数据
+        query = query.execution_options(yield_per=EXPORT_BATCH_SIZE)
+        
+        def generate():
+            if export_format == 'csv':
+                # BOM让Excel正确识别UTF-8中文
+                yield '\ufeff' + ','.join(fields) + '\r\n'
+            
+            for batch in db.session.execute(query).scalars().partitions():
+                if 'amount_details' in fields:
+                    Transaction.decrypt_many(batch)
+                
+                buffer = io.StringIO()
+                if export_format == 'csv':
+                    writer = csv.writer(buffer)
+                    for t in batch:
+                        record = t.to_dict(fields)
+                        writer.writerow([record[field] for field in fields])
+                else:
+                    for t in batch:
+                        buffer.write(json.dumps(t.to_dict(fields), ensure_ascii=False))
+                        buffer.write('\n')
+                yield buffer.getvalue()
+                
+                # 已输出的记录不再需要，从会话中移除以保持内存占用不变
+                for t in batch:
+                    db.session.expunge(t)
+        
+        filename = f"transactions_{datetime.now().strftime('%Y%m%d%H%M%S')}.{export_format}"
+        mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+        return Response(
+            stream_with_context(generate()),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @api_bp.route('/transactions', methods=['GET'])
 @jwt_required()
 def get_transactions():
-    """获取流水记录列表"""
+    """获取流水记录列表
+    
+    支持两种分页方式：
+    - 页码分页（默认）：page、per_page，返回total和pages
+    - 游标分页：传入cursor参数（首页传空值），返回next_cursor，深度翻页不会变慢
+    include_total=false 时不统计总数（游标分页默认不统计）
+    """
     try:
         user = get_current_user()
         
@@ -127,9 +479,28 @@ def get_transactions():
         employee_id = request.args.get('employee_id')
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 50))
+        cursor = request.args.get('cursor')
+        use_cursor = cursor is not None
+        include_total = request.args.get('include_total', 'false' if use_cursor else 'true').lower() == 'true'
         
-        # 构建查询
-        query = Transaction.query
+        try:
+            fields = parse_transaction_fields()
+            cursor_key = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # 数据版本范围：前台员工和普通工人只能查看当日数据
+        if user.role in ['staff', 'worker']:
+            version_range = (datetime.now().date(), datetime.now().date())
+        else:
+            version_range = (
+                parser.parse(start_date).date() if start_date else None,
+                parser.parse(end_date).date() if end_date else None
+            )
+        
+        # 构建查询（只加载请求字段所需的列；游标分页还需要排序键）
+        extra_columns = ('date', 'created_at') if use_cursor else ()
+        query = Transaction.query.options(*transaction_load_options(fields, extra_columns))
         
         # 权限过滤：前台员工和普通工人只能查看当日自己的数据
         if user.role in ['staff', 'worker']:
@@ -144,20 +515,44 @@ def get_transactions():
             if employee_id:
                 query = query.filter(Transaction.employee_id == int(employee_id))
         
-        # 分页
-        pagination = query.order_by(Transaction.date.desc(), Transaction.created_at.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
+        ordered = query.order_by(
+            Transaction.date.desc(), Transaction.created_at.desc(), Transaction.id.desc()
         )
         
-        transactions = [t.to_dict() for t in pagination.items]
+        # 数据未变化时直接返回304，不执行分页查询
+        def build():
+            if use_cursor:
+                # 游标分页：WHERE (date, created_at, id) < 游标 ORDER BY ... LIMIT，无需OFFSET
+                page_query = after_cursor(ordered, cursor_key) if cursor_key else ordered
+                items = page_query.limit(per_page + 1).all()
+                has_more = len(items) > per_page
+                items = items[:per_page]
+                result = {
+                    'per_page': per_page,
+                    'next_cursor': encode_cursor(items[-1]) if has_more else None
+                }
+                if include_total:
+                    result['total'] = query.order_by(None).count()
+            else:
+                # 页码分页（兼容原有前端）
+                pagination = ordered.paginate(
+                    page=page, per_page=per_page, error_out=False, count=include_total
+                )
+                items = pagination.items
+                result = {
+                    'total': pagination.total,
+                    'page': page,
+                    'per_page': per_page,
+                    'pages': pagination.pages if include_total else None
+                }
+            
+            if 'amount_details' in fields:
+                Transaction.decrypt_many(items)
+            result['transactions'] = [t.to_dict(fields) for t in items]
+            
+            return result
         
-        return jsonify({
-            'transactions': transactions,
-            'total': pagination.total,
-            'page': page,
-            'per_page': per_page,
-            'pages': pagination.pages
-        }), 200
+        return conditional_json(user, data_version(*version_range), build)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -168,13 +563,19 @@ def get_transaction(transaction_id):
     """获取单条流水记录"""
     try:
         user = get_current_user()
-        transaction = Transaction.query.get_or_404(transaction_id)
+        
+        try:
+            fields = parse_transaction_fields()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        transaction = Transaction.query.options(*transaction_load_options(fields)).get_or_404(transaction_id)
         
         # 权限检查：普通工人和前台员工只能查看自己的数据
         if user.role in ['staff', 'worker'] and transaction.employee_id != user.id:
             return jsonify({'error': '权限不足'}), 403
         
-        return jsonify({'transaction': transaction.to_dict()}), 200
+        return jsonify({'transaction': transaction.to_dict(fields)}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -262,55 +663,16 @@ def get_daily_report():
         except:
             return jsonify({'error': '日期格式错误'}), 400
         
-        # 权限检查：普通工人和前台员工只能查看当日数据
+        # 权限检查：普通工人和前台员工只能查看当日自己的数据
         if user.role in ['staff', 'worker'] and target_date != datetime.now().date():
             return jsonify({'error': '您只能查看当日数据'}), 403
+        employee_id = user.id if user.role in ['staff', 'worker'] else None
         
-        # 查询数据
-        query = Transaction.query.filter(Transaction.date == target_date)
-        if user.role in ['staff', 'worker']:
-            query = query.filter(Transaction.employee_id == user.id)
-        
-        transactions = query.all()
-        
-        # 统计
-        stats = defaultdict(lambda: {'quantity': 0, 'total_amount': 0.0, 'transactions': []})
-        
-        for t in transactions:
-            emp_name = t.employee.real_name if t.employee else '未知'
-            stats[emp_name]['quantity'] += t.quantity
-            stats[emp_name]['total_amount'] += float(t.total_amount)
-            stats[emp_name]['transactions'].append(t.to_dict())
-        
-        # 支付方式统计
-        payment_stats = defaultdict(float)
-        for t in transactions:
-            details = t.get_amount_details()
-            if details:
-                # 解析金额明细：微信80, 支付宝100
-                parts = details.split(',')
-                for part in parts:
-                    part = part.strip()
-                    if '微信' in part or '支付宝' in part or '现金' in part:
-                        try:
-                            amount = float(''.join(filter(str.isdigit or str == '.', part)))
-                            payment_type = '微信' if '微信' in part else ('支付宝' if '支付宝' in part else '现金')
-                            payment_stats[payment_type] += amount
-                        except:
-                            pass
-        
-        result = {
-            'date': target_date.isoformat(),
-            'summary': {
-                'total_quantity': sum(s['quantity'] for s in stats.values()),
-                'total_amount': sum(s['total_amount'] for s in stats.values()),
-                'employee_count': len(stats)
-            },
-            'by_employee': dict(stats),
-            'payment_methods': dict(payment_stats)
-        }
-        
-        return jsonify(result), 200
+        return conditional_json(
+            user, data_version(target_date, target_date),
+            lambda: reports.daily_report(target_date, employee_id=employee_id),
+            period_end=target_date
+        )
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -328,45 +690,13 @@ def get_weekly_report():
         
         year = int(request.args.get('year', datetime.now().year))
         week = int(request.args.get('week', datetime.now().isocalendar()[1]))
+        start_date, end_date = reports.week_range(year, week)
         
-        # 计算周的开始和结束日期
-        # 使用ISO周计算
-        jan1 = datetime(year, 1, 1)
-        days_offset = (jan1.weekday() + 1) % 7  # 转换为ISO周（周一是0）
-        first_monday = jan1 - timedelta(days=days_offset)
-        if days_offset > 3:  # 如果1月1日是在周四之后，则第一周是下一周
-            first_monday += timedelta(days=7)
-        start_date = first_monday + timedelta(weeks=week-1)
-        end_date = start_date + timedelta(days=6)
-        
-        # 查询数据
-        transactions = Transaction.query.filter(
-            Transaction.date >= start_date,
-            Transaction.date <= end_date
-        ).all()
-        
-        # 统计
-        stats = defaultdict(lambda: {'quantity': 0, 'total_amount': 0.0})
-        
-        for t in transactions:
-            emp_name = t.employee.real_name if t.employee else '未知'
-            stats[emp_name]['quantity'] += t.quantity
-            stats[emp_name]['total_amount'] += float(t.total_amount)
-        
-        result = {
-            'year': year,
-            'week': week,
-            'start_date': start_date.isoformat(),
-            'end_date': end_date.isoformat(),
-            'summary': {
-                'total_quantity': sum(s['quantity'] for s in stats.values()),
-                'total_amount': sum(s['total_amount'] for s in stats.values()),
-                'employee_count': len(stats)
-            },
-            'by_employee': dict(stats)
-        }
-        
-        return jsonify(result), 200
+        return conditional_json(
+            user, data_version(start_date, end_date),
+            lambda: reports.weekly_report(year, week),
+            period_end=end_date
+        )
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -384,46 +714,13 @@ def get_monthly_report():
         
         year = int(request.args.get('year', datetime.now().year))
         month = int(request.args.get('month', datetime.now().month))
+        start_date, end_date = reports.month_range(year, month)
         
-        # 计算月的开始和结束日期
-        start_date = datetime(year, month, 1).date()
-        last_day = calendar.monthrange(year, month)[1]
-        end_date = datetime(year, month, last_day).date()
-        
-        # 查询数据
-        transactions = Transaction.query.filter(
-            Transaction.date >= start_date,
-            Transaction.date <= end_date
-        ).all()
-        
-        # 统计
-        stats = defaultdict(lambda: {'quantity': 0, 'total_amount': 0.0, 'daily_avg': 0.0})
-        
-        for t in transactions:
-            emp_name = t.employee.real_name if t.employee else '未知'
-            stats[emp_name]['quantity'] += t.quantity
-            stats[emp_name]['total_amount'] += float(t.total_amount)
-        
-        # 计算日均
-        days_in_month = (end_date - start_date).days + 1
-        for emp_name in stats:
-            stats[emp_name]['daily_avg'] = stats[emp_name]['total_amount'] / days_in_month
-        
-        result = {
-            'year': year,
-            'month': month,
-            'start_date': start_date.isoformat(),
-            'end_date': end_date.isoformat(),
-            'summary': {
-                'total_quantity': sum(s['quantity'] for s in stats.values()),
-                'total_amount': sum(s['total_amount'] for s in stats.values()),
-                'employee_count': len(stats),
-                'days_in_month': days_in_month
-            },
-            'by_employee': dict(stats)
-        }
-        
-        return jsonify(result), 200
+        return conditional_json(
+            user, data_version(start_date, end_date),
+            lambda: reports.monthly_report(year, month),
+            period_end=end_date
+        )
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -440,50 +737,13 @@ def get_yearly_report():
             return jsonify({'error': '权限不足'}), 403
         
         year = int(request.args.get('year', datetime.now().year))
+        start_date, end_date = reports.year_range(year)
         
-        # 查询数据
-        start_date = datetime(year, 1, 1).date()
-        end_date = datetime(year, 12, 31).date()
-        
-        transactions = Transaction.query.filter(
-            Transaction.date >= start_date,
-            Transaction.date <= end_date
-        ).all()
-        
-        # 统计
-        stats = defaultdict(lambda: {
-            'quantity': 0,
-            'total_amount': 0.0,
-            'monthly_stats': defaultdict(lambda: {'quantity': 0, 'total_amount': 0.0})
-        })
-        
-        for t in transactions:
-            emp_name = t.employee.real_name if t.employee else '未知'
-            stats[emp_name]['quantity'] += t.quantity
-            stats[emp_name]['total_amount'] += float(t.total_amount)
-            
-            # 月度统计
-            month = t.date.month
-            stats[emp_name]['monthly_stats'][month]['quantity'] += t.quantity
-            stats[emp_name]['monthly_stats'][month]['total_amount'] += float(t.total_amount)
-        
-        # 转换月度统计为字典
-        for emp_name in stats:
-            stats[emp_name]['monthly_stats'] = dict(stats[emp_name]['monthly_stats'])
-        
-        result = {
-            'year': year,
-            'start_date': start_date.isoformat(),
-            'end_date': end_date.isoformat(),
-            'summary': {
-                'total_quantity': sum(s['quantity'] for s in stats.values()),
-                'total_amount': sum(s['total_amount'] for s in stats.values()),
-                'employee_count': len(stats)
-            },
-            'by_employee': dict(stats)
-        }
-        
-        return jsonify(result), 200
+        return conditional_json(
+            user, data_version(start_date, end_date),
+            lambda: reports.yearly_report(year),
+            period_end=end_date
+        )
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -507,110 +767,29 @@ def get_management_report():
             end_date = parser.parse(end_date_str).date()
         else:
             # 默认查询最近30天
-            end_date = datetime.now().date()
-            start_date = end_date - timedelta(days=30)
-        
-        # 查询数据
-        transactions = Transaction.query.filter(
-            Transaction.date >= start_date,
-            Transaction.date <= end_date
-        ).all()
-        
-        # 基础统计
-        total_transactions = len(transactions)
-        total_quantity = sum(t.quantity for t in transactions)
-        total_amount = sum(float(t.total_amount) for t in transactions)
-        
-        # 按员工统计
-        employee_stats = defaultdict(lambda: {
-            'quantity': 0,
-            'total_amount': 0.0,
-            'transaction_count': 0,
-            'avg_per_transaction': 0.0
-        })
-        
-        for t in transactions:
-            emp_name = t.employee.real_name if t.employee else '未知'
-            employee_stats[emp_name]['quantity'] += t.quantity
-            employee_stats[emp_name]['total_amount'] += float(t.total_amount)
-            employee_stats[emp_name]['transaction_count'] += 1
-        
-        # 计算平均单笔金额
-        for emp_name in employee_stats:
-            if employee_stats[emp_name]['transaction_count'] > 0:
-                employee_stats[emp_name]['avg_per_transaction'] = \
-                    employee_stats[emp_name]['total_amount'] / employee_stats[emp_name]['transaction_count']
-        
-        # 按日期统计
-        daily_stats = defaultdict(lambda: {'quantity': 0, 'total_amount': 0.0, 'transaction_count': 0})
-        for t in transactions:
-            date_str = t.date.isoformat()
-            daily_stats[date_str]['quantity'] += t.quantity
-            daily_stats[date_str]['total_amount'] += float(t.total_amount)
-            daily_stats[date_str]['transaction_count'] += 1
-        
-        # 支付方式统计
-        payment_stats = defaultdict(float)
-        for t in transactions:
-            details = t.get_amount_details()
-            if details:
-                parts = details.split(',')
-                for part in parts:
-                    part = part.strip()
-                    if '微信' in part or '支付宝' in part or '现金' in part:
-                        try:
-                            amount = float(''.join(filter(lambda x: x.isdigit() or x == '.', part)))
-                            payment_type = '微信' if '微信' in part else ('支付宝' if '支付宝' in part else '现金')
-                            payment_stats[payment_type] += amount
-                        except:
-                            pass
-        
-        # 计算增长率（与上一周期对比）
-        prev_start = start_date - (end_date - start_date) - timedelta(days=1)
-        prev_end = start_date - timedelta(days=1)
-        
-        prev_transactions = Transaction.query.filter(
-            Transaction.date >= prev_start,
-            Transaction.date <= prev_end
-        ).all()
-        
-        prev_total_amount = sum(float(t.total_amount) for t in prev_transactions)
-        growth_rate = 0.0
-        if prev_total_amount > 0:
-            growth_rate = ((total_amount - prev_total_amount) / prev_total_amount) * 100
-        
-        # 员工排名
-        employee_ranking = sorted(
-            employee_stats.items(),
-            key=lambda x: x[1]['total_amount'],
-            reverse=True
+            start_date, end_date = reports.default_management_range()
+        
+        # 环比用到上一周期的数据，版本范围从上一周期开始
+        return conditional_json(
+            user, data_version(reports.previous_period_start(start_date, end_date), end_date),
+            lambda: reports.management_report(start_date, end_date),
+            period_end=end_date
         )
         
-        result = {
-            'period': {
-                'start_date': start_date.isoformat(),
-                'end_date': end_date.isoformat(),
-                'days': (end_date - start_date).days + 1
-            },
-            'summary': {
-                'total_transactions': total_transactions,
-                'total_quantity': total_quantity,
-                'total_amount': total_amount,
-                'avg_daily_amount': total_amount / max((end_date - start_date).days + 1, 1),
-                'avg_per_transaction': total_amount / max(total_transactions, 1),
-                'growth_rate': round(growth_rate, 2)
-            },
-            'by_employee': dict(employee_stats),
-            'employee_ranking': [{'name': name, 'stats': stats} for name, stats in employee_ranking],
-            'daily_stats': dict(daily_stats),
-            'payment_methods': dict(payment_stats),
-            'trends': {
-                'highest_day': max(daily_stats.items(), key=lambda x: x[1]['total_amount'])[0] if daily_stats else None,
-                'lowest_day': min(daily_stats.items(), key=lambda x: x[1]['total_amount'])[0] if daily_stats else None
-            }
-        }
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/reports/cache-stats', methods=['GET'])
+@jwt_required()
+def get_report_cache_stats():
+    """报表缓存统计（命中率、淘汰次数等）"""
+    try:
+        user = get_current_user()
         
-        return jsonify(result), 200
+        if user.role != 'manager':
+            return jsonify({'error': '权限不足'}), 403
+        
+        return jsonify(report_cache.stats()), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -622,11 +801,11 @@ def get_employees():
     try:
         user = get_current_user()
         
-        employees = User.query.filter_by(is_active=True).all()
+        def build():
+            employees = User.query.filter_by(is_active=True).all()
+            return {'employees': [e.to_dict() for e in employees]}
         
-        return jsonify({
-            'employees': [e.to_dict() for e in employees]
-        }), 200
+        return conditional_json(user, TableVersion.current('users'), build)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -16,8 +16,12 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from models import db, User
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
+from models import db, User, RefreshToken
+from principal import (
+    PasswordCheckBusy, current_principal, issue_tokens, revoke_refresh_tokens, revoke_user_tokens,
+    rotate_refresh_token, verify_password
+)
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -34,20 +38,62 @@ def login():
         
         user = User.query.filter_by(username=username).first()
         
-        if not user or not user.check_password(password):
+        if not user or not verify_password(user, password):
             return jsonify({'error': '用户名或密码错误'}), 401
         
         if not user.is_active:
             return jsonify({'error': '账户已被禁用'}), 403
         
-        access_token = create_access_token(identity=user.id)
+        # 密码哈希参数调整后，借登录成功的机会按新参数重新哈希
+        if user.password_needs_rehash():
+            user.set_password(password)
+        
+        tokens = issue_tokens(user)
+        db.session.commit()
         
         return jsonify({
-            'access_token': access_token,
+            **tokens,
             'user': user.to_dict()
         }), 200
         
+    except PasswordCheckBusy:
+        db.session.rollback()
+        return jsonify({'error': '登录人数较多，请稍后重试'}), 503, {'Retry-After': '5'}
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@auth_bp.route('/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def refresh():
+    """用刷新令牌换取新的访问令牌和刷新令牌（旧刷新令牌随即失效）"""
+    try:
+        tokens = rotate_refresh_token(get_jwt()['jti'])
+        db.session.commit()
+        
+        if tokens is None:
+            return jsonify({'error': '登录已失效，请重新登录'}), 401
+        
+        return jsonify(tokens), 200
+        
     except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required(refresh=True)
+def logout():
+    """退出登录：作废本次登录的刷新令牌"""
+    try:
+        token = RefreshToken.query.filter_by(jti=get_jwt()['jti']).first()
+        if token:
+            revoke_refresh_tokens(token.user_id, token.family_id)
+            db.session.commit()
+        
+        return jsonify({'message': '已退出登录'}), 200
+        
+    except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @auth_bp.route('/me', methods=['GET'])
@@ -123,8 +169,7 @@ def public_register():
 def register_manager():
     """注册新用户（仅管理员可用，可创建任意角色）"""
     try:
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
+        current_user = current_principal()
         
         # 检查是否为示例账号
         if current_user and current_user.is_demo:
@@ -201,7 +246,7 @@ def change_password():
             return jsonify({'error': '原密码和新密码不能为空'}), 400
         
         # 验证原密码
-        if not user.check_password(old_password):
+        if not verify_password(user, old_password):
             return jsonify({'error': '原密码错误'}), 400
         
         # 检查新密码强度
@@ -209,7 +254,7 @@ def change_password():
             return jsonify({'error': '新密码长度至少6个字符'}), 400
         
         # 检查是否与原密码相同
-        if user.check_password(new_password):
+        if verify_password(user, new_password):
             return jsonify({'error': '新密码不能与原密码相同'}), 400
         
         # 检查今天是否已经修改过密码
@@ -222,17 +267,24 @@ def change_password():
                     'next_change_time': (datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)).isoformat()
                 }), 403
         
-        # 更新密码
+        # 更新密码，并使之前签发的令牌全部失效（其他设备需要重新登录）
         user.set_password(new_password)
         user.password_changed_at = datetime.utcnow()
+        revoke_user_tokens(user)
+        revoke_refresh_tokens(user.id)
+        tokens = issue_tokens(user)
         
         db.session.commit()
         
         return jsonify({
             'message': '密码修改成功',
-            'password_changed_at': user.password_changed_at.isoformat()
+            'password_changed_at': user.password_changed_at.isoformat(),
+            **tokens
         }), 200
         
+    except PasswordCheckBusy:
+        db.session.rollback()
+        return jsonify({'error': '服务器繁忙，请稍后重试'}), 503, {'Retry-After': '5'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'修改密码失败: {str(e)}'}), 500
@@ -1,7 +1,7 @@
 // FlowMaster AI - AI对话UI JavaScript
 const API_BASE = '/api';
 let currentUser = null;
-let chatHistory = [];
+let conversationId = null;  // 对话历史保存在服务端，只记住对话ID
 
 // 初始化
 document.addEventListener('DOMContentLoaded', function() {
@@ -11,7 +11,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
 // 检查认证状态
 function checkAuth() {
-    const token = localStorage.getItem('access_token');
+    const token = localStorage.getItem('access_token') || localStorage.getItem('refresh_token');
     if (token) {
         fetchCurrentUser();
     } else {
@@ -19,10 +19,65 @@ function checkAuth() {
     }
 }
 
+// 带访问令牌的请求：访问令牌过期（401）时用刷新令牌换取新令牌后重试一次
+async function authFetch(url, options = {}) {
+    const send = () => fetch(url, {
+        ...options,
+        headers: {
+            ...(options.headers || {}),
+            'Authorization': `Bearer ${localStorage.getItem('access_token')}`
+        }
+    });
+    let response = await send();
+    if (response.status === 401 && await refreshTokens()) {
+        response = await send();
+    }
+    return response;
+}
+
+// 用刷新令牌换取新的令牌对（多个请求同时遇到401时只刷新一次）
+let refreshPromise = null;
+function refreshTokens() {
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (!refreshToken) {
+        return Promise.resolve(false);
+    }
+    if (!refreshPromise) {
+        refreshPromise = fetch(`${API_BASE}/auth/refresh`, {
+            method: 'POST',
+            headers: {
+                'Authorization': `Bearer ${refreshToken}`
+            }
+        }).then(async response => {
+            if (!response.ok) {
+                clearTokens();
+                return false;
+            }
+            saveTokens(await response.json());
+            return true;
+        }).catch(() => false).finally(() => {
+            refreshPromise = null;
+        });
+    }
+    return refreshPromise;
+}
+
+function saveTokens(data) {
+    localStorage.setItem('access_token', data.access_token);
+    if (data.refresh_token) {
+        localStorage.setItem('refresh_token', data.refresh_token);
+    }
+}
+
+function clearTokens() {
+    localStorage.removeItem('access_token');
+    localStorage.removeItem('refresh_token');
+}
+
 // 获取当前用户
 async function fetchCurrentUser() {
     try {
-        const response = await fetch(`${API_BASE}/auth/me`, {
+        const response = await authFetch(`${API_BASE}/auth/me`, {
             headers: {
                 'Authorization': `Bearer ${localStorage.getItem('access_token')}`
             }
@@ -34,7 +89,7 @@ async function fetchCurrentUser() {
             showChat();
             updateQuickActions();
         } else {
-            localStorage.removeItem('access_token');
+            clearTokens();
             showLogin();
         }
     } catch (error) {
@@ -206,7 +261,7 @@ async function handleLogin(e) {
         const data = await response.json();
         
         if (response.ok) {
-            localStorage.setItem('access_token', data.access_token);
+            saveTokens(data);
             currentUser = data.user;
             showChat();
             updateQuickActions();
@@ -222,9 +277,19 @@ async function handleLogin(e) {
 
 // 退出登录
 function handleLogout() {
-    localStorage.removeItem('access_token');
+    // 作废服务端的刷新令牌，失败不影响本地退出
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (refreshToken) {
+        fetch(`${API_BASE}/auth/logout`, {
+            method: 'POST',
+            headers: {
+                'Authorization': `Bearer ${refreshToken}`
+            }
+        }).catch(() => {});
+    }
+    clearTokens();
     currentUser = null;
-    chatHistory = [];
+    conversationId = null;
     showLogin();
     clearMessages();
 }
@@ -257,8 +322,8 @@ async function sendMessage() {
     const loadingId = addLoadingMessage();
     
     try {
-        // 调用AI API
-        const response = await fetch(`${API_BASE}/ai/chat`, {
+        // 调用AI API（流式返回，先收到数据查询结果，再逐段收到回复文本）
+        const response = await authFetch(`${API_BASE}/ai/chat/stream`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -266,24 +331,50 @@ async function sendMessage() {
             },
             body: JSON.stringify({
                 message: message,
-                history: chatHistory
+                conversation_id: conversationId
             })
         });
         
-        // 移除加载动画
-        removeLoadingMessage(loadingId);
-        
-        if (response.ok) {
-            const data = await response.json();
-            
-            // 更新历史记录
-            chatHistory = data.messages || [];
-            
-            // 添加AI回复
-            addAIMessage(data.response, data.api_result);
-        } else {
+        if (!response.ok) {
+            removeLoadingMessage(loadingId);
             const errorData = await response.json();
-            addAIMessage(`抱歉，发生了错误：${errorData.error || '未知错误'}`, null);
+            if (errorData.conversation_id) {
+                conversationId = errorData.conversation_id;
+            }
+            addAIMessage(errorData.response || `抱歉，发生了错误：${errorData.error || '未知错误'}`, null);
+            return;
+        }
+        
+        let text = '';
+        let apiResult = null;
+        let messageDiv = null;
+        const render = () => {
+            if (messageDiv) {
+                updateAIMessage(messageDiv, text, apiResult);
+            } else {
+                // 收到第一个事件时把加载动画换成AI消息
+                removeLoadingMessage(loadingId);
+                messageDiv = addAIMessage(text, apiResult);
+            }
+        };
+        
+        await readEventStream(response, (event, data) => {
+            if (event === 'meta') {
+                conversationId = data.conversation_id || conversationId;
+            } else if (event === 'api_result') {
+                apiResult = data;
+            } else if (event === 'token') {
+                text += data.text;
+            } else if (event === 'done') {
+                text = data.response;
+            } else if (event === 'error') {
+                text += `\n抱歉，发生了错误：${data.error}`;
+            }
+            render();
+        });
+        
+        if (!messageDiv) {
+            render();
         }
     } catch (error) {
         console.error('发送消息错误:', error);
@@ -292,6 +383,41 @@ async function sendMessage() {
     }
 }
 
+// 读取Server-Sent Events响应，每个事件调用一次 onEvent(事件名, 数据)
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        
+        // 事件之间以空行分隔
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            let data = '';
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data += line.slice(5).trim();
+                }
+            });
+            if (data) {
+                onEvent(event, JSON.parse(data));
+            }
+        }
+    }
+}
+
 // 添加用户消息
 function addUserMessage(message) {
     const messagesContainer = document.getElementById('chatMessages');
@@ -327,7 +453,24 @@ function addAIMessage(message, apiResult = null) {
     
     const messageDiv = document.createElement('div');
     messageDiv.className = 'message-item message-ai';
+    messageDiv.innerHTML = `
+        <div class="message-bubble">
+            ${renderAIMessageContent(message, apiResult)}
+        </div>
+    `;
     
+    messagesContainer.appendChild(messageDiv);
+    scrollToBottom();
+    return messageDiv;
+}
+
+// 更新AI消息内容（流式回复逐段到达时使用）
+function updateAIMessage(messageDiv, message, apiResult = null) {
+    messageDiv.querySelector('.message-bubble').innerHTML = renderAIMessageContent(message, apiResult);
+    scrollToBottom();
+}
+
+function renderAIMessageContent(message, apiResult) {
     let content = `<div class="message-content">${formatMessage(message)}</div>`;
     
     // 如果有API结果，显示数据
@@ -336,15 +479,7 @@ function addAIMessage(message, apiResult = null) {
     }
     
     content += `<div class="message-time">${getCurrentTime()}</div>`;
-    
-    messageDiv.innerHTML = `
-        <div class="message-bubble">
-            ${content}
-        </div>
-    `;
-    
-    messagesContainer.appendChild(messageDiv);
-    scrollToBottom();
+    return content;
 }
 
 // 添加系统消息
@@ -439,13 +574,14 @@ function renderAPIResult(apiResult) {
             html += '</ul>';
         }
     } else if (typeof apiResult.data === 'object') {
-        // 如果是报表数据
+        // 如果是报表数据（合计位于summary中）
+        const summary = apiResult.data.summary || apiResult.data;
         html += '<h4>报表数据</h4>';
-        if (apiResult.data.total_amount !== undefined) {
-            html += `<p>总金额：¥${apiResult.data.total_amount.toFixed(2)}</p>`;
+        if (summary.total_amount !== undefined) {
+            html += `<p>总金额：¥${summary.total_amount.toFixed(2)}</p>`;
         }
-        if (apiResult.data.total_quantity !== undefined) {
-            html += `<p>总数量：${apiResult.data.total_quantity}</p>`;
+        if (summary.total_quantity !== undefined) {
+            html += `<p>总数量：${summary.total_quantity}</p>`;
         }
     }
     
@@ -511,6 +647,7 @@ function clearMessages() {
             </ul>
         </div>
     `;
-    chatHistory = [];
+    // 清空后开始新的对话
+    conversationId = null;
 }
 
@@ -12,7 +12,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
 // 检查认证状态
 function checkAuth() {
-    const token = localStorage.getItem('access_token');
+    const token = localStorage.getItem('access_token') || localStorage.getItem('refresh_token');
     if (token) {
         fetchCurrentUser();
     } else {
@@ -20,10 +20,65 @@ function checkAuth() {
     }
 }
 
+// 带访问令牌的请求：访问令牌过期（401）时用刷新令牌换取新令牌后重试一次
+async function authFetch(url, options = {}) {
+    const send = () => fetch(url, {
+        ...options,
+        headers: {
+            ...(options.headers || {}),
+            'Authorization': `Bearer ${localStorage.getItem('access_token')}`
+        }
+    });
+    let response = await send();
+    if (response.status === 401 && await refreshTokens()) {
+        response = await send();
+    }
+    return response;
+}
+
+// 用刷新令牌换取新的令牌对（多个请求同时遇到401时只刷新一次）
+let refreshPromise = null;
+function refreshTokens() {
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (!refreshToken) {
+        return Promise.resolve(false);
+    }
+    if (!refreshPromise) {
+        refreshPromise = fetch(`${API_BASE}/auth/refresh`, {
+            method: 'POST',
+            headers: {
+                'Authorization': `Bearer ${refreshToken}`
+            }
+        }).then(async response => {
+            if (!response.ok) {
+                clearTokens();
+                return false;
+            }
+            saveTokens(await response.json());
+            return true;
+        }).catch(() => false).finally(() => {
+            refreshPromise = null;
+        });
+    }
+    return refreshPromise;
+}
+
+function saveTokens(data) {
+    localStorage.setItem('access_token', data.access_token);
+    if (data.refresh_token) {
+        localStorage.setItem('refresh_token', data.refresh_token);
+    }
+}
+
+function clearTokens() {
+    localStorage.removeItem('access_token');
+    localStorage.removeItem('refresh_token');
+}
+
 // 获取当前用户
 async function fetchCurrentUser() {
     try {
-        const response = await fetch(`${API_BASE}/auth/me`, {
+        const response = await authFetch(`${API_BASE}/auth/me`, {
             headers: {
                 'Authorization': `Bearer ${localStorage.getItem('access_token')}`
             }
@@ -35,7 +90,7 @@ async function fetchCurrentUser() {
             showMain();
             loadInitialData();
         } else {
-            localStorage.removeItem('access_token');
+            clearTokens();
             showLogin();
         }
     } catch (error) {
@@ -338,7 +393,7 @@ async function handleLogin(e) {
         const data = await response.json();
         
         if (response.ok) {
-            localStorage.setItem('access_token', data.access_token);
+            saveTokens(data);
             currentUser = data.user;
             showMain();
             loadInitialData();
@@ -354,7 +409,17 @@ async function handleLogin(e) {
 
 // 退出登录
 function handleLogout() {
-    localStorage.removeItem('access_token');
+    // 作废服务端的刷新令牌，失败不影响本地退出
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (refreshToken) {
+        fetch(`${API_BASE}/auth/logout`, {
+            method: 'POST',
+            headers: {
+                'Authorization': `Bearer ${refreshToken}`
+            }
+        }).catch(() => {});
+    }
+    clearTokens();
     currentUser = null;
     showLogin();
     showMessage('已退出登录', 'info');
@@ -369,7 +434,7 @@ async function loadInitialData() {
 // 加载员工列表
 async function loadEmployees() {
     try {
-        const response = await fetch(`${API_BASE}/employees`, {
+        const response = await authFetch(`${API_BASE}/employees`, {
             headers: {
                 'Authorization': `Bearer ${localStorage.getItem('access_token')}`
             }
@@ -479,7 +544,7 @@ async function handleCreateTransaction(e) {
     // 获取员工列表用于显示名称
     let employees = [];
     try {
-        const empResponse = await fetch(`${API_BASE}/employees`, {
+        const empResponse = await authFetch(`${API_BASE}/employees`, {
             headers: {
                 'Authorization': `Bearer ${localStorage.getItem('access_token')}`
             }
@@ -493,7 +558,7 @@ async function handleCreateTransaction(e) {
     }
     
     try {
-        const response = await fetch(`${API_BASE}/transactions`, {
+        const response = await authFetch(`${API_BASE}/transactions`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -555,7 +620,7 @@ async function loadTransactions(page = 1) {
         if (endDate) url += `&end_date=${endDate}`;
         if (employeeId) url += `&employee_id=${employeeId}`;
         
-        const response = await fetch(url, {
+        const response = await authFetch(url, {
             headers: {
                 'Authorization': `Bearer ${localStorage.getItem('access_token')}`
             }
@@ -608,7 +673,7 @@ async function deleteTransaction(id) {
     if (!confirm('确定要删除这条流水记录吗？')) return;
     
     try {
-        const response = await fetch(`${API_BASE}/transactions/${id}`, {
+        const response = await authFetch(`${API_BASE}/transactions/${id}`, {
             method: 'DELETE',
             headers: {
                 'Authorization': `Bearer ${localStorage.getItem('access_token')}`
@@ -691,7 +756,7 @@ async function loadDailyReport() {
     }
     
     try {
-        const response = await fetch(`${API_BASE}/reports/daily?date=${date}`, {
+        const response = await authFetch(`${API_BASE}/reports/daily?date=${date}`, {
             headers: {
                 'Authorization': `Bearer ${localStorage.getItem('access_token')}`
             }
@@ -756,7 +821,7 @@ async function loadWeeklyReport() {
     const week = parseInt(document.getElementById('weeklyReportWeek').value);
     
     try {
-        const response = await fetch(`${API_BASE}/reports/weekly?year=${year}&week=${week}`, {
+        const response = await authFetch(`${API_BASE}/reports/weekly?year=${year}&week=${week}`, {
             headers: {
                 'Authorization': `Bearer ${localStorage.getItem('access_token')}`
             }
@@ -814,7 +879,7 @@ async function loadMonthlyReport() {
     const month = parseInt(document.getElementById('monthlyReportMonth').value);
     
     try {
-        const response = await fetch(`${API_BASE}/reports/monthly?year=${year}&month=${month}`, {
+        const response = await authFetch(`${API_BASE}/reports/monthly?year=${year}&month=${month}`, {
             headers: {
                 'Authorization': `Bearer ${localStorage.getItem('access_token')}`
             }
@@ -875,7 +940,7 @@ async function loadYearlyReport() {
     const year = parseInt(document.getElementById('yearlyReportYear').value);
     
     try {
-        const response = await fetch(`${API_BASE}/reports/yearly?year=${year}`, {
+        const response = await authFetch(`${API_BASE}/reports/yearly?year=${year}`, {
             headers: {
                 'Authorization': `Bearer ${localStorage.getItem('access_token')}`
             }
@@ -949,7 +1014,7 @@ async function loadManagementReport() {
     const endDate = document.getElementById('managementEndDate').value;
     
     try {
-        const response = await fetch(`${API_BASE}/reports/management?start_date=${startDate}&end_date=${endDate}`, {
+        const response = await authFetch(`${API_BASE}/reports/management?start_date=${startDate}&end_date=${endDate}`, {
             headers: {
                 'Authorization': `Bearer ${localStorage.getItem('access_token')}`
             }
@@ -1129,7 +1194,7 @@ async function loadProfile() {
         
         // 检查是否有密码修改记录
         try {
-            const response = await fetch(`${API_BASE}/auth/me`, {
+            const response = await authFetch(`${API_BASE}/auth/me`, {
                 headers: {
                     'Authorization': `Bearer ${localStorage.getItem('access_token')}`
                 }
@@ -1195,7 +1260,7 @@ async function handleChangePassword(e) {
     }
     
     try {
-        const response = await fetch(`${API_BASE}/auth/change-password`, {
+        const response = await authFetch(`${API_BASE}/auth/change-password`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -1210,6 +1275,10 @@ async function handleChangePassword(e) {
         const data = await response.json();
         
         if (response.ok) {
+            // 修改密码后旧令牌失效，换用新令牌
+            if (data.access_token) {
+                saveTokens(data);
+            }
             showMessage('密码修改成功', 'success');
             document.getElementById('changePasswordForm').reset();
             // 重新加载个人主页信息
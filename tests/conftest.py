@@ -0,0 +1,54 @@
+"""
+测试公共配置：使用内存SQLite数据库和本地模拟AI服务，不访问网络
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 必须在导入config之前设置（load_dotenv不会覆盖已有的环境变量）
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['AI_PROVIDERS'] = 'fake'
+
+import pytest  # noqa: E402
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """每个测试一个新的应用和空数据库"""
+    from config import Config
+    from app import create_app
+    from principal import user_state_cache
+    from report_cache import report_cache
+    from analytics import transaction_snapshot
+
+    # 连接池参数是为MySQL准备的（from_object会原样带入），SQLite不支持
+    monkeypatch.setattr(Config, 'SQLALCHEMY_ENGINE_OPTIONS', {})
+    monkeypatch.setattr(Config, 'IMPORT_FOLDER', str(tmp_path / 'imports'))
+    app = create_app()
+    report_cache.clear()
+    transaction_snapshot.clear()
+    user_state_cache._entries.clear()
+    yield app
+    with app.app_context():
+        from models import db
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,103 @@
+"""
+AI服务熔断器测试（ProviderHealth / ProviderRouter.chat_stream）
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import time
+import pytest
+from ai_providers import FakeProvider, ProviderHealth, ProviderRouter, ProviderUnavailable
+
+class MidStreamFailure(FakeProvider):
+    """输出第一段内容后失败的模拟服务"""
+
+    def chat_stream(self, messages, temperature=0.7):
+        self.calls += 1
+        yield '第一段'
+        raise ProviderUnavailable(self.name, '连接中断')
+
+class AbandonedProvider(FakeProvider):
+    """还没有输出内容调用就被中止的模拟服务（如gunicorn工作进程超时时抛出的SystemExit）"""
+
+    def chat_stream(self, messages, temperature=0.7):
+        self.calls += 1
+        raise SystemExit(1)
+        yield
+
+MESSAGES = [{'role': 'user', 'content': '你好'}]
+
+def half_open_router(provider) -> ProviderRouter:
+    """熔断器已处于半开状态（下一次调用就是探测）的路由器"""
+    router = ProviderRouter([provider], mode='fallback', breaker_options={'min_calls': 1, 'open_seconds': 0})
+    health = router.health[provider.name]
+    health.record_failure()
+    assert health.state == ProviderHealth.OPEN
+    return router
+
+def test_abandoned_probe_releases_half_open_slot():
+    router = half_open_router(AbandonedProvider('a'))
+    health = router.health['a']
+
+    with pytest.raises(SystemExit):
+        list(router.chat_stream(MESSAGES))
+
+    # 探测没有结果，不算成功也不算失败，但要让出探测名额
+    assert health.state == ProviderHealth.HALF_OPEN
+    assert health.allow_request()
+
+def test_abandoned_probe_then_recovery():
+    provider = AbandonedProvider('a')
+    router = half_open_router(provider)
+
+    with pytest.raises(SystemExit):
+        list(router.chat_stream(MESSAGES))
+
+    router.providers = [FakeProvider('a', reply='恢复了')]
+    assert ''.join(router.chat_stream(MESSAGES)) == '恢复了'
+    assert router.health['a'].state == ProviderHealth.CLOSED
+
+def test_probe_failing_with_unexpected_error_is_recorded():
+    provider = FakeProvider('a', error=ConnectionError('reset'))
+    router = half_open_router(provider)
+    health = router.health['a']
+
+    with pytest.raises(ConnectionError):
+        list(router.chat_stream(MESSAGES))
+    # 探测失败重新熔断，熔断期结束后可以再次探测，而不是永远卡在半开状态
+    assert health.state == ProviderHealth.OPEN
+    assert health.open_count == 2
+
+    provider.error = None
+    provider.reply = '恢复了'
+    assert ''.join(router.chat_stream(MESSAGES)) == '恢复了'
+    assert health.state == ProviderHealth.CLOSED
+
+def test_mid_stream_failure_is_recorded():
+    router = ProviderRouter([MidStreamFailure('a')], mode='fallback', breaker_options={'min_calls': 4})
+    health = router.health['a']
+
+    for _ in range(2):
+        with pytest.raises(ProviderUnavailable):
+            list(router.chat_stream(MESSAGES))
+    # 每次调用：第一段内容记一次成功，中途失败记一次失败
+    assert health.stats()['errors'] == 2
+    assert health.state == ProviderHealth.OPEN
+
+def test_started_probe_times_out():
+    health = ProviderHealth('a', min_calls=1, open_seconds=0, probe_timeout=0.05)
+    health.record_failure()
+    assert health.allow_request()
+    assert not health.allow_request()
+    time.sleep(0.06)
+    assert health.allow_request()
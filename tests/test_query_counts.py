@@ -0,0 +1,131 @@
+"""
+流水列表和报表接口的SQL语句数测试：语句数不随记录数和员工数增长（没有N+1查询）
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from datetime import date, timedelta
+import pytest
+from sqlalchemy import event
+from config import Config
+from models import db, User, Transaction
+from report_cache import report_cache
+
+TODAY = date.today()
+
+ENDPOINTS = [
+    '/api/transactions',
+    '/api/transactions?fields=date,employee_name,amount_details',
+    '/api/transactions?view=summary',
+    '/api/reports/daily',
+    '/api/reports/weekly',
+    '/api/reports/monthly',
+    '/api/reports/yearly',
+    '/api/reports/management',
+]
+
+AI_INTENTS = ['query_transactions', 'daily_report', 'weekly_report', 'monthly_report',
+              'yearly_report', 'management_report']
+
+def add_data(employees: int, rows: int):
+    """新增员工和流水（日期分布在本周内）"""
+    for _ in range(employees):
+        index = User.query.count()
+        user = User(username=f'worker{index}', role='worker', real_name=f'员工{index}')
+        user.set_password('pw1234')
+        db.session.add(user)
+    db.session.flush()
+
+    employee_ids = [user.id for user in User.query.filter_by(role='worker').all()]
+    for i in range(rows):
+        transaction = Transaction(
+            date=TODAY - timedelta(days=i % (TODAY.weekday() + 1)),
+            employee_id=employee_ids[i % len(employee_ids)],
+            quantity=i + 1,
+            total_amount=100 + i
+        )
+        transaction.set_amount_details(f'微信{50 + i}, 现金50')
+        db.session.add(transaction)
+    db.session.commit()
+
+def count_statements(run) -> int:
+    """执行 run 期间发出的SQL语句数（先执行一次预热用户状态缓存和报表快照，再清空报表缓存后计数）"""
+    run()
+    report_cache.clear()
+    statements = []
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        run()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    return len(statements)
+
+@pytest.fixture
+def manager_headers(app, client):
+    with app.app_context():
+        manager = User(username='boss', role='manager', real_name='店长')
+        manager.set_password('pw1234')
+        db.session.add(manager)
+        db.session.commit()
+    response = client.post('/api/auth/login', json={'username': 'boss', 'password': 'pw1234'})
+    return {'Authorization': f"Bearer {response.json['access_token']}"}
+
+@pytest.mark.parametrize('engine', ['sql', 'snapshot'])
+def test_api_query_count_independent_of_rows_and_employees(app, client, manager_headers, monkeypatch, engine):
+    monkeypatch.setattr(Config, 'REPORT_ENGINE', engine)
+
+    def run_all():
+        counts = {}
+        for path in ENDPOINTS:
+            def run():
+                response = client.get(path, headers=manager_headers)
+                assert response.status_code == 200, (path, response.json)
+            counts[path] = count_statements(run)
+        return counts
+
+    with app.app_context():
+        add_data(employees=1, rows=1)
+        small = run_all()
+        add_data(employees=5, rows=60)
+        large = run_all()
+
+    assert large == small
+
+def test_ai_query_count_independent_of_rows_and_employees(app):
+    from routes.ai import execute_api_call
+
+    with app.app_context():
+        manager = User(username='boss', role='manager', real_name='店长')
+        manager.set_password('pw1234')
+        db.session.add(manager)
+        db.session.commit()
+
+        def run_all():
+            counts = {}
+            for intent in AI_INTENTS:
+                def run():
+                    assert execute_api_call(intent, {}, manager)['success']
+                counts[intent] = count_statements(run)
+            return counts
+
+        add_data(employees=1, rows=1)
+        small = run_all()
+        add_data(employees=5, rows=60)
+        large = run_all()
+
+    assert large == small
@@ -0,0 +1,83 @@
+"""
+刷新令牌轮换测试：宽限时间内的重复刷新不产生第二条令牌链，超过宽限时间按泄露处理
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from datetime import timedelta
+import pytest
+from flask_jwt_extended import decode_token
+from config import Config
+from models import db, User, RefreshToken
+
+@pytest.fixture
+def login(app, client):
+    with app.app_context():
+        user = User(username='worker', role='worker', real_name='员工')
+        user.set_password('pw1234')
+        db.session.add(user)
+        db.session.commit()
+    response = client.post('/api/auth/login', json={'username': 'worker', 'password': 'pw1234'})
+    assert response.status_code == 200
+    return response.json
+
+def refresh(client, refresh_token: str):
+    return client.post('/api/auth/refresh', headers={'Authorization': f'Bearer {refresh_token}'})
+
+def token_jti(app, token: str) -> str:
+    with app.app_context():
+        return decode_token(token)['jti']
+
+def live_tokens(app) -> list:
+    with app.app_context():
+        return [token.jti for token in RefreshToken.query.filter(RefreshToken.revoked_at.is_(None))]
+
+def test_rotation(app, client, login):
+    first = refresh(client, login['refresh_token'])
+    assert first.status_code == 200
+    assert live_tokens(app) == [token_jti(app, first.json['refresh_token'])]
+
+    second = refresh(client, first.json['refresh_token'])
+    assert second.status_code == 200
+    assert live_tokens(app) == [token_jti(app, second.json['refresh_token'])]
+
+def test_reuse_within_grace_returns_existing_successor(app, client, login):
+    first = refresh(client, login['refresh_token'])
+    again = refresh(client, login['refresh_token'])
+    assert again.status_code == 200
+
+    # 宽限时间内重复刷新拿到的是同一个后继令牌，family中仍只有一个有效令牌
+    successor = token_jti(app, first.json['refresh_token'])
+    assert token_jti(app, again.json['refresh_token']) == successor
+    assert live_tokens(app) == [successor]
+
+    # 后继令牌被轮换后，另一方再用它属于重复使用，整个family作废
+    assert refresh(client, first.json['refresh_token']).status_code == 200
+    with app.app_context():
+        token = RefreshToken.query.filter_by(jti=successor).one()
+        token.revoked_at -= timedelta(seconds=Config.REFRESH_REUSE_GRACE + 1)
+        db.session.commit()
+    assert refresh(client, again.json['refresh_token']).status_code == 401
+    assert live_tokens(app) == []
+
+def test_reuse_after_grace_revokes_family(app, client, login):
+    first = refresh(client, login['refresh_token'])
+    with app.app_context():
+        token = RefreshToken.query.filter_by(jti=token_jti(app, login['refresh_token'])).one()
+        token.revoked_at -= timedelta(seconds=Config.REFRESH_REUSE_GRACE + 1)
+        db.session.commit()
+
+    assert refresh(client, login['refresh_token']).status_code == 401
+    assert refresh(client, first.json['refresh_token']).status_code == 401
+    assert live_tokens(app) == []
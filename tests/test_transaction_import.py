@@ -0,0 +1,112 @@
+"""
+流水导入测试：同一文件同时只能有一个导入，进度与数据在同一事务中提交
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import hashlib
+import io
+import os
+import pytest
+import transaction_import
+from models import db, User, Transaction, ImportJob
+
+CSV = (
+    '日期,员工,数量,总金额,金额明细\n'
+    '2026-01-01,worker,1,100,微信100\n'
+    '2026-01-02,worker,2,200,现金200\n'
+    '2026-01-03,nobody,3,300,微信300\n'
+    '2026-01-04,worker,4,400,支付宝400\n'
+    '2026-01-05,worker,5,500,微信500\n'
+)
+
+def add_user(username: str, role: str):
+    user = User(username=username, role=role, real_name=username)
+    user.set_password('pw1234')
+    db.session.add(user)
+    db.session.commit()
+
+@pytest.fixture
+def ledger(app, tmp_path):
+    with app.app_context():
+        add_user('worker', 'worker')
+    path = tmp_path / 'ledger.csv'
+    path.write_text(CSV, encoding='utf-8')
+    return str(path)
+
+def test_failed_chunk_rolls_back_progress_and_errors(app, ledger, monkeypatch):
+    bulk_insert = Transaction.bulk_insert
+    calls = []
+
+    def failing_bulk_insert(connection, rows):
+        calls.append(len(rows))
+        if len(calls) == 2:
+            raise RuntimeError('数据库连接中断')
+        return bulk_insert(connection, rows)
+
+    with app.app_context():
+        monkeypatch.setattr(Transaction, 'bulk_insert', failing_bulk_insert)
+        with pytest.raises(RuntimeError):
+            transaction_import.import_file(ledger, chunk_size=2, log=lambda _: None)
+
+        # 第二块（含一条错误行）没有提交：进度、数据和错误文件都停在第一块
+        job = ImportJob.query.one()
+        assert (job.rows_done, job.imported, job.rejected) == (2, 2, 0)
+        assert Transaction.query.count() == 2
+
+        monkeypatch.setattr(Transaction, 'bulk_insert', bulk_insert)
+        result = transaction_import.import_file(ledger, chunk_size=2, log=lambda _: None)
+
+        assert result['completed']
+        assert (result['rows_done'], result['imported'], result['rejected']) == (5, 4, 1)
+        assert Transaction.query.count() == 4
+        assert result['error_samples'] == [{'row': 3, 'error': '员工不存在或重名'}]
+    with open(transaction_import.errors_path_for(ledger), encoding='utf-8') as f:
+        assert f.read().count('nobody') == 1
+
+def test_concurrent_import_of_same_file_is_rejected(app, ledger):
+    with app.app_context():
+        with transaction_import.import_lock(ledger):
+            with pytest.raises(transaction_import.ImportInProgress):
+                transaction_import.import_file(ledger, log=lambda _: None)
+        assert Transaction.query.count() == 0
+
+def test_import_endpoint_returns_409_while_same_file_is_importing(app, client):
+    with app.app_context():
+        add_user('worker', 'worker')
+        add_user('boss', 'manager')
+    response = client.post('/api/auth/login', json={'username': 'boss', 'password': 'pw1234'})
+    headers = {'Authorization': f"Bearer {response.json['access_token']}"}
+
+    def upload():
+        data = {'file': (io.BytesIO(CSV.encode('utf-8')), 'ledger.csv')}
+        return client.post('/api/transactions/import', data=data, headers=headers, content_type='multipart/form-data')
+
+    folder = app.config['IMPORT_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, hashlib.sha256(CSV.encode('utf-8')).hexdigest() + '.csv')
+    with transaction_import.import_lock(path):
+        response = upload()
+    assert response.status_code == 409
+
+    response = upload()
+    assert response.status_code == 200
+    assert response.json['imported'] == 4
+
+    # 重新上传已导入完成的文件不会重复导入
+    response = upload()
+    assert response.status_code == 200
+    assert response.json['imported'] == 4
+    with app.app_context():
+        assert Transaction.query.count() == 4
@@ -0,0 +1,301 @@
+"""
+流水记录批量导入（CSV / Excel）
+
+按块读取文件（CSV使用pandas分块读取，Excel使用openpyxl只读模式逐行读取），
+每块向量化地完成员工匹配、字段校验和金额明细解析后批量写入并单独提交，
+内存占用只与块大小有关，与文件大小无关。
+每块数据与导入进度（import_jobs表）在同一事务中提交，中断后重新运行会从上次提交的位置继续，不会重复导入；
+导入期间持有该文件的文件锁，同一文件同时只能有一个导入在进行。
+校验失败的行写入错误文件，不影响其他行导入。
+
+Copyright 2026 Jiacheng Ni
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+from contextlib import contextmanager
+from itertools import islice
+from typing import Callable, Dict, Iterator
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import load_only
+from models import db, User, Transaction, ImportJob, PAYMENT_METHODS
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 表头别名 -> 标准列名
+COLUMN_ALIASES = {
+    '日期': 'date', 'date': 'date',
+    '员工': 'employee', '员工姓名': 'employee', '姓名': 'employee',
+    'employee': 'employee', 'employee_name': 'employee', 'employee_id': 'employee',
+    '数量': 'quantity', 'quantity': 'quantity',
+    '总金额': 'total_amount', '金额': 'total_amount', 'total_amount': 'total_amount',
+    '金额明细': 'amount_details', '明细': 'amount_details', 'amount_details': 'amount_details'
+}
+REQUIRED_COLUMNS = ['date', 'employee', 'quantity', 'total_amount']
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+
+# 与 models.parse_amount_details 相同的规则
+_SEPARATOR_PATTERN = r'[,，、;；]'
+_AMOUNT_PATTERN = r'(\d+(?:\.\d+)?)'
+
+# 返回结果中最多附带的错误行数（完整列表见错误文件）
+MAX_ERROR_SAMPLES = 100
+
+class ImportInProgress(Exception):
+    """同一文件的另一次导入正在进行"""
+
+def errors_path_for(path: str) -> str:
+    return path + '.errors.csv'
+
+def lock_path_for(path: str) -> str:
+    return path + '.lock'
+
+@contextmanager
+def import_lock(path: str):
+    """导入期间持有的文件锁；同一文件已有导入在进行时抛出 ImportInProgress
+
+    锁随文件句柄关闭或进程退出由操作系统释放，进程崩溃后不会留下失效的锁。
+    """
+    f = open(lock_path_for(path), 'a')
+    try:
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            raise ImportInProgress('该文件正在导入中，请稍后再试')
+        yield
+    finally:
+        f.close()
+
+def _path_hash(path: str) -> str:
+    return hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest()
+
+def load_job(path: str) -> ImportJob:
+    """读取文件的导入进度，不存在时创建（由调用方提交事务）"""
+    job = db.session.get(ImportJob, _path_hash(path))
+    if job is None:
+        job = ImportJob(
+            path_hash=_path_hash(path),
+            path=os.path.abspath(path),
+            file_size=os.path.getsize(path),
+            rows_done=0,
+            imported=0,
+            rejected=0,
+            errors_size=0,
+            completed=False
+        )
+        db.session.add(job)
+    return job
+
+def _rename_columns(columns) -> list:
+    renamed = [COLUMN_ALIASES.get(str(column).strip().lower(), str(column).strip()) for column in columns]
+    missing = [column for column in REQUIRED_COLUMNS if column not in renamed]
+    if missing:
+        raise ValueError(f'文件缺少必需的列: {", ".join(missing)}')
+    return renamed
+
+def read_chunks(path: str, chunk_size: int, skip_rows: int = 0) -> Iterator[pd.DataFrame]:
+    """按块读取数据行（跳过前skip_rows行），每块的索引为该行在文件中的行号（从1开始，不含表头）"""
+    if path.lower().endswith(EXCEL_EXTENSIONS):
+        yield from _read_excel_chunks(path, chunk_size, skip_rows)
+        return
+
+    reader = pd.read_csv(
+        path,
+        chunksize=chunk_size,
+        dtype=str,
+        keep_default_na=False,
+        skipinitialspace=True,
+        skiprows=range(1, skip_rows + 1),
+        encoding='utf-8-sig'
+    )
+    row_number = skip_rows
+    for chunk in reader:
+        chunk.columns = _rename_columns(chunk.columns)
+        chunk.index = pd.RangeIndex(row_number + 1, row_number + 1 + len(chunk))
+        row_number += len(chunk)
+        yield chunk
+
+def _read_excel_chunks(path: str, chunk_size: int, skip_rows: int) -> Iterator[pd.DataFrame]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        rows = sheet.iter_rows(values_only=True)
+        header = _rename_columns(next(rows, ()))
+        buffer = []
+        row_number = skip_rows
+        for row in islice(rows, skip_rows, None):
+            buffer.append(row[:len(header)])
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=header, index=pd.RangeIndex(row_number + 1, row_number + 1 + len(buffer)))
+                row_number += len(buffer)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=header, index=pd.RangeIndex(row_number + 1, row_number + 1 + len(buffer)))
+    finally:
+        workbook.close()
+
+def parse_amount_details_frame(details: pd.Series) -> pd.DataFrame:
+    """向量化解析金额明细，返回各支付方式金额（列为PAYMENT_METHODS的键）"""
+    if details.empty:
+        return pd.DataFrame(0.0, index=details.index, columns=list(PAYMENT_METHODS))
+    parts = details.str.split(_SEPARATOR_PATTERN, regex=True).explode()
+    amounts = pd.to_numeric(parts.str.extract(_AMOUNT_PATTERN, expand=False), errors='coerce')
+    methods = np.select(
+        [parts.str.contains('微信', na=False), parts.str.contains('支付宝', na=False), parts.str.contains('现金', na=False)],
+        ['wechat', 'alipay', 'cash'],
+        default='other'
+    )
+    items = pd.DataFrame({'method': methods, 'amount': amounts}, index=parts.index).dropna(subset=['amount'])
+    totals = items.groupby([items.index, 'method'])['amount'].sum().unstack(fill_value=0.0)
+    return totals.reindex(index=details.index, columns=list(PAYMENT_METHODS), fill_value=0.0).fillna(0.0)
+
+def build_employee_map() -> Dict[str, int]:
+    """员工姓名/用户名/ID -> 员工ID；重名的姓名不参与匹配"""
+    employee_map = {}
+    ambiguous = set()
+    for user in User.query.options(load_only(User.id, User.username, User.real_name)):
+        employee_map[str(user.id)] = user.id
+        employee_map[user.username] = user.id
+        if user.real_name:
+            if user.real_name in employee_map and employee_map[user.real_name] != user.id:
+                ambiguous.add(user.real_name)
+            employee_map[user.real_name] = user.id
+    for name in ambiguous:
+        del employee_map[name]
+    return employee_map
+
+def normalize_chunk(chunk: pd.DataFrame, employee_map: Dict[str, int]):
+    """校验并规范化一块数据，返回 (可导入的数据, 错误行)"""
+    # Excel空单元格读出来是None，统一按空字符串处理
+    text = {column: chunk[column].fillna('').astype(str).str.strip() for column in chunk.columns}
+    details = text['amount_details'] if 'amount_details' in text else pd.Series('', index=chunk.index)
+    details = details.str.replace(r'\s*[,，、;；]\s*', ', ', regex=True)
+
+    dates = pd.to_datetime(chunk['date'], errors='coerce', format='mixed')
+    employee_ids = text['employee'].map(employee_map)
+    quantities = pd.to_numeric(chunk['quantity'], errors='coerce')
+    total_amounts = pd.to_numeric(chunk['total_amount'], errors='coerce')
+
+    reasons = pd.Series(np.select(
+        [
+            dates.isna(),
+            employee_ids.isna(),
+            quantities.isna() | (quantities < 0) | (quantities % 1 != 0),
+            total_amounts.isna() | (total_amounts < 0)
+        ],
+        ['日期格式错误', '员工不存在或重名', '数量格式错误', '总金额格式错误'],
+        default=''
+    ), index=chunk.index)
+    valid = reasons.eq('')
+
+    rejected = chunk.loc[~valid].copy()
+    rejected.insert(0, 'error', reasons[~valid])
+
+    amounts = parse_amount_details_frame(details[valid])
+    normalized = pd.DataFrame({
+        'date': dates[valid].dt.date,
+        'employee_id': employee_ids[valid].astype(int),
+        'quantity': quantities[valid].astype(int),
+        'total_amount': total_amounts[valid].round(2),
+        'amount_details': details[valid]
+    }).join(amounts)
+    return normalized, rejected
+
+def _to_rows(normalized: pd.DataFrame) -> list:
+    """转换为 Transaction.bulk_insert 的输入（金额明细已解析，不再逐条解析）"""
+    rows = []
+    methods = list(PAYMENT_METHODS)
+    for record in normalized.itertuples(index=False):
+        row = record._asdict()
+        row['amounts'] = {method: float(row.pop(method)) for method in methods}
+        row['employee_id'] = int(row['employee_id'])
+        row['quantity'] = int(row['quantity'])
+        row['total_amount'] = float(row['total_amount'])
+        rows.append(row)
+    return rows
+
+def import_file(path: str, chunk_size: int = 5000, restart: bool = False,
+                log: Callable[[str], None] = print) -> dict:
+    """导入文件中的流水记录，返回导入进度（已完成时completed为True）
+
+    restart=True 时忽略已有进度从头导入（已导入的数据不会删除，可能重复）。
+    同一文件的另一次导入正在进行时抛出 ImportInProgress。
+    """
+    with import_lock(path):
+        errors_path = errors_path_for(path)
+        if restart:
+            stale_job = db.session.get(ImportJob, _path_hash(path))
+            if stale_job is not None:
+                db.session.delete(stale_job)
+                db.session.commit()
+            if os.path.exists(errors_path):
+                os.remove(errors_path)
+
+        job = load_job(path)
+        if job.completed:
+            return job.to_dict()
+        if job.file_size != os.path.getsize(path):
+            raise ValueError('文件与上次导入时不一致，如需重新导入请使用restart')
+
+        # 上次中断时未提交的块可能已写入错误文件，截掉这部分
+        if os.path.exists(errors_path) and os.path.getsize(errors_path) > job.errors_size:
+            if job.errors_size:
+                with open(errors_path, 'r+b') as f:
+                    f.truncate(job.errors_size)
+            else:
+                os.remove(errors_path)
+
+        employee_map = build_employee_map()
+        error_samples = json.loads(job.error_samples) if job.error_samples else []
+
+        for chunk in read_chunks(path, chunk_size, job.rows_done):
+            normalized, rejected = normalize_chunk(chunk, employee_map)
+
+            if len(rejected):
+                rejected.to_csv(errors_path, mode='a', index_label='row', encoding='utf-8',
+                                header=not os.path.exists(errors_path))
+                for row_number, reason in rejected['error'].items():
+                    if len(error_samples) >= MAX_ERROR_SAMPLES:
+                        break
+                    error_samples.append({'row': int(row_number), 'error': reason})
+
+            # 数据和进度在同一事务中提交，提交前中断时两者都不生效
+            try:
+                Transaction.bulk_insert(db.session.connection(), _to_rows(normalized))
+                job.rows_done += len(chunk)
+                job.imported += len(normalized)
+                job.rejected += len(rejected)
+                job.errors_size = os.path.getsize(errors_path) if os.path.exists(errors_path) else 0
+                job.error_samples = json.dumps(error_samples, ensure_ascii=False)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            log(f"已处理 {job.rows_done} 行：导入 {job.imported}，失败 {job.rejected}")
+
+        job.completed = True
+        db.session.commit()
+        return job.to_dict()